@@ -1,23 +1,36 @@
+import logging
 from contextlib import contextmanager
 
 from flask import Flask, render_template
-from flask_login import LoginManager
-from sqlalchemy import create_engine
+from flask_login import LoginManager, current_user
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, scoped_session
 
 from app.config import Config
 from app.database.models import User, Course, Pricing
 
-# Global engine and session
+# Global engines and sessions
 engine = None
 SessionLocal = None
+# The read replica (None without REPLICA_DATABASE_URL) and the read-only sessions, bound to it or the primary
+replica_engine = None
+ReadSessionLocal = None
 login_manager = None
 
+logger = logging.getLogger(__name__)
+
 
 def get_engine():
     return engine
 
 
+def get_read_engine():
+    """
+    Engine for read-only admin and report queries: the replica when one is configured, else the primary
+    """
+    return replica_engine if replica_engine is not None else engine
+
+
 @contextmanager
 def get_session():
     session = SessionLocal()
@@ -27,14 +40,66 @@ def get_session():
         session.close()
 
 
+@contextmanager
+def get_read_session():
+    """
+    Session for read-only admin and report queries, on the replica when one is configured.
+    It may lag behind the primary, and flushing any change through it raises.
+    """
+    session = ReadSessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _create_engine(url, echo=False):
+    new_engine = create_engine(url, echo=echo)
+    # SQLite only enforces foreign keys (and their ON DELETE actions) when asked to
+    if new_engine.dialect.name == 'sqlite':
+        @event.listens_for(new_engine, 'connect')
+        def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA foreign_keys=ON')
+            cursor.close()
+    return new_engine
+
+
+def _refuse_writes(session, flush_context, instances):
+    raise RuntimeError('Read sessions are read-only; write through get_session()')
+
+
+def current_user_key():
+    # Cache key part for pages that greet the signed-in user
+    if not current_user.is_authenticated:
+        return ('anonymous',)
+    return (current_user.id, current_user.name, current_user.role_code)
+
+
 def create_app():
-    global engine, SessionLocal, login_manager
+    global engine, SessionLocal, replica_engine, ReadSessionLocal, login_manager
 
     app = Flask(__name__, static_url_path='', static_folder='web/static', template_folder='web/templates')
 
     # Load configuration
     app.config.from_object(Config)
 
+    # Structured logging through a background writer thread, with request ids
+    from app import log
+    log.init_app(app)
+
+    # Fingerprinted, precompressed static assets
+    from app import assets
+    assets.init_app(app)
+
+    # Prometheus metrics (request latency per endpoint, recognizer stages, DB pool)
+    from app import metrics
+    metrics.init_app(app)
+
+    # Opt-in request profiler (no hooks at all unless PROFILING_ENABLED)
+    from app import profiling
+    profiling.init_app(app)
+
     # Initialize Flask-Login
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
@@ -42,13 +107,17 @@ def create_app():
     login_manager.login_message_category = 'info'
     login_manager.init_app(app)
 
-    # Initialize SQLAlchemy engine
-    engine = create_engine(
-        Config.DATABASE_URL,
-        echo=app.config.get('SQLALCHEMY_ECHO', False)
-    )
+    # Initialize SQLAlchemy engines: the primary, and the read replica if one is configured
+    engine = _create_engine(Config.DATABASE_URL, echo=app.config.get('SQLALCHEMY_ECHO', False))
+    replica_engine = None
+    if Config.REPLICA_DATABASE_URL:
+        replica_engine = _create_engine(Config.REPLICA_DATABASE_URL, echo=app.config.get('SQLALCHEMY_ECHO', False))
+
     # Use scoped_session for thread-safe sessions
     SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    read_sessions = sessionmaker(autocommit=False, autoflush=False, bind=get_read_engine())
+    event.listen(read_sessions, 'before_flush', _refuse_writes)
+    ReadSessionLocal = scoped_session(read_sessions)
 
     @login_manager.user_loader
     def load_user(user_id):
@@ -65,29 +134,35 @@ def create_app():
             session.close()
             return None
         except (ValueError, TypeError, Exception) as e:
-            print(f"Error loading user: {e}")
+            logger.warning("Error loading user %s: %s", user_id, e)
             return None
 
     # Teardown to remove session after each request
     @app.teardown_appcontext
     def shutdown_session(exception=None):
         SessionLocal.remove()
+        ReadSessionLocal.remove()
 
     # Register blueprints
     from app.routes.auth import auth as auth_blueprint
     from app.routes.customer import customer as customer_blueprint
     from app.routes.course import course as course_blueprint
     from app.routes.admin import admin as admin_blueprint
+    from app.routes.export import export as export_blueprint
     from app.routes.hiragana import hiragana_bp  # Import the hiragana blueprint
 
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
     app.register_blueprint(customer_blueprint, url_prefix='/dashboard')
     app.register_blueprint(course_blueprint, url_prefix='/course')  # Note: changed from /dashboard to /course
     app.register_blueprint(admin_blueprint, url_prefix='/admin')
+    app.register_blueprint(export_blueprint, url_prefix='/admin/export')
     app.register_blueprint(hiragana_bp)  # Register the hiragana blueprint
 
+    from app.cache import cached_page
+
     # Index page
     @app.route('/')
+    @cached_page(vary=current_user_key)
     def index():
         with get_session() as db:
             # Get prices for each course
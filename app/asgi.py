@@ -0,0 +1,306 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.http import parse_etags
+
+from app import metrics
+from app.audio import get_clip, sprite_path
+from app.config import Config
+from app.database.models import Character
+from app.executors import ExecutorBusy, inference_executor, io_executor
+from app.log import request_id_var
+from app.streaming import encode_event, live, read_stream_token
+
+logger = logging.getLogger(__name__)
+
+# Live streams: seconds between keep-alive comments, and the largest stroke delta accepted
+HEARTBEAT_SECONDS = 15
+MAX_DELTA_BYTES = 64 * 1024
+
+
+def _load_character_clip(character_id):
+    # Blocking part of the TTS route: DB lookup plus cached/synthesized clip
+    from app import get_session
+
+    with get_session() as db:
+        character = db.query(Character).filter_by(id=character_id).first()
+        if not character:
+            return None
+        return character.romaji, get_clip(character)
+
+
+def _read_file(path, body=True):
+    # The file's bytes (b'' when only its existence matters), or None when it is missing
+    try:
+        if not body:
+            path.stat()
+            return b''
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def send_response(send, status, body, content_type='text/plain; charset=utf-8', headers=None):
+    raw_headers = [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode(), value.encode()))
+
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def tts(scope, receive, send, course_name, character_id):
+    """
+    Async version of course.tts: the DB read and synthesis run on the I/O pool
+    """
+    try:
+        found = await io_executor.run_async(_load_character_clip, int(character_id))
+    except ExecutorBusy:
+        await send_response(send, 503, b'Audio service busy, please retry', headers={'Retry-After': '1'})
+        return
+    except Exception as e:
+        await send_response(send, 500, f'Error generating audio: {e}'.encode())
+        return
+
+    if found is None:
+        await send_response(send, 404, b'Character not found')
+        return
+
+    romaji, data = found
+    await send_response(send, 200, data, content_type='audio/mpeg', headers={
+        'Content-Disposition': f'inline; filename="{romaji}.mp3"',
+    })
+
+
+async def audio_sprite(scope, receive, send, course_name, version):
+    """
+    Async version of course.audio_sprite. Sprite names are content-addressed, so the version is the ETag.
+    """
+    not_modified = parse_etags(_header(scope, b'if-none-match')).contains_weak(version)
+    try:
+        data = await io_executor.run_async(_read_file, sprite_path(course_name, version), not not_modified)
+    except ExecutorBusy:
+        await send_response(send, 503, b'Audio service busy, please retry', headers={'Retry-After': '1'})
+        return
+    if data is None:
+        await send_response(send, 404, b'Audio sprite not found')
+        return
+
+    await send_response(send, 304 if not_modified else 200, data, content_type='audio/mpeg', headers={
+        'Cache-Control': 'public, max-age=31536000, immutable',
+        'ETag': f'"{version}"',
+    })
+
+
+async def send_json(send, status, data):
+    await send_response(send, status, json.dumps(data).encode(), content_type='application/json')
+
+
+async def read_body(receive, limit):
+    # The request body, or None once it grows past limit
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if len(body) > limit:
+            return None
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def _recognizer_available(course_name):
+    from app.model.registry import recognizers, RecognizerUnavailable
+
+    try:
+        recognizers.get(course_name)
+    except RecognizerUnavailable:
+        return False
+    return True
+
+
+async def live_stream(scope, receive, send, course_name):
+    """
+    Server-sent events of live recognition for one drawing: a `ready` event with the session id the
+    page posts its strokes to, then a `prediction` event with the top 3 whenever they change.
+    Each open stream is a coroutine and a small raster, so a worker holds many of them.
+    """
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token', [''])[0]
+    claims = read_stream_token(token)
+    if claims is None or claims['course'] != course_name.lower():
+        await send_json(send, 403, {'success': False, 'error': 'Invalid or expired stream token'})
+        return
+    try:
+        available = await io_executor.run_async(_recognizer_available, course_name)
+    except ExecutorBusy:
+        available = None
+    if not available:
+        status, error = (404, f'No recognizer available for {course_name}') if available is False else (503, 'Busy')
+        await send_json(send, status, {'success': False, 'error': error})
+        return
+
+    session = live.open(course_name, claims.get('target'))
+    if session is None:
+        await send_json(send, 503, {'success': False, 'error': 'Too many live streams, please retry'})
+        return
+
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            # Keep proxies from buffering the stream
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': encode_event('ready', {'session': session.id}),
+                    'more_body': True})
+        while True:
+            next_event = asyncio.ensure_future(session.events.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, timeout=HEARTBEAT_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_event not in done:
+                next_event.cancel()
+            if disconnected in done:
+                return
+            if next_event in done:
+                chunk = encode_event(*next_event.result())
+            elif time.monotonic() - session.last_activity > Config.LIVE_RECOGNITION_IDLE_SECONDS:
+                await send({'type': 'http.response.body', 'body': encode_event('closed', {'reason': 'idle'})})
+                return
+            else:
+                chunk = b': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        disconnected.cancel()
+        live.close(session)
+
+
+async def live_strokes(scope, receive, send, course_name, session_id):
+    """
+    Stroke delta of a live session (see LiveRecognition.apply), answered right away;
+    recognition follows on the session's event stream
+    """
+    session = live.sessions.get(session_id)
+    if session is None and not live.owns(session_id):
+        # The stream is held by another worker: the deployment needs one worker or sticky routing
+        logger.warning("Stroke delta for live session %s reached the wrong worker", session_id)
+        await send_json(send, 421, {'success': False, 'error': 'Live session belongs to another worker'})
+        return
+    if session is None or session.course != course_name.lower():
+        await send_json(send, 404, {'success': False, 'error': 'Unknown live session'})
+        return
+    body = await read_body(receive, MAX_DELTA_BYTES)
+    if body is None:
+        await send_json(send, 413, {'success': False, 'error': 'Stroke delta too large'})
+        return
+    try:
+        accepted = live.apply(session, json.loads(body))
+    except ValueError as e:
+        await send_json(send, 400, {'success': False, 'error': str(e)})
+        return
+    await send_json(send, 202, {'success': True, 'accepted': accepted})
+
+
+async def observed(handler, scope, receive, send, **params):
+    """
+    Run a natively served route with what the Flask hooks give every other one: a request id (from
+    X-Request-ID or new) in its log records and response, and the request count and latency metrics
+    under the route's Flask endpoint name. The request profiler does not cover these routes.
+    """
+    request_id = _header(scope, b'x-request-id') or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    status = 500
+
+    async def send_with_request_id(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            message = dict(message, headers=[*message.get('headers', []), (b'x-request-id', request_id.encode('latin-1'))])
+        await send(message)
+
+    start = time.perf_counter()
+    try:
+        await handler(scope, receive, send_with_request_id, **params)
+    finally:
+        request_id_var.reset(token)
+        metrics.observe_request('course', f'course.{handler.__name__}', scope['method'], status,
+                                time.perf_counter() - start)
+
+
+class AsgiApplication:
+    """
+    ASGI entry point for the Flask app.
+    I/O-bound routes listed in `routes` are served natively on the event loop; every other
+    request is handed to the unchanged WSGI app on a bounded thread pool.
+    """
+
+    routes = [
+        ('GET', re.compile(r'^/course/(?P<course_name>[^/]+)/tts/(?P<character_id>\d+)$'), tts),
+        ('GET', re.compile(r'^/course/(?P<course_name>[^/]+)/audio/(?P<version>[A-Za-z0-9]+)\.mp3$'), audio_sprite),
+        ('GET', re.compile(r'^/course/(?P<course_name>[^/]+)/live$'), live_stream),
+        ('POST', re.compile(r'^/course/(?P<course_name>[^/]+)/live/(?P<session_id>[A-Za-z0-9_-]+)$'), live_strokes),
+    ]
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        # The drawing page only offers live recognition when the stream routes below exist
+        flask_app.config['LIVE_RECOGNITION_SERVED'] = True
+        self.wsgi = WSGIMiddleware(flask_app, workers=Config.ASGI_WSGI_THREADS)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http':
+            for method, pattern, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match and scope['method'] == method:
+                    await observed(handler, scope, receive, send, **match.groupdict())
+                    return
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Each server process loads its own recognizer (TensorFlow does not survive a fork)
+                from app.model.registry import recognizers
+                await asyncio.get_running_loop().run_in_executor(None, recognizers.preload, ['Hiragana'])
+                if Config.LIVE_RECOGNITION_ENABLED and int(os.getenv('WEB_CONCURRENCY', '1')) > 1:
+                    logger.warning("Live recognition with several workers needs sticky routing "
+                                   "of /course/<course_name>/live requests")
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                inference_executor.shutdown(wait=False)
+                io_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(flask_app=None):
+    if flask_app is None:
+        from app import create_app
+        flask_app = create_app()
+    return AsgiApplication(flask_app)
@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+from pathlib import Path
+
+from flask import request, send_from_directory, url_for, abort
+
+from app.config import Config
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip siblings are always written
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = Path(__file__).resolve().parent / 'web' / 'static'
+
+# Only text formats benefit from precompression
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.html', '.txt', '.map'}
+
+# Precompressed variants in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Parsed manifest, invalidated by file mtime
+_manifest = {'mtime': None, 'files': {}}
+
+
+def build_dir():
+    return Path(Config.ASSET_BUILD_DIR).resolve()
+
+
+def manifest_path():
+    return build_dir() / 'manifest.json'
+
+
+def fingerprint(relative_path, data):
+    """
+    Insert a content hash into a file name: css/base.css -> css/base.1a2b3c4d5e.css
+    """
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    path = Path(relative_path)
+    return path.with_name(f'{path.stem}.{digest}{path.suffix}').as_posix()
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _is_current(path, data=None):
+    # A built file is reused when it exists (and, for the plain copy, still holds the source bytes)
+    if not path.is_file():
+        return False
+    return data is None or (path.stat().st_size == len(data) and path.read_bytes() == data)
+
+
+def build_assets():
+    """
+    Copy every static file into the build directory under a content-hashed name,
+    write gzip/brotli siblings for text assets and generate the manifest
+    """
+    logger.info("Building static assets...")
+    target = build_dir()
+    files = {}
+
+    for source in sorted(STATIC_DIR.rglob('*')):
+        if not source.is_file():
+            continue
+
+        relative = source.relative_to(STATIC_DIR).as_posix()
+        data = source.read_bytes()
+        hashed = fingerprint(relative, data)
+        output = target / hashed
+        files[relative] = hashed
+
+        # Every variant this build can make, so one missing from an earlier build (e.g. brotli
+        # installed since) is added. The content hash is in the name, so a present variant is current.
+        variants = {output: lambda: data}
+        if source.suffix.lower() in COMPRESSIBLE_EXTENSIONS:
+            # mtime=0 keeps the gzip output deterministic across builds
+            variants[output.with_name(output.name + '.gz')] = lambda: gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants[output.with_name(output.name + '.br')] = lambda: brotli.compress(data, quality=11)
+
+        missing = [path for path in variants if not _is_current(path, data if path == output else None)]
+        for path in missing:
+            _write(path, variants[path]())
+        if missing:
+            logger.info("Built %s -> %s (%s)", relative, hashed, ', '.join(path.name for path in missing))
+
+    _write(manifest_path(), json.dumps(files, indent=2, sort_keys=True).encode('utf-8'))
+
+    if brotli is None:
+        logger.warning("brotli is not installed - only gzip variants were written")
+    logger.info("Asset manifest written with %d files: %s", len(files), manifest_path())
+    return files
+
+
+def load_manifest():
+    path = manifest_path()
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return {}
+
+    if _manifest['mtime'] != mtime:
+        with open(path, 'r', encoding='utf-8') as f:
+            _manifest['files'] = json.load(f)
+        _manifest['mtime'] = mtime
+    return _manifest['files']
+
+
+def asset_url(filename):
+    """
+    Resolve a static file to its fingerprinted URL, falling back to the plain static route
+    """
+    hashed = load_manifest().get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('assets', filename=hashed)
+
+
+def serve_asset(filename):
+    """
+    Serve a fingerprinted asset, preferring the precompressed variant the client accepts
+    """
+    directory = build_dir()
+    if not (directory / filename).is_file():
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    served, encoding = filename, None
+    for name, extension in ENCODINGS:
+        if name in request.accept_encodings and (directory / (filename + extension)).is_file():
+            served, encoding = filename + extension, name
+            break
+
+    response = send_from_directory(directory, served, mimetype=mimetype, max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
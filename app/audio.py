@@ -0,0 +1,253 @@
+import hashlib
+import json
+import logging
+import os
+from io import BytesIO
+from pathlib import Path
+
+from gtts import gTTS
+
+from app.config import Config
+from app.database.models import Character, Course
+
+logger = logging.getLogger(__name__)
+
+# MPEG audio header lookup tables (Layer III only)
+_BITRATES = {
+    'mpeg1': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    'mpeg2': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG-1
+    2: [22050, 24000, 16000],  # MPEG-2
+    0: [11025, 12000, 8000],   # MPEG-2.5
+}
+
+# Parsed manifests keyed by course name, invalidated by file mtime
+_manifest_cache = {}
+
+
+def audio_dir():
+    return Path(Config.AUDIO_DIR).resolve()
+
+
+def _course_key(course_name):
+    return course_name.lower()
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def clip_path(character):
+    """
+    Location of the cached TTS clip for a character (keyed by its kana so edits re-synthesize)
+    """
+    digest = hashlib.sha1(character.kana.encode('utf-8')).hexdigest()[:10]
+    return audio_dir() / 'clips' / str(character.course_id) / f'{character.id}-{digest}.mp3'
+
+
+def synthesize(text):
+    """
+    Generate an MP3 clip for the given text using gTTS
+    """
+    tts = gTTS(text=text, lang='ja', slow=False)
+    audio_io = BytesIO()
+    tts.write_to_fp(audio_io)
+    return audio_io.getvalue()
+
+
+def get_clip(character):
+    """
+    Return the MP3 bytes for a character, synthesizing and caching them on first use
+    """
+    path = clip_path(character)
+    if path.exists():
+        return path.read_bytes()
+
+    data = synthesize(character.kana)
+    _write_atomic(path, data)
+    return data
+
+
+def _skip_id3(data):
+    # ID3v2 header: "ID3", version (2), flags (1), syncsafe size (4)
+    if len(data) >= 10 and data[:3] == b'ID3':
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        return 10 + size
+    return 0
+
+
+def mp3_frames(data):
+    """
+    Split an MP3 stream into its Layer III frames.
+    Yields (offset, length, samples, sample_rate) for every audio frame, skipping ID3 tags
+    and the Xing/Info metadata frame so clips can be concatenated safely.
+    """
+    offset = _skip_id3(data)
+    first = True
+
+    while offset + 4 <= len(data):
+        header = int.from_bytes(data[offset:offset + 4], 'big')
+        if (header >> 21) & 0x7FF != 0x7FF:
+            break
+
+        version_bits = (header >> 19) & 0x3
+        layer_bits = (header >> 17) & 0x3
+        bitrate_index = (header >> 12) & 0xF
+        sample_rate_index = (header >> 10) & 0x3
+        padding = (header >> 9) & 0x1
+
+        if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+            raise ValueError(f'Unsupported MP3 frame header at byte {offset}')
+
+        mpeg1 = version_bits == 3
+        bitrate = _BITRATES['mpeg1' if mpeg1 else 'mpeg2'][bitrate_index] * 1000
+        sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+        samples = 1152 if mpeg1 else 576
+        length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+
+        frame = data[offset:offset + length]
+        is_info_frame = first and (b'Xing' in frame[:64] or b'Info' in frame[:64])
+        if not is_info_frame:
+            yield offset, length, samples, sample_rate
+
+        first = False
+        offset += length
+
+
+def _strip_clip(data):
+    # Keep only audio frames and report the clip duration
+    frames = list(mp3_frames(data))
+    if not frames:
+        raise ValueError('Clip contains no MP3 frames')
+
+    sample_rate = frames[0][3]
+    if any(frame[3] != sample_rate for frame in frames):
+        raise ValueError('Clip mixes sample rates')
+
+    body = b''.join(data[offset:offset + length] for offset, length, _, _ in frames)
+    total_samples = sum(frame[2] for frame in frames)
+    return body, total_samples, sample_rate
+
+
+def manifest_path(course_name):
+    return audio_dir() / 'sprites' / f'{_course_key(course_name)}.json'
+
+
+def sprite_path(course_name, version):
+    return audio_dir() / 'sprites' / f'{_course_key(course_name)}-{version}.mp3'
+
+
+def load_manifest(course_name):
+    """
+    Load the sprite manifest for a course, or None if no sprite has been built
+    """
+    path = manifest_path(course_name)
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+    cached = _manifest_cache.get(course_name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except ValueError as e:
+        # Treated as missing, so the next build rewrites it
+        logger.warning("Ignoring unreadable audio sprite manifest %s: %s", path, e)
+        return None
+    _manifest_cache[course_name] = (mtime, manifest)
+    return manifest
+
+
+def build_course_sprite(db, course, force=False):
+    """
+    Concatenate every character clip of a course into one MP3 sprite with an offset manifest.
+    Only missing clips are synthesized, and the sprite is left untouched when the
+    character set has not changed since the last build.
+    """
+    characters = db.query(Character).filter_by(course_id=course.id).order_by(Character.id).all()
+    clip_keys = [clip_path(character).name for character in characters]
+
+    existing = load_manifest(course.name)
+    if existing and not force and existing.get('clips') == clip_keys and existing.get('version'):
+        if sprite_path(course.name, existing['version']).exists():
+            return existing, False
+
+    parts = []
+    segments = {}
+    position = 0
+    byte_offset = 0
+    sprite_rate = None
+
+    for character in characters:
+        body, samples, sample_rate = _strip_clip(get_clip(character))
+        if sprite_rate is None:
+            sprite_rate = sample_rate
+        elif sample_rate != sprite_rate:
+            raise ValueError(f'Clip for {character.kana} has sample rate {sample_rate}, expected {sprite_rate}')
+
+        segments[str(character.id)] = {
+            'kana': character.kana,
+            'start': position / sample_rate,
+            'duration': samples / sample_rate,
+            'byte_offset': byte_offset,
+            'byte_length': len(body),
+        }
+        parts.append(body)
+        position += samples
+        byte_offset += len(body)
+
+    sprite = b''.join(parts)
+    version = hashlib.sha256(sprite).hexdigest()[:12]
+
+    path = sprite_path(course.name, version)
+    if not path.exists():
+        _write_atomic(path, sprite)
+
+    manifest = {
+        'course': course.name,
+        'version': version,
+        'sample_rate': sprite_rate,
+        'duration': position / sprite_rate if sprite_rate else 0,
+        'clips': clip_keys,
+        'segments': segments,
+    }
+    _write_atomic(manifest_path(course.name), json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    # Drop sprites from previous versions, keeping the one clients may still hold
+    if existing and existing['version'] != version:
+        for old in path.parent.glob(f'{_course_key(course.name)}-*.mp3'):
+            if old.name not in (path.name, sprite_path(course.name, existing['version']).name):
+                old.unlink(missing_ok=True)
+
+    return manifest, True
+
+
+def build_all_sprites(force=False):
+    """
+    Build (or refresh) the audio sprite of every course
+    """
+    from app import get_session
+
+    with get_session() as db:
+        for course in db.query(Course).order_by(Course.id).all():
+            try:
+                manifest, rebuilt = build_course_sprite(db, course, force=force)
+            except Exception as e:
+                logger.warning("Could not build audio sprite for %s: %s", course.name, e)
+                continue
+
+            if rebuilt:
+                logger.info("Built audio sprite for %s: %d clips (version %s)",
+                            course.name, len(manifest['segments']), manifest['version'])
+            else:
+                logger.info("Audio sprite up to date for %s (version %s)", course.name, manifest['version'])
@@ -0,0 +1,161 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session, make_response, current_app
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import Config
+from app.database.models import CatalogVersion
+
+
+class PageCache:
+    """
+    Small thread-safe LRU cache of rendered pages
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+page_cache = PageCache(Config.PAGE_CACHE_SIZE)
+
+# The catalog version as last read from the database, re-read at most every CATALOG_CACHE_TTL seconds
+_catalog = {'version': None, 'expires_at': 0.0}
+_catalog_lock = threading.Lock()
+
+
+def _read_catalog_version():
+    from app import get_engine
+
+    with Session(get_engine()) as db:
+        return db.scalar(select(CatalogVersion.version).where(CatalogVersion.id == 1)) or 0
+
+
+def catalog_version():
+    """
+    The version of the catalog data, shared by every worker through the database
+    """
+    now = time.monotonic()
+    with _catalog_lock:
+        if now < _catalog['expires_at']:
+            return _catalog['version']
+    version = _read_catalog_version()
+    with _catalog_lock:
+        if version != _catalog['version']:
+            # Pages of older versions are never served again
+            page_cache.clear()
+        _catalog['version'] = version
+        _catalog['expires_at'] = now + Config.CATALOG_CACHE_TTL
+    return version
+
+
+def bump_catalog_version(db):
+    """
+    Advance the catalog version in the caller's transaction: call it with every write to courses,
+    prices or enrollments, so every worker renders its catalog pages anew
+    """
+    updated = db.query(CatalogVersion).filter_by(id=1).update({CatalogVersion.version: CatalogVersion.version + 1})
+    if not updated:
+        db.add(CatalogVersion(id=1, version=1))
+
+
+def invalidate_catalog():
+    """
+    Re-read the catalog version on the next page (call after committing bump_catalog_version),
+    so this worker shows the change right away
+    """
+    with _catalog_lock:
+        _catalog['expires_at'] = 0.0
+
+
+def enrolled_courses(user_id):
+    """
+    Ids of the courses the signed-in user is enrolled in, kept in the session per catalog version
+    so cached pages can vary on them without a query per request
+    """
+    version = catalog_version()
+    cached = session.get('enrolled_courses')
+    if cached is None or cached[0] != version:
+        from app import get_engine
+        from app.database.models import Enrollment
+
+        with Session(get_engine()) as db:
+            ids = sorted(db.scalars(select(Enrollment.course_id).where(Enrollment.user_id == user_id)).all())
+        cached = [version, ids]
+        session['enrolled_courses'] = cached
+    return cached[1]
+
+
+def forget_enrolled_courses():
+    # The next page reloads them (after a purchase by the signed-in user)
+    session.pop('enrolled_courses', None)
+
+
+def cached_page(vary=None):
+    """
+    Cache a GET view's rendered body per catalog version (plus whatever `vary` returns)
+    and answer conditional requests with a strong ETag
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pages carrying flashed messages are one-off renders
+            if request.method != 'GET' or '_flashes' in session or Config.CATALOG_CACHE_TTL <= 0:
+                return view(*args, **kwargs)
+
+            key = (request.endpoint, tuple(sorted(kwargs.items())), catalog_version())
+            if vary is not None:
+                key += tuple(vary())
+
+            entry = page_cache.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+
+                body = response.get_data()
+                entry = {
+                    'body': body,
+                    'etag': hashlib.sha256(body).hexdigest(),
+                    'mimetype': response.mimetype,
+                }
+                page_cache.set(key, entry)
+
+            if request.if_none_match.contains(entry['etag']):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+
+            response.set_etag(entry['etag'])
+            # Pages greet the signed-in user, so only the browser may keep a copy
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+    return decorator
@@ -8,6 +8,8 @@ load_dotenv()
 class Config:
     # Database
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.sqlite")
+    # Optional read replica for admin analytics and reports (empty = read from the primary)
+    REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL", "")
 
     # Secret Key
     SECRET_KEY = os.getenv("SECRET_KEY", "fallback-secret-key")
@@ -18,3 +20,113 @@ class Config:
     # Networking
     HOST = os.getenv("HOST", "0.0.0.0")
     PORT = os.getenv("PORT", "5000")
+
+    # Logging: root level, per-logger overrides ("app.routes.hiragana=DEBUG,werkzeug=WARNING"),
+    # output format ("json" or "text") and how many records may wait for the writer thread
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    # Catalog page cache (index and course list): seconds between checks of the catalog version in the
+    # database (0 disables the cache), and entries
+    CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "1"))
+    PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "1024"))
+
+    # Concurrency: bounded pools for recognizer calls and blocking I/O from async handlers
+    INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+    INFERENCE_QUEUE = int(os.getenv("INFERENCE_QUEUE", "16"))
+    IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+    IO_QUEUE = int(os.getenv("IO_QUEUE", "256"))
+
+    # Recognizer models: one artifact directory per course (<MODEL_DIR>/<course>/model.keras plus label files,
+    # or versioned under <course>/versions/<version>/ with <course>/CURRENT naming the active one),
+    # loaded on first use and evicted least recently used first beyond the memory budget
+    MODEL_DIR = os.getenv("MODEL_DIR", "./app/model")
+    MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "512"))
+    # Synthetic predictions run on a freshly loaded model before it serves, and how often (seconds) workers
+    # check the course directories for a newly activated model version (0 = never)
+    MODEL_WARMUP_ROUNDS = int(os.getenv("MODEL_WARMUP_ROUNDS", "3"))
+    MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "10"))
+
+    # Recognizer cascade: canvases with less ink than this share are rejected as blank (0 = off), and a
+    # course's fast first stage (cascade.npz) answers when at least this confident (above 1 = off)
+    CASCADE_MIN_INK = float(os.getenv("CASCADE_MIN_INK", "0.001"))
+    CASCADE_CONFIDENCE = float(os.getenv("CASCADE_CONFIDENCE", "0.98"))
+
+    # Drawing capture: off by default; when on, recognized drawings are appended to memory-mapped
+    # segment files under DRAWING_STORE_DIR/<course>/ by a background writer, for retraining and evaluation
+    DRAWING_CAPTURE_ENABLED = os.getenv("DRAWING_CAPTURE_ENABLED", "False") == "True"
+    DRAWING_STORE_DIR = os.getenv("DRAWING_STORE_DIR", "./drawings")
+    DRAWING_SEGMENT_RECORDS = int(os.getenv("DRAWING_SEGMENT_RECORDS", "65536"))
+    DRAWING_CAPTURE_QUEUE = int(os.getenv("DRAWING_CAPTURE_QUEUE", "1024"))
+
+    # TensorFlow and OpenCV thread pools per process (0 = library default, one thread per core)
+    TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS", "0"))
+    TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", "0"))
+    OPENCV_THREADS = int(os.getenv("OPENCV_THREADS", "0"))
+    # Recognizer predictions running at once per process, warm-ups of new models included (0 = no limit)
+    INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", os.getenv("INFERENCE_WORKERS", "2")))
+
+    # Password hashing: werkzeug method string (algorithm and cost), pool size and queue cap
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+    # ASGI serving mode: threads running the WSGI routes
+    ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+
+    # Live recognition while drawing (ASGI mode): open streams per process, debounce and maximum delay
+    # of an update, minimum raster change (mean pixel difference) worth a model call, micro-batch window
+    # and size, seconds without strokes before a stream is closed, and points per drawing
+    LIVE_RECOGNITION_ENABLED = os.getenv("LIVE_RECOGNITION_ENABLED", "True") == "True"
+    LIVE_RECOGNITION_MAX_STREAMS = int(os.getenv("LIVE_RECOGNITION_MAX_STREAMS", "1000"))
+    LIVE_RECOGNITION_DEBOUNCE_MS = int(os.getenv("LIVE_RECOGNITION_DEBOUNCE_MS", "150"))
+    LIVE_RECOGNITION_MAX_DELAY_MS = int(os.getenv("LIVE_RECOGNITION_MAX_DELAY_MS", "600"))
+    LIVE_RECOGNITION_MIN_CHANGE = float(os.getenv("LIVE_RECOGNITION_MIN_CHANGE", "0.005"))
+    LIVE_RECOGNITION_BATCH_WINDOW_MS = int(os.getenv("LIVE_RECOGNITION_BATCH_WINDOW_MS", "10"))
+    LIVE_RECOGNITION_BATCH_SIZE = int(os.getenv("LIVE_RECOGNITION_BATCH_SIZE", "64"))
+    LIVE_RECOGNITION_IDLE_SECONDS = int(os.getenv("LIVE_RECOGNITION_IDLE_SECONDS", "300"))
+    LIVE_RECOGNITION_MAX_POINTS = int(os.getenv("LIVE_RECOGNITION_MAX_POINTS", "5000"))
+
+    # Bulk admin operations: maximum users changed per request
+    BULK_MAX_BATCH = int(os.getenv("BULK_MAX_BATCH", "500"))
+
+    # Admin exports: rows fetched (and flushed to the client) per batch
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+    # Metrics endpoint (/metrics): off by default, and only served with a METRICS_TOKEN,
+    # which scrapers send as "Authorization: Bearer <token>"
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False") == "True"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+    # Directory where each worker process writes its counters and histograms every METRICS_WRITE_INTERVAL
+    # seconds, so a scrape answered by any worker reports the sum over all of them (empty = this process only)
+    METRICS_DIR = os.getenv("METRICS_DIR", "")
+    METRICS_WRITE_INTERVAL = float(os.getenv("METRICS_WRITE_INTERVAL", "5"))
+
+    # Request profiling: off by default; when on, profiles a random share of requests plus any request
+    # sent with "X-Profile: <PROFILE_TOKEN>" (or any X-Profile header from a signed-in admin)
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False") == "True"
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+    # "stack" (sampled collapsed stacks for flame graphs) or "cprofile" (pstats)
+    PROFILE_MODE = os.getenv("PROFILE_MODE", "stack")
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+    PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+    # Audio (cached TTS clips and per-course sprites)
+    AUDIO_DIR = os.getenv("AUDIO_DIR", "./audio")
+
+    # Browser-side recognition: weight bundles exported with "python -m app.model.web_bundle"
+    # (<WEB_MODEL_DIR>/<course>.json plus <course>-<version>.bin) let the drawing page recognize locally.
+    # A result the page claims correct is re-checked by the server model for this share of submissions
+    # (1.0 = every one) before progress is recorded; claims from an outdated bundle, or from a learner with a
+    # rejected claim, are always re-checked. Below 1.0 a forged claim is recorded whenever it goes unchecked.
+    BROWSER_RECOGNITION_ENABLED = os.getenv("BROWSER_RECOGNITION_ENABLED", "True") == "True"
+    WEB_MODEL_DIR = os.getenv("WEB_MODEL_DIR", "./web_models")
+    CLIENT_VERIFY_SAMPLE_RATE = float(os.getenv("CLIENT_VERIFY_SAMPLE_RATE", "1.0"))
+
+    # Static asset build (fingerprinted + precompressed copies of web/static)
+    ASSET_BUILD_DIR = os.getenv("ASSET_BUILD_DIR", "./app/web/build")
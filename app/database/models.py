@@ -1,9 +1,9 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, ForeignKey
 from sqlalchemy.orm import DeclarativeBase, relationship, Session
 from datetime import datetime
 from flask_login import UserMixin
 
-from werkzeug.security import generate_password_hash, check_password_hash
+from app import security
 
 class Base(DeclarativeBase):
     pass
@@ -36,10 +36,10 @@ class User(UserMixin, Base):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = security.hash_password(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return security.verify_password(self.password_hash, password)
 
     # Foreign key to Role
     role_code = Column(String(10), ForeignKey("roles.code", ondelete="SET NULL"), nullable=True)
@@ -50,8 +50,9 @@ class User(UserMixin, Base):
 
     # Relationships
     role = relationship("Role", back_populates="users")
-    transactions = relationship("Transaction", back_populates="user")
-    progress = relationship("Progress", back_populates="user")
+    # Dependent rows are removed by the database (ON DELETE CASCADE) rather than loaded first
+    transactions = relationship("Transaction", back_populates="user", passive_deletes=True)
+    progress = relationship("Progress", back_populates="user", passive_deletes=True)
 
     # Flask-Login integration
     def get_id(self):
@@ -126,7 +127,7 @@ class Transaction(Base):
     card_number = Column(String(255), nullable=False)
     price = Column(Integer, nullable=False)
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     deleted_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -164,3 +165,50 @@ class Progress(Base):
     user = relationship("User", back_populates="progress")
     course = relationship("Course")
     character = relationship("Character")
+
+
+class ClaimRejection(Base):
+    __tablename__ = 'client_claim_rejections'
+
+    # Learners whose browser-side answer the server model once contradicted: their claims are always re-checked
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    rejected_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<ClaimRejection %r>' % self.user_id
+
+
+class CatalogVersion(Base):
+    __tablename__ = 'catalog_version'
+
+    # A single row, advanced with every change to courses, prices or enrollments shown in the catalog
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return '<CatalogVersion %r>' % self.version
+
+
+class CourseDailyRollup(Base):
+    __tablename__ = 'course_daily_rollups'
+
+    day = Column(Date, primary_key=True)
+    course_id = Column(Integer, ForeignKey("courses.id", ondelete="CASCADE"), primary_key=True)
+    revenue = Column(Integer, default=0, nullable=False)
+    enrollments = Column(Integer, default=0, nullable=False)
+
+    # Relationships
+    course = relationship("Course")
+
+    def __repr__(self):
+        return '<CourseDailyRollup %r %r>' % (self.day, self.course_id)
+
+
+class UserDailyRollup(Base):
+    __tablename__ = 'user_daily_rollups'
+
+    day = Column(Date, primary_key=True)
+    new_users = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return '<UserDailyRollup %r>' % self.day
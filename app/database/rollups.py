@@ -0,0 +1,123 @@
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.database.models import CourseDailyRollup, UserDailyRollup, Transaction, User
+
+logger = logging.getLogger(__name__)
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def _today():
+    # Same clock as the created_at defaults of the source rows
+    return datetime.utcnow().date()
+
+
+def _increment(db: Session, model, keys, increments):
+    # Add to a rollup row, creating it if needed, inside the caller's transaction
+    insert = _UPSERT_DIALECTS.get(db.get_bind().dialect.name)
+
+    if insert is not None:
+        stmt = insert(model).values(**keys, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: getattr(model, column) + stmt.excluded[column] for column in increments}
+        )
+        db.execute(stmt)
+        return
+
+    updated = db.query(model).filter_by(**keys).update(
+        {getattr(model, column): getattr(model, column) + value for column, value in increments.items()},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(model(**keys, **increments))
+
+
+def record_purchase(db: Session, course_id, price, day=None):
+    """
+    Count a purchase (revenue + one enrollment) in the course's rollup for the day. Rollup enrollments
+    count purchases: revoking an enrollment keeps them, deleting the purchase's user removes them.
+    """
+    _increment(db, CourseDailyRollup, {'day': day or _today(), 'course_id': course_id},
+               {'revenue': price, 'enrollments': 1})
+
+
+def record_signups(db: Session, count=1, day=None):
+    """
+    Count new users for the day
+    """
+    _increment(db, UserDailyRollup, {'day': day or _today()}, {'new_users': count})
+
+
+def _as_date(value):
+    # SQLite returns DATE() results as strings
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def record_user_deletions(db: Session, user_ids):
+    """
+    Take users about to be deleted, and the purchases deleted with them, out of the rollups of the days
+    they happened on, as a backfill would count them. Call it before deleting them, in the same transaction.
+    """
+    signup_days = db.query(func.date(User.created_at), func.count(User.id)).filter(
+        User.id.in_(user_ids)).group_by(func.date(User.created_at)).all()
+    for day, count in signup_days:
+        if day is not None:
+            record_signups(db, -count, day=_as_date(day))
+
+    purchase_days = db.query(
+        func.date(Transaction.created_at), Transaction.course_id, func.sum(Transaction.price), func.count(Transaction.id)
+    ).filter(Transaction.user_id.in_(user_ids)).group_by(func.date(Transaction.created_at), Transaction.course_id).all()
+    for day, course_id, revenue, count in purchase_days:
+        if day is not None:
+            _increment(db, CourseDailyRollup, {'day': _as_date(day), 'course_id': course_id},
+                       {'revenue': -int(revenue or 0), 'enrollments': -count})
+
+
+def backfill_rollups(db: Session):
+    """
+    Rebuild every rollup row from the source tables. Enrollments are counted from the purchase
+    transactions, not the live enrollment rows, so revoked enrollments still count (see record_purchase).
+    """
+    db.query(CourseDailyRollup).delete()
+    db.query(UserDailyRollup).delete()
+
+    course_days = {}
+
+    purchase_rows = db.query(
+        func.date(Transaction.created_at), Transaction.course_id, func.sum(Transaction.price), func.count(Transaction.id)
+    ).group_by(func.date(Transaction.created_at), Transaction.course_id).all()
+    for day, course_id, revenue, count in purchase_rows:
+        if day is None:
+            continue
+        course_days[(_as_date(day), course_id)] = {'revenue': int(revenue or 0), 'enrollments': count}
+
+    for (day, course_id), values in course_days.items():
+        db.add(CourseDailyRollup(day=day, course_id=course_id, **values))
+
+    user_rows = db.query(func.date(User.created_at), func.count(User.id)).group_by(func.date(User.created_at)).all()
+    for day, count in user_rows:
+        if day is not None:
+            db.add(UserDailyRollup(day=_as_date(day), new_users=count))
+
+    db.commit()
+    return len(course_days), len(user_rows)
+
+
+def run_backfill():
+    from app import get_session
+
+    logger.info("Backfilling dashboard rollups...")
+    with get_session() as db:
+        course_rows, user_rows = backfill_rollups(db)
+    logger.info("Wrote %d course/day rows and %d signup/day rows", course_rows, user_rows)
@@ -1,23 +1,24 @@
 import csv
+import logging
 from pathlib import Path
 from sqlalchemy.orm import Session
 
 from app import get_session
 from app.database.models import Base, Role, User, Course, Character, Pricing
 
+logger = logging.getLogger(__name__)
+
 
 def initialize_database():
     # Create all tables if they don't exist
-    print("[INFO] Initializing database...")
+    logger.info("Initializing database...")
     try:
         from app import engine
         Base.metadata.create_all(bind=engine)
-        print("Database tables created/verified")
+        logger.info("Database tables created/verified")
         return True
     except Exception as e:
-        print(f"Failed to initialize database: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Failed to initialize database")
         return False
 
 
@@ -28,8 +29,8 @@ def load_characters_from_csv(csv_path='kana.csv'):
     base_dir = Path(__file__).resolve().parent  # app/database/
     full_csv_path = base_dir / csv_path
 
-    print(f"[DEBUG] Looking for CSV at: {full_csv_path}")
-    print(f"[DEBUG] File exists: {full_csv_path.exists()}")
+    logger.debug(f"Looking for CSV at: {full_csv_path}")
+    logger.debug(f"File exists: {full_csv_path.exists()}")
 
     characters_by_course = {
         'Hiragana': [],
@@ -38,8 +39,8 @@ def load_characters_from_csv(csv_path='kana.csv'):
     }
 
     if not full_csv_path.exists():
-        print(f"[ERROR] CSV file not found at: {full_csv_path}")
-        print(f"[INFO] Please ensure kana.csv is located in: {base_dir}")
+        logger.error(f"CSV file not found at: {full_csv_path}")
+        logger.info(f"Please ensure kana.csv is located in: {base_dir}")
         return characters_by_course
 
     try:
@@ -47,7 +48,7 @@ def load_characters_from_csv(csv_path='kana.csv'):
             csv_reader = csv.DictReader(file)
             headers = csv_reader.fieldnames
 
-            print(f"[DEBUG] CSV Headers: {headers}")
+            logger.debug(f"CSV Headers: {headers}")
 
             # Auto-detect column names (flexible for different CSV formats)
             type_col = next((h for h in headers if 'type' in h.lower() or 'category' in h.lower()), None)
@@ -55,20 +56,20 @@ def load_characters_from_csv(csv_path='kana.csv'):
             romaji_col = next((h for h in headers if 'romaji' in h.lower() or 'roman' in h.lower()), None)
 
             if not all([type_col, kana_col, romaji_col]):
-                print(f"[ERROR] Could not detect required columns")
-                print(f"[ERROR] Found: type={type_col}, kana={kana_col}, romaji={romaji_col}")
-                print(f"[INFO] CSV should have columns like: 'type', 'kana', 'romaji'")
+                logger.error("Could not detect required columns")
+                logger.error(f"Found: type={type_col}, kana={kana_col}, romaji={romaji_col}")
+                logger.info("CSV should have columns like: 'type', 'kana', 'romaji'")
 
                 # Show first row as example
                 file.seek(0)
                 reader = csv.DictReader(file)
                 first_row = next(reader, None)
                 if first_row:
-                    print(f"[DEBUG] First row: {first_row}")
+                    logger.debug(f"First row: {first_row}")
 
                 return characters_by_course
 
-            print(f"[DEBUG] Using columns: {type_col} -> {kana_col} -> {romaji_col}")
+            logger.debug(f"Using columns: {type_col} -> {kana_col} -> {romaji_col}")
 
             row_count = 0
             for row in csv_reader:
@@ -99,40 +100,33 @@ def load_characters_from_csv(csv_path='kana.csv'):
                     elif 'kanji' in course_type.lower():
                         characters_by_course['Kanji'].append({'kana': kana, 'romaji': romaji})
                     else:
-                        print(f"[WARNING] Row {row_count}: Unknown course type '{course_type}'")
+                        logger.warning(f"Row {row_count}: Unknown course type '{course_type}'")
 
-            print(f"[INFO] Processed {row_count} rows from CSV")
+            logger.info(f"Processed {row_count} rows from CSV")
 
         # Print summary
         total = 0
         for course, chars in characters_by_course.items():
             count = len(chars)
             total += count
-            print(f"[DEBUG] {course}: {count} characters")
+            logger.debug(f"{course}: {count} characters")
             if chars:
                 # Show first 2 characters as example
-                for char in chars[:2]:
-                    print(f"  - {char['kana']} ({char['romaji']})")
+                logger.debug("e.g. %s", ', '.join(f"{char['kana']} ({char['romaji']})" for char in chars[:2]))
 
         if total == 0:
-            print(f"\n[WARNING] No characters were loaded!")
-            print(f"[INFO] Please check your CSV format. Example format:")
-            print(f"type,kana,romaji")
-            print(f"Hiragana,あ,a")
-            print(f"Hiragana,い,i")
-            print(f"Katakana,ア,a")
+            logger.warning("No characters were loaded! Please check your CSV format, e.g. a 'type,kana,romaji' "
+                           "header followed by rows like 'Hiragana,あ,a'")
 
     except Exception as e:
-        print(f"[ERROR] Failed to read CSV: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Failed to read CSV")
 
     return characters_by_course
 
 
 def seed_roles(db: Session):
     # Seed roles table
-    print("[INFO] Seeding roles...")
+    logger.info("Seeding roles...")
 
     roles_data = [
         {'code': 'ADMIN', 'name': 'Administrator'},
@@ -145,16 +139,16 @@ def seed_roles(db: Session):
         if not existing:
             role = Role(**role_data)
             db.add(role)
-            print(f"  ✓ Created role: {role_data['name']}")
+            logger.info(f"Created role: {role_data['name']}")
         else:
-            print(f"  - Role already exists: {role_data['name']}")
+            logger.info(f"Role already exists: {role_data['name']}")
 
     db.commit()
 
 
 def seed_courses_and_characters(db: Session):
     # Seed courses and their characters from CSV
-    print("[INFO] Seeding courses and characters...")
+    logger.info("Seeding courses and characters...")
 
     # Load characters from CSV
     characters_by_course = load_characters_from_csv('kana.csv')
@@ -176,16 +170,16 @@ def seed_courses_and_characters(db: Session):
             course = Course(name=course_name)
             db.add(course)
             db.flush()  # Get the ID without committing
-            print(f"  ✓ Created course: {course_name}")
+            logger.info(f"Created course: {course_name}")
         else:
-            print(f"  - Course already exists: {course_name}")
+            logger.info(f"Course already exists: {course_name}")
 
         # Add pricing
         pricing = db.query(Pricing).filter_by(course_id=course.id).first()
         if not pricing:
             pricing = Pricing(course_id=course.id, price=course_data['price'])
             db.add(pricing)
-            print(f"    ✓ Added pricing: ${course_data['price']}")
+            logger.info(f"Added pricing for {course_name}: ${course_data['price']}")
 
         # Add characters for this course
         characters = characters_by_course.get(course_name, [])
@@ -208,26 +202,45 @@ def seed_courses_and_characters(db: Session):
                 char_count += 1
 
         if char_count > 0:
-            print(f"    ✓ Added {char_count} characters")
+            logger.info(f"Added {char_count} {course_name} characters")
         else:
             existing_count = db.query(Character).filter_by(course_id=course.id).count()
-            print(f"    - Characters already exist: {existing_count}")
+            logger.info(f"{course_name} characters already exist: {existing_count}")
 
         total_chars += char_count
 
+    from app.cache import bump_catalog_version
+    bump_catalog_version(db)
     db.commit()
 
-    print(f"[INFO] Characters seeded successfully ({total_chars} new characters)")
+    logger.info(f"Characters seeded successfully ({total_chars} new characters)")
     for course_name in ['Hiragana', 'Katakana', 'Kanji']:
         course = db.query(Course).filter_by(name=course_name).first()
         if course:
             count = db.query(Character).filter_by(course_id=course.id).count()
-            print(f"  - {course_name}: {count} characters")
+            logger.info(f"{course_name}: {count} characters")
+
+    seed_audio_sprites(db, db.query(Course).order_by(Course.id).all())
+
+
+def seed_audio_sprites(db: Session, courses):
+    # Build every course's sprite that is missing or out of date, so a failed build is retried
+    # on the next seed. Up-to-date sprites are left alone and existing clips are reused.
+    logger.info("Building audio sprites...")
+    from app.audio import build_course_sprite
+
+    for course in courses:
+        try:
+            manifest, rebuilt = build_course_sprite(db, course)
+            if rebuilt:
+                logger.info(f"Audio sprite for {course.name}: {len(manifest['segments'])} clips (version {manifest['version']})")
+        except Exception as e:
+            logger.warning(f"Could not build audio sprite for {course.name}: {e}")
 
 
 def seed_admin_user(db: Session):
     # Seed an admin user for testing
-    print("[INFO] Seeding admin user...")
+    logger.info("Seeding admin user...")
 
     admin = db.query(User).filter_by(username='admin').first()
     if not admin:
@@ -240,14 +253,14 @@ def seed_admin_user(db: Session):
         )
         db.add(admin)
         db.commit()
-        print("  ✓ Created admin user (username: admin, password: admin123)")
+        logger.info("Created admin user (username: admin, password: admin123)")
     else:
-        print("  - Admin user already exists")
+        logger.info("Admin user already exists")
 
 
 def seed_demo_user(db: Session):
     # Seed a demo user for testing and enroll in Hiragana course
-    print("[INFO] Seeding demo user...")
+    logger.info("Seeding demo user...")
 
     demo_user = db.query(User).filter_by(username='johndoe').first()
     if not demo_user:
@@ -260,9 +273,9 @@ def seed_demo_user(db: Session):
         )
         db.add(demo_user)
         db.flush()  # Get the user ID
-        print("  ✓ Created demo user (username: johndoe, password: password)")
+        logger.info("Created demo user (username: johndoe, password: password)")
     else:
-        print("  - Demo user already exists")
+        logger.info("Demo user already exists")
 
     # Enroll in Hiragana course
     hiragana_course = db.query(Course).filter_by(name='Hiragana').first()
@@ -294,23 +307,20 @@ def seed_demo_user(db: Session):
             )
             db.add(enrollment)
             db.commit()
-            print(f"  ✓ Enrolled demo user in Hiragana course")
+            logger.info("Enrolled demo user in Hiragana course")
         else:
-            print(f"  - Demo user already enrolled in Hiragana course")
+            logger.info("Demo user already enrolled in Hiragana course")
     else:
-        print(f"  ⚠️  Hiragana course not found - skipping enrollment")
+        logger.warning("Hiragana course not found - skipping enrollment")
 
 
 def seed_database():
     # Main seeding function
-    print("\n" + "=" * 60)
-    print("DATABASE SEEDING")
-    print("=" * 60 + "\n")
+    logger.info("Database seeding started")
 
     # Initialize database first
     if not initialize_database():
-        print("\nDATABASE INITIALIZATION FAILED")
-        print("Cannot proceed with seeding.")
+        logger.error("Database initialization failed, cannot proceed with seeding")
         return
 
     try:
@@ -321,68 +331,69 @@ def seed_database():
             seed_admin_user(db)
             seed_demo_user(db)
 
-            print("\n" + "=" * 60)
-            print("DATABASE SEEDING COMPLETED SUCCESSFULLY")
-            print("=" * 60 + "\n")
+            # Seeded users and purchases bypass the routes that maintain the dashboard rollups
+            from app.database.rollups import backfill_rollups
+            backfill_rollups(db)
+
+            logger.info("Database seeding completed successfully")
 
     except Exception as e:
-        print(f"\nERROR during seeding: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error during seeding")
 
 
 def clear_database():
     # Clear all data from database (use with caution!)
-    print("\n" + "=" * 60)
-    print("DATABASE CLEARING")
-    print("=" * 60 + "\n")
+    logger.info("Database clearing started")
 
     confirmation = input("Are you sure you want to clear the database? Type 'YES' to confirm: ")
 
     if confirmation != 'YES':
-        print("Aborted.")
+        logger.info("Aborted.")
         return
 
     try:
         with get_session() as db:
             # Delete in reverse order of foreign key dependencies
-            print("[INFO] Clearing Progress...")
+            logger.info("Clearing Rollups...")
+            from app.database.models import CourseDailyRollup, UserDailyRollup
+            db.query(CourseDailyRollup).delete()
+            db.query(UserDailyRollup).delete()
+
+            logger.info("Clearing Progress...")
             from app.database.models import Progress
             db.query(Progress).delete()
 
-            print("[INFO] Clearing Enrollments...")
+            logger.info("Clearing Enrollments...")
             from app.database.models import Enrollment
             db.query(Enrollment).delete()
 
-            print("[INFO] Clearing Transactions...")
+            logger.info("Clearing Transactions...")
             from app.database.models import Transaction
             db.query(Transaction).delete()
 
-            print("[INFO] Clearing Characters...")
+            logger.info("Clearing Characters...")
             db.query(Character).delete()
 
-            print("[INFO] Clearing Pricing...")
+            logger.info("Clearing Pricing...")
             db.query(Pricing).delete()
 
-            print("[INFO] Clearing Courses...")
+            logger.info("Clearing Courses...")
             db.query(Course).delete()
 
-            print("[INFO] Clearing Users...")
+            logger.info("Clearing Users...")
             db.query(User).delete()
 
-            print("[INFO] Clearing Roles...")
+            logger.info("Clearing Roles...")
             db.query(Role).delete()
 
+            from app.cache import bump_catalog_version
+            bump_catalog_version(db)
             db.commit()
 
-            print("\n" + "=" * 60)
-            print("DATABASE CLEARED SUCCESSFULLY")
-            print("=" * 60 + "\n")
+            logger.info("Database cleared successfully")
 
     except Exception as e:
-        print(f"\nERROR during clearing: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error during clearing")
 
 
 if __name__ == '__main__':
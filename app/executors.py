@@ -0,0 +1,61 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import Config
+
+
+class ExecutorBusy(Exception):
+    """
+    Raised when a bounded executor already has its maximum of running and queued tasks
+    """
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a cap on running + queued tasks.
+    Submissions beyond the cap are rejected instead of piling up, so bursts degrade
+    into fast errors rather than unbounded latency.
+    """
+
+    def __init__(self, name, max_workers, max_pending=0):
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorBusy(f'{self.name} executor is at capacity')
+
+        try:
+            # Run in a copy of the caller's context so the request id follows the task into the pool
+            future = self._pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """
+        Run fn on the pool and block the calling thread until it finishes
+        """
+        return self.submit(fn, *args, **kwargs).result(timeout=timeout)
+
+    async def run_async(self, fn, *args, **kwargs):
+        """
+        Run fn on the pool without blocking the event loop
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+# CPU-bound recognizer calls
+inference_executor = BoundedExecutor('inference', Config.INFERENCE_WORKERS, Config.INFERENCE_QUEUE)
+
+# Blocking I/O (database reads, TTS synthesis, disk) issued from async handlers
+io_executor = BoundedExecutor('io', Config.IO_WORKERS, Config.IO_QUEUE)
@@ -0,0 +1,280 @@
+import argparse
+import http.cookiejar
+import json
+import math
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+from app.model.synthetic import synthetic_drawing
+
+STEPS = ('register', 'login', 'purchase', 'learn', 'learn_next', 'learn_previous', 'tts', 'predict')
+
+_CSRF = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+_TTS = re.compile(r'/tts/(\d+)')
+
+# Distinct drawings per run; more would only cost memory
+DRAWING_VARIANTS = 64
+
+
+class StepFailed(Exception):
+    pass
+
+
+class StepStats:
+    """
+    Latencies and error count of one journey step (shared by all virtual learners of a stage)
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self.latencies.append(seconds)
+            if not ok:
+                self.errors += 1
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            errors = self.errors
+        count = len(latencies)
+
+        def percentile(p):
+            # Nearest-rank percentile, in milliseconds
+            if not latencies:
+                return 0.0
+            return latencies[max(0, math.ceil(p / 100 * count) - 1)] * 1000
+
+        return {
+            'count': count,
+            'errors': errors,
+            'error_rate': errors / count if count else 0.0,
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'p99': percentile(99),
+        }
+
+
+class Learner:
+    """
+    One virtual learner: its own cookie jar, walking the journey against base_url
+    """
+
+    def __init__(self, base_url, course, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.course = course
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, path, data=None, json_body=None):
+        headers = {}
+        if json_body is not None:
+            data = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            data = urllib.parse.urlencode(data).encode('utf-8')
+
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        try:
+            # Redirects are followed, so a form post is timed up to the page it lands on
+            with self.opener.open(req, timeout=self.timeout) as response:
+                return response.status, response.geturl(), response.read()
+        except urllib.error.HTTPError as e:
+            raise StepFailed(f'HTTP {e.code} on {path}')
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            raise StepFailed(f'{type(e).__name__} on {path}: {e}')
+
+    def csrf_token(self, path):
+        _, _, body = self.request(path)
+        match = _CSRF.search(body.decode('utf-8', 'replace'))
+        if not match:
+            raise StepFailed(f'No CSRF token on {path}')
+        return match.group(1)
+
+    def register(self, username, password):
+        token = self.csrf_token('/auth/register')
+        _, url, _ = self.request('/auth/register', data={
+            'csrf_token': token, 'name': username, 'username': username,
+            'password': password, 'confirmation': password,
+        })
+        if not url.endswith('/auth/login'):
+            raise StepFailed('Registration was rejected')
+
+    def login(self, username, password):
+        token = self.csrf_token('/auth/login')
+        _, url, _ = self.request('/auth/login', data={'csrf_token': token, 'username': username, 'password': password})
+        if url.endswith('/auth/login'):
+            raise StepFailed('Login was rejected')
+
+    def purchase(self):
+        _, _, body = self.request('/dashboard/purchase', json_body={
+            'course_name': self.course, 'card_number': '4242424242424242',
+        })
+        if not json.loads(body).get('success'):
+            raise StepFailed('Purchase was rejected')
+
+    def learn(self, path='', data=None):
+        _, url, body = self.request(f'/course/{self.course}/learn{path}', data=data)
+        if not url.endswith(f'/course/{self.course}/learn'):
+            raise StepFailed('Learn page redirected away')
+        match = _TTS.search(body.decode('utf-8', 'replace'))
+        return int(match.group(1)) if match else None
+
+    def tts(self, character_id):
+        _, _, body = self.request(f'/course/{self.course}/tts/{character_id}')
+        if not body:
+            raise StepFailed('Empty audio')
+
+    def predict(self, drawing):
+        _, _, body = self.request(f'/course/{self.course}/predict', json_body={'image': drawing})
+        if not json.loads(body).get('success'):
+            raise StepFailed('Prediction failed')
+
+
+def run_journey(learner, stats, drawing, password='load-test-pw'):
+    """
+    Walk the full learner journey once. A failed step ends the journey, except audio and
+    prediction which nothing later depends on. Returns whether every step succeeded.
+    """
+    username = f'load_{uuid.uuid4().hex[:12]}'
+    failures = []
+
+    def step(name, fn, *args, required=True):
+        started = time.perf_counter()
+        try:
+            result = fn(*args)
+        except StepFailed as e:
+            stats[name].record(time.perf_counter() - started, False)
+            if required:
+                raise
+            failures.append(e)
+            return None
+        stats[name].record(time.perf_counter() - started, True)
+        return result
+
+    try:
+        step('register', learner.register, username, password)
+        step('login', learner.login, username, password)
+        step('purchase', learner.purchase)
+        character_id = step('learn', learner.learn)
+        step('learn_next', learner.learn, '/next', {})
+        character_id = step('learn_previous', learner.learn, '/previous', {}) or character_id
+        if character_id is None:
+            raise StepFailed('No character on the learn page')
+        step('tts', learner.tts, character_id, required=False)
+        step('predict', learner.predict, drawing, required=False)
+        return not failures
+    except StepFailed:
+        return False
+
+
+def run_stage(base_url, course, concurrency, duration, timeout, drawings):
+    """
+    Run `concurrency` virtual learners doing back-to-back journeys for `duration` seconds
+    """
+    stats = {name: StepStats() for name in STEPS}
+    deadline = time.monotonic() + duration
+    journeys = [0, 0]  # completed, failed
+    journeys_lock = threading.Lock()
+
+    def worker(index):
+        n = 0
+        while time.monotonic() < deadline:
+            learner = Learner(base_url, course, timeout)
+            ok = run_journey(learner, stats, drawings[(index + n * concurrency) % len(drawings)])
+            n += 1
+            with journeys_lock:
+                journeys[0 if ok else 1] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'elapsed': elapsed,
+        'journeys': journeys[0],
+        'failed_journeys': journeys[1],
+        'steps': {name: stat.summary() for name, stat in stats.items()},
+    }
+
+
+def format_stage(result):
+    lines = [
+        f"Concurrency {result['concurrency']}: {result['journeys']} journeys "
+        f"({result['journeys'] / result['elapsed']:.2f}/s), {result['failed_journeys']} failed",
+        f"  {'step':<16} {'count':>7} {'err %':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}",
+    ]
+    for name in STEPS:
+        step = result['steps'][name]
+        lines.append(f"  {name:<16} {step['count']:>7} {step['error_rate'] * 100:>7.2f} "
+                     f"{step['p50']:>9.1f} {step['p95']:>9.1f} {step['p99']:>9.1f}")
+    return '\n'.join(lines)
+
+
+def start_local_server():
+    """
+    Serve the app in this process on a free port (uses DATABASE_URL, which must be created and seeded)
+    """
+    import logging
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    # One access log line per request would drown the report
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the learner journey')
+    parser.add_argument('--base-url', help='Target a running server instead of starting one in-process')
+    parser.add_argument('--course', default='Hiragana', help='Course the learners buy and study')
+    parser.add_argument('--stages', default='1,2,4,8', help='Comma-separated concurrency levels to ramp through')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per stage')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic drawings')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_local_server()
+
+    drawings = [synthetic_drawing(args.seed + i) for i in range(DRAWING_VARIANTS)]
+
+    results = []
+    try:
+        for concurrency in (int(level) for level in args.stages.split(',')):
+            if not args.json:
+                print(f"[INFO] Running {concurrency} concurrent learners against {base_url} for {args.duration:g}s...")
+            result = run_stage(base_url, args.course, concurrency, args.duration, args.timeout, drawings)
+            results.append(result)
+            if not args.json:
+                print(format_stage(result))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    # Usage: python -m app.loadtest [--base-url http://localhost:5000] [--stages 1,4,16] [--duration 60]
+    main()
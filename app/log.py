@@ -0,0 +1,172 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, request
+
+from app.config import Config
+
+# Request id of the request being handled by the current thread (or task), "-" outside requests
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, request_id, message, extra fields and exception
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = '-'
+        return super().format(record)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread with as little work as possible in the calling thread:
+    the message is merged with its arguments (they may change later) and the request id is captured,
+    while formatting, traceback rendering and the actual write happen on the listener thread.
+    Records are dropped, and counted, if the queue is full rather than blocking the request.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.request_id = request_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_levels(value):
+    # "app.routes.hiragana=DEBUG,werkzeug=WARNING" -> {"app.routes.hiragana": "DEBUG", "werkzeug": "WARNING"}
+    levels = {}
+    for item in value.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _output_handler():
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if Config.LOG_FORMAT == 'json' else TextFormatter())
+    return handler
+
+
+def _start_listener():
+    global _listener, _handler
+    log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+    if _handler is None:
+        _handler = NonBlockingQueueHandler(log_queue)
+    else:
+        _handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, _output_handler(), respect_handler_level=False)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork (and the old queue's lock may have been held
+    # by another thread at that moment), so each child starts over with a new queue and thread
+    global _lock
+    _lock = threading.Lock()
+    if _listener is not None:
+        _start_listener()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def setup_logging():
+    """
+    Route all logging through the background listener and apply LOG_LEVEL / LOG_LEVELS.
+    Safe to call more than once.
+    """
+    with _lock:
+        if _listener is None:
+            _start_listener()
+            atexit.register(_stop_listener)
+            os.register_at_fork(after_in_child=_restart_after_fork)
+
+            root = logging.getLogger()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(_handler)
+
+        logging.getLogger().setLevel(Config.LOG_LEVEL.upper())
+        for name, level in _parse_levels(Config.LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+
+def dropped_records():
+    return _handler.dropped if _handler is not None else 0
+
+
+def _before_request():
+    # Reuse the id from a proxy or the client so log lines can be joined across services
+    request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_id = request_id
+    g.request_id_token = request_id_var.set(request_id)
+
+
+def _after_request(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '-')
+    return response
+
+
+def _teardown_request(exception=None):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        request_id_var.reset(token)
+
+
+def init_app(app):
+    setup_logging()
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,82 @@
+import os
+import sys
+
+# Fields of /proc/<pid>/smaps_rollup, in kB
+_SHARED_FIELDS = ('Shared_Clean', 'Shared_Dirty')
+_PRIVATE_FIELDS = ('Private_Clean', 'Private_Dirty')
+
+
+def process_memory(pid):
+    """
+    Memory usage of a process in kB: rss, pss, shared (pages also mapped by other processes)
+    and unique (pages only this process maps, i.e. what killing it would free)
+    """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':'):
+                try:
+                    values[parts[0][:-1]] = int(parts[1])
+                except ValueError:
+                    continue
+
+    return {
+        'pid': pid,
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'shared': sum(values.get(field, 0) for field in _SHARED_FIELDS),
+        'unique': sum(values.get(field, 0) for field in _PRIVATE_FIELDS),
+    }
+
+
+def child_pids(parent_pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # The command name may contain spaces, so split after its closing parenthesis
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (FileNotFoundError, ProcessLookupError, IndexError):
+            continue
+        if int(fields[1]) == parent_pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def format_report(rows):
+    lines = [f"{'pid':>8} {'rss MB':>9} {'pss MB':>9} {'shared MB':>10} {'unique MB':>10}"]
+    for row in rows:
+        lines.append(f"{row['pid']:>8} {row['rss'] / 1024:>9.1f} {row['pss'] / 1024:>9.1f} "
+                     f"{row['shared'] / 1024:>10.1f} {row['unique'] / 1024:>10.1f}")
+    return '\n'.join(lines)
+
+
+def worker_report(master_pid):
+    """
+    Memory report for a gunicorn master and its workers.
+    Sizing rule of thumb: workers that fit = (available memory - master rss) / worker unique.
+    """
+    rows = [process_memory(master_pid)]
+    for pid in child_pids(master_pid):
+        try:
+            rows.append(process_memory(pid))
+        except FileNotFoundError:
+            continue
+
+    report = format_report(rows)
+    workers = rows[1:]
+    if workers:
+        average_unique = sum(row['unique'] for row in workers) / len(workers) / 1024
+        report += f"\n{len(workers)} workers, {average_unique:.1f} MB unique per worker on average"
+    return report
+
+
+if __name__ == '__main__':
+    # Usage: python -m app.memory <gunicorn master pid>
+    if len(sys.argv) != 2:
+        print("Usage: python -m app.memory <master pid>")
+        sys.exit(1)
+    print(worker_report(int(sys.argv[1])))
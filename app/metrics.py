@@ -0,0 +1,405 @@
+import atexit
+import bisect
+import fcntl
+import glob
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import weakref
+
+from flask import g, request, Response, abort
+
+from app import log
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class _Shard:
+    # Metric values written by a single thread (no owner: the retired totals of finished threads)
+    def __init__(self, owner=None):
+        self.owner = weakref.ref(owner) if owner is not None else None
+        self.counters = {}
+        self.histograms = {}
+
+    def finished(self):
+        thread = self.owner() if self.owner is not None else None
+        return thread is None or not thread.is_alive()
+
+    def add(self, counters, histograms):
+        # Fold another shard's values (plain dicts, copied by the caller) into this one
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, (buckets, total, count) in histograms.items():
+            merged = self.histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            for i, bucket_count in enumerate(list(buckets)):
+                merged[0][i] += bucket_count
+            merged[1] += total
+            merged[2] += count
+
+
+class SharedDirectory:
+    """
+    Counters and histograms of every worker process of a server, exchanged through files in one directory.
+    Each process writes its totals to <pid>-<token>.json every `interval` seconds (and when it exits); a scrape
+    writes its own first and sums all of them. The files of exited processes are folded into retired.json,
+    so their counts stay in the totals and the sums never go backwards.
+    """
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self._path = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def attach(self, registry):
+        """
+        Start writing this process's totals, once per process (threads and file names do not survive fork)
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._path = os.path.join(self.directory, f'{os.getpid()}-{secrets.token_hex(4)}.json')
+            self._pid = os.getpid()
+        atexit.register(self.write, registry)
+        threading.Thread(target=self._write_periodically, args=(registry,), name='metrics-writer', daemon=True).start()
+
+    def _write_periodically(self, registry):
+        while True:
+            time.sleep(self.interval)
+            self.write(registry)
+
+    def write(self, registry):
+        if self._pid != os.getpid():
+            return
+        counters, histograms = registry.local_totals()
+        _dump(self._path, counters, histograms)
+
+    def totals(self):
+        """
+        Counters and histograms summed over every process that wrote to the directory
+        """
+        total = _Shard()
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            retired_path = os.path.join(self.directory, 'retired.json')
+            retired = _Shard()
+            retired.add(*_load(retired_path))
+            folded = False
+            for path in glob.glob(os.path.join(self.directory, '*-*.json')):
+                values = _load(path)
+                if _process_exited(path):
+                    retired.add(*values)
+                    os.remove(path)
+                    folded = True
+                else:
+                    total.add(*values)
+            if folded:
+                _dump(retired_path, retired.counters, retired.histograms)
+        total.add(retired.counters, retired.histograms)
+        return total.counters, total.histograms
+
+
+def _process_exited(path):
+    pid = int(os.path.basename(path).split('-', 1)[0])
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _dump(path, counters, histograms):
+    data = {
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'histograms': [[name, labels, entry] for (name, labels), entry in histograms.items()],
+    }
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def _load(path):
+    # (counters, histograms) of a file written by _dump; nothing when it's gone or half-written
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}, {}
+    labels = lambda pairs: tuple(tuple(pair) for pair in pairs)
+    return ({(name, labels(pairs)): value for name, pairs, value in data['counters']},
+            {(name, labels(pairs)): entry for name, pairs, entry in data['histograms']})
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms in Prometheus text format.
+    Every thread writes to its own shard, so updates never take a lock; scrapes merge the shards.
+    Scrapes also fold the shards of finished threads into one retired shard, so short-lived threads
+    (one per request under the development server) don't pile up while counters stay monotonic.
+    With a SharedDirectory, counters and histograms are summed over all worker processes; gauges are
+    always those of the process answering the scrape.
+    """
+
+    def __init__(self):
+        self.shared = None
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._shards_lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._buckets = {}
+        self._gauges = []
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard(threading.current_thread())
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def counter(self, name, help_text):
+        self._help[name] = help_text
+        self._types[name] = 'counter'
+
+    def histogram(self, name, help_text, buckets):
+        self._help[name] = help_text
+        self._types[name] = 'histogram'
+        self._buckets[name] = buckets
+
+    def gauge_callback(self, name, help_text, callback):
+        """
+        Register a gauge computed at scrape time; callback returns [(labels, value)]
+        """
+        self._help[name] = help_text
+        self._types[name] = 'gauge'
+        self._gauges.append((name, callback))
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        entry = histograms.get(key)
+        if entry is None:
+            # Per-bucket counts (plus +Inf), sum, count
+            entry = [[0] * (len(self._buckets[name]) + 1), 0.0, 0]
+            histograms[key] = entry
+        entry[0][bisect.bisect_left(self._buckets[name], value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def local_totals(self):
+        """
+        Counters and histograms of this process
+        """
+        with self._shards_lock:
+            # A finished thread writes no more, so its shard can be folded in and dropped
+            live = []
+            for shard in self._shards:
+                if shard.finished():
+                    self._retired.add(shard.counters, shard.histograms)
+                else:
+                    live.append(shard)
+            self._shards = live
+            total = _Shard()
+            total.add(self._retired.counters, self._retired.histograms)
+
+        for shard in live:
+            # dict() copies atomically under the GIL, so writers can keep going
+            total.add(dict(shard.counters), dict(shard.histograms))
+        return total.counters, total.histograms
+
+    def render(self):
+        if self.shared is not None:
+            self.shared.attach(self)
+            self.shared.write(self)
+            counters, histograms = self.shared.totals()
+        else:
+            counters, histograms = self.local_totals()
+        lines = []
+
+        def header(name):
+            lines.append(f'# HELP {name} {self._help[name]}')
+            lines.append(f'# TYPE {name} {self._types[name]}')
+
+        for name in sorted(n for n, t in self._types.items() if t == 'counter'):
+            header(name)
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for name in sorted(n for n, t in self._types.items() if t == 'histogram'):
+            header(name)
+            bounds = self._buckets[name]
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(bounds + (float('inf'),), buckets):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+                lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+        for name, callback in self._gauges:
+            header(name)
+            try:
+                samples = callback()
+            except Exception:
+                continue
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+registry = MetricsRegistry()
+registry.counter('http_requests_total', 'HTTP requests by blueprint, endpoint, method and status code.')
+registry.histogram('http_request_duration_seconds', 'HTTP request latency by blueprint and endpoint.',
+                   REQUEST_BUCKETS)
+registry.histogram('recognizer_stage_duration_seconds', 'Handwriting recognizer time per pipeline stage.',
+                   STAGE_BUCKETS)
+registry.counter('recognizer_predictions_total',
+                 'Handwriting predictions by model version and the cascade stage that answered them.')
+registry.counter('browser_recognition_claims_total',
+                 'Correct answers claimed by browser-side recognition: trusted unchecked, confirmed or rejected '
+                 'by the server model.')
+
+
+def observe_recognizer_stage(stage, seconds, course='hiragana'):
+    """
+    Timing hook for HiraganaRecognizer (stages: wait, decode, ink, fast, preprocess, model, search, postprocess)
+    """
+    registry.observe('recognizer_stage_duration_seconds', seconds, (('course', course), ('stage', stage)))
+
+
+def count_recognizer_exit(stage, course='hiragana', version='legacy'):
+    """
+    Exit hook for HiraganaRecognizer (stages: blank, fast, full)
+    """
+    registry.inc('recognizer_predictions_total', (('course', course), ('stage', stage), ('version', version)))
+
+
+def _pool_stats(engine):
+    pool = engine.pool if engine is not None else None
+    samples = []
+    for stat in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, stat, None)
+        if callable(method):
+            samples.append(((('stat', stat),), method()))
+    return samples
+
+
+def _db_pool_stats():
+    from app import get_engine
+
+    return _pool_stats(get_engine())
+
+
+def _replica_pool_stats():
+    # Nothing without REPLICA_DATABASE_URL
+    from app import replica_engine
+
+    return _pool_stats(replica_engine)
+
+
+registry.gauge_callback('db_pool_connections', 'SQLAlchemy connection pool statistics.', _db_pool_stats)
+registry.gauge_callback('db_replica_pool_connections', 'SQLAlchemy connection pool statistics of the read replica.',
+                        _replica_pool_stats)
+
+
+def _resident_models():
+    from app.model.registry import recognizers
+    return [((('course', course), ('version', version)), size) for course, version, size in recognizers.loaded()]
+
+
+registry.gauge_callback('recognizer_model_bytes', 'Weight bytes of each resident recognizer model, by version.',
+                        _resident_models)
+
+
+def _captured_drawings():
+    from app.model.drawing_store import store
+    return [((('outcome', 'stored'),), store.captured), ((('outcome', 'dropped'),), store.dropped)]
+
+
+if Config.DRAWING_CAPTURE_ENABLED:
+    registry.gauge_callback('drawings_captured', 'Drawings captured for retraining, stored or dropped (queue full).',
+                            _captured_drawings)
+registry.gauge_callback('log_records_dropped', 'Log records dropped because the log queue was full.',
+                        lambda: [((), log.dropped_records())])
+
+
+def _before_request():
+    if registry.shared is not None:
+        registry.shared.attach(registry)
+    g.metrics_start = time.perf_counter()
+
+
+def observe_request(blueprint, endpoint, method, status, seconds):
+    """
+    Count a served request and its latency (also called by the routes the ASGI app serves itself)
+    """
+    registry.observe('http_request_duration_seconds', seconds, (('blueprint', blueprint), ('endpoint', endpoint)))
+    registry.inc('http_requests_total', (('blueprint', blueprint), ('endpoint', endpoint),
+                                         ('method', method), ('status', str(status))))
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        # Unmatched URLs share one label so 404 scans can't blow up the series count
+        observe_request(request.blueprint or 'app', request.endpoint or 'unmatched', request.method,
+                        response.status_code, time.perf_counter() - start)
+    return response
+
+
+def metrics_view():
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {Config.METRICS_TOKEN}'):
+        abort(401)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    if not Config.METRICS_ENABLED:
+        return
+    if not Config.METRICS_TOKEN:
+        # Traffic, recognizer and pool figures are not for anonymous visitors
+        logger.warning("METRICS_ENABLED is set without METRICS_TOKEN, /metrics is not served")
+        return
+    if Config.METRICS_DIR:
+        registry.shared = SharedDirectory(Config.METRICS_DIR, Config.METRICS_WRITE_INTERVAL)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
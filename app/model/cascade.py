@@ -0,0 +1,246 @@
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from app.model.dataset import read_image_directory
+
+CASCADE_FILE = 'cascade.npz'
+
+# A pixel counts as ink when darker than this (the same cut preprocess_drawing makes after inverting)
+INK_LEVEL = 230
+# Resolution of the downsampled ink grid and of the row/column projections
+GRID_SIZE = 12
+PROJECTION_BINS = 32
+
+
+def ink_fraction(gray):
+    """
+    Share of ink pixels in a grayscale canvas, on every other pixel (plenty for a 25px pen)
+    """
+    return float(np.count_nonzero(gray[::2, ::2] < INK_LEVEL)) / gray[::2, ::2].size
+
+
+def projection_features(gray):
+    """
+    Cheap shape descriptor of a drawing: the ink cropped to its bounding box and centred in a square,
+    as a coarse density grid plus row and column ink projections, and the box's aspect ratio.
+    Pure numpy/cv2 on the decoded canvas, no contour extraction.
+    """
+    ink = gray < INK_LEVEL
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    if rows.size == 0:
+        return np.zeros(feature_size(), dtype=np.float32)
+
+    crop = ink[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    h, w = crop.shape
+    size = max(h, w)
+    square = np.zeros((size, size), dtype=np.float32)
+    y, x = (size - h) // 2, (size - w) // 2
+    square[y:y + h, x:x + w] = crop
+
+    grid = cv2.resize(square, (GRID_SIZE, GRID_SIZE), interpolation=cv2.INTER_AREA)
+    projections = cv2.resize(square, (PROJECTION_BINS, PROJECTION_BINS), interpolation=cv2.INTER_AREA)
+    return np.concatenate([
+        grid.ravel(),
+        projections.mean(axis=1),
+        projections.mean(axis=0),
+        [w / h],
+    ]).astype(np.float32)
+
+
+def feature_size():
+    return GRID_SIZE * GRID_SIZE + 2 * PROJECTION_BINS + 1
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    weights = np.exp(logits)
+    return weights / weights.sum(axis=-1, keepdims=True)
+
+
+class FastStage:
+    """
+    Linear softmax classifier over projection_features, distilled from a recognizer's full model.
+    Its classes are the recognizer's labels, in the same order.
+    """
+
+    def __init__(self, weights, bias, labels):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=object)
+
+    @classmethod
+    def fit(cls, features, targets, labels, epochs=500, learning_rate=0.5, l2=1e-4):
+        """
+        Fit to the full model's class probabilities (targets) by full-batch gradient descent
+        """
+        features = np.asarray(features, dtype=np.float32)
+        targets = np.asarray(targets, dtype=np.float32)
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0) + 1e-6
+        x = (features - mean) / scale
+
+        weights = np.zeros((x.shape[1], targets.shape[1]), dtype=np.float32)
+        bias = np.zeros(targets.shape[1], dtype=np.float32)
+        for _ in range(epochs):
+            gradient = (_softmax(x @ weights + bias) - targets) / len(x)
+            weights -= learning_rate * (x.T @ gradient + l2 * weights)
+            bias -= learning_rate * gradient.sum(axis=0)
+
+        # Fold the standardization into the weights so inference is a single matrix product
+        weights = weights / scale[:, np.newaxis]
+        bias = bias - mean @ weights
+        return cls(weights, bias, labels)
+
+    def scores(self, gray):
+        """
+        Class probabilities for one decoded canvas
+        """
+        return _softmax(projection_features(gray) @ self.weights + self.bias)
+
+    def save(self, path):
+        # Same write-then-rename as the centroid index
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, weights=self.weights, bias=self.bias, labels=self.labels.astype(str))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['weights'], data['bias'], data['labels'].tolist())
+
+
+def _full_model_outputs(recognizer, drawings):
+    # (class probabilities, per-drawing seconds) of the full pipeline after decoding, one drawing at a time
+    probabilities, seconds = [], []
+    for drawing in drawings:
+        started = time.perf_counter()
+        image = recognizer.preprocess_drawing(drawing)
+        probabilities.append(recognizer.full_scores(image[np.newaxis])[0])
+        seconds.append(time.perf_counter() - started)
+    return np.stack(probabilities), np.array(seconds)
+
+
+def _load_drawings(args):
+    from app.model.synthetic import render_strokes, synthetic_strokes
+
+    drawings = []
+    if args.images:
+        drawings.extend(read_image_directory(args.images)[0])
+    drawings.extend(np.array(render_strokes(synthetic_strokes(args.seed + i))) for i in range(args.synthetic))
+    if not drawings:
+        raise SystemExit('No drawings: pass --images and/or --synthetic')
+    return drawings
+
+
+def evaluate(recognizer, stage, drawings, thresholds, min_ink):
+    """
+    Replay drawings through the cascade at each confidence threshold. Every drawing goes through
+    every stage once, so the rows are computed from the same measurements: the share of drawings
+    each stage absorbs, how often the fast stage agrees with the full model on the ones it answers,
+    and the mean latency after decoding compared with always running the full model. Agreement
+    is measured on drawings with ink only, since a blank canvas has no right answer.
+    """
+    ink_seconds, fast_seconds, blank, fast_scores = [], [], [], []
+    for drawing in drawings:
+        started = time.perf_counter()
+        blank.append(ink_fraction(drawing) < min_ink)
+        ink_seconds.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        fast_scores.append(stage.scores(drawing))
+        fast_seconds.append(time.perf_counter() - started)
+    blank = np.array(blank)
+    ink_seconds, fast_seconds = np.array(ink_seconds), np.array(fast_seconds)
+    fast_scores = np.stack(fast_scores)
+    full_scores, full_seconds = _full_model_outputs(recognizer, drawings)
+
+    fast_best = fast_scores.argmax(axis=1)
+    full_best = full_scores.argmax(axis=1)
+    fast_confidence = fast_scores.max(axis=1)
+    inked = ~blank
+
+    rows = []
+    for threshold in thresholds:
+        fast = inked & (fast_confidence >= threshold)
+        full = inked & ~fast
+        seconds = ink_seconds + np.where(blank, 0, fast_seconds) + np.where(full, full_seconds, 0)
+        answered = np.where(fast, fast_best, full_best)
+        rows.append({
+            'threshold': threshold,
+            'blank': blank.mean(),
+            'fast': fast.mean(),
+            'full': full.mean(),
+            'fast_agreement': (fast_best[fast] == full_best[fast]).mean() if fast.any() else 1.0,
+            'agreement': (answered[inked] == full_best[inked]).mean() if inked.any() else 1.0,
+            'cascade_ms': seconds.mean() * 1000,
+            'full_ms': full_seconds.mean() * 1000,
+        })
+    return rows
+
+
+def format_report(rows, count):
+    lines = [
+        f"{count} drawings",
+        f"{'threshold':>9} {'blank %':>8} {'fast %':>7} {'full %':>7} {'fast agree %':>13} "
+        f"{'agree %':>8} {'cascade ms':>11} {'full ms':>8}",
+    ]
+    for row in rows:
+        lines.append(f"{row['threshold']:>9.3f} {row['blank'] * 100:>8.1f} {row['fast'] * 100:>7.1f} "
+                     f"{row['full'] * 100:>7.1f} {row['fast_agreement'] * 100:>13.1f} {row['agreement'] * 100:>8.1f} "
+                     f"{row['cascade_ms']:>11.2f} {row['full_ms']:>8.2f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train and evaluate the fast first stage of the recognizer cascade')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('train', 'Distill the fast stage from the full model'),
+                            ('report', 'Stage shares, agreement and latency per confidence threshold')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--model-dir', required=True, help='Artifact directory holding the full model')
+        command.add_argument('--images', help='Drawings under <images>/<character>/*.png')
+        command.add_argument('--synthetic', type=int, default=0, help='Number of synthetic drawings to add')
+        command.add_argument('--seed', type=int, default=0)
+    commands.choices['train'].add_argument('--epochs', type=int, default=500)
+    commands.choices['report'].add_argument('--blank', type=int, default=0, help='Number of empty canvases to add')
+    commands.choices['report'].add_argument('--thresholds', default='0.8,0.9,0.95,0.98,0.99')
+    commands.choices['report'].add_argument('--min-ink', type=float, default=None,
+                                            help='Blank-canvas cutoff (defaults to CASCADE_MIN_INK)')
+    args = parser.parse_args(argv)
+
+    from app.config import Config
+    from app.model.predict_character import HiraganaRecognizer
+    from app.model.registry import resolve_model_path
+
+    # The full model alone: it is the teacher in training and the reference in the report
+    recognizer = HiraganaRecognizer(model_path=resolve_model_path(args.model_dir), base_dir=args.model_dir,
+                                    use_cascade=False)
+    drawings = _load_drawings(args)
+    cascade_path = os.path.join(args.model_dir, CASCADE_FILE)
+
+    if args.command == 'train':
+        # Batched: only the targets are needed here, not per-drawing timings
+        targets = recognizer.full_scores(np.stack([recognizer.preprocess_drawing(d) for d in drawings]))
+        features = np.stack([projection_features(drawing) for drawing in drawings])
+        stage = FastStage.fit(features, targets, recognizer.labels, epochs=args.epochs)
+        agreement = np.mean((features @ stage.weights + stage.bias).argmax(axis=1) == targets.argmax(axis=1))
+        stage.save(cascade_path)
+        print(f"Fast stage trained on {len(drawings)} drawings ({agreement:.1%} top-1 agreement), "
+              f"written to {cascade_path}")
+        return
+
+    stage = FastStage.load(cascade_path)
+    drawings.extend(np.full_like(drawings[0], 255) for _ in range(args.blank))
+    min_ink = Config.CASCADE_MIN_INK if args.min_ink is None else args.min_ink
+    rows = evaluate(recognizer, stage, drawings, [float(t) for t in args.thresholds.split(',')], min_ink)
+    print(format_report(rows, len(drawings)))
+
+
+if __name__ == '__main__':
+    # Usage: python -m app.model.cascade train|report --model-dir <dir> [--images <dir>] [--synthetic N]
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app.model.dataset import read_image_directory
+
+INDEX_FILE = 'centroids.npz'
+
+
+def top_k(scores, k):
+    """
+    Indices of the k highest scores, best first. argpartition is O(n), so only the k winners get sorted.
+    """
+    k = min(k, scores.shape[0])
+    indices = np.argpartition(scores, -k)[-k:]
+    return indices[np.argsort(scores[indices])[::-1]]
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class CentroidIndex:
+    """
+    Nearest-centroid classifier over L2-normalized embeddings: one mean embedding per class,
+    scored by cosine similarity. Classes can be added from a few examples without retraining.
+    """
+
+    def __init__(self, centroids, labels, temperature=0.05):
+        self.centroids = _normalize(np.asarray(centroids, dtype=np.float32))
+        self.labels = np.asarray(labels, dtype=object)
+        # Softmax temperature turning similarities into confidences comparable to the softmax head
+        self.temperature = float(temperature)
+
+    @classmethod
+    def build(cls, embeddings, labels, temperature=0.05):
+        """
+        Build an index from per-sample embeddings and their labels
+        """
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+        labels = np.asarray(labels, dtype=object)
+        classes = list(dict.fromkeys(labels))
+        centroids = np.stack([embeddings[labels == label].mean(axis=0) for label in classes])
+        return cls(centroids, classes, temperature)
+
+    def add_class(self, label, embeddings):
+        """
+        Add (or replace) one class from a few example embeddings
+        """
+        centroid = _normalize(_normalize(np.asarray(embeddings, dtype=np.float32)).mean(axis=0))
+        existing = np.flatnonzero(self.labels == label)
+        if existing.size:
+            self.centroids[existing[0]] = centroid
+        else:
+            self.centroids = np.vstack([self.centroids, centroid[np.newaxis]])
+            self.labels = np.append(self.labels, label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def scores(self, embedding):
+        """
+        Confidence per class (softmax over cosine similarities) for one embedding
+        """
+        similarities = self.centroids @ _normalize(np.asarray(embedding, dtype=np.float32).ravel())
+        logits = similarities / self.temperature
+        logits -= logits.max()
+        weights = np.exp(logits)
+        return weights / weights.sum()
+
+    def search(self, embedding, k=3):
+        """
+        (labels, confidences) of the k nearest classes, best first
+        """
+        scores = self.scores(embedding)
+        indices = top_k(scores, k)
+        return self.labels[indices], scores[indices]
+
+    def save(self, path):
+        # Write next to the final file, then rename, so a running server never reads a partial index
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, centroids=self.centroids, labels=self.labels.astype(str),
+                 temperature=np.float32(self.temperature))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['labels'].tolist(), float(data['temperature']))
+
+
+def embedding_model(model):
+    """
+    Keras model mapping a drawing to the input of the classifier's final softmax layer
+    """
+    from tensorflow import keras
+
+    return keras.Model(inputs=model.inputs, outputs=model.layers[-2].output)
+
+
+def _embed_directory(recognizer, directory):
+    # <directory>/<character>/*.png -> (embeddings, labels)
+    embedder = embedding_model(recognizer.model)
+    drawings, labels = read_image_directory(directory)
+    images = [recognizer.preprocess_drawing(drawing) for drawing in drawings]
+    batch = np.expand_dims(np.stack(images), axis=-1)
+    return embedder.predict(batch, verbose=0), labels
+
+
+def benchmark(class_counts, dim=128, repeat=2000, k=3, seed=0):
+    """
+    Per-query latency (microseconds) of the decoding step as the label space grows:
+    full argsort + dict lookup, argpartition + label array, and nearest-centroid search
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for count in class_counts:
+        logits = rng.standard_normal((repeat, count)).astype(np.float32)
+        probabilities = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+        index_to_char = {i: chr(0x4E00 + i) for i in range(count)}
+        labels = np.array([index_to_char[i] for i in range(count)], dtype=object)
+        index = CentroidIndex(rng.standard_normal((count, dim)), labels)
+        queries = rng.standard_normal((repeat, dim)).astype(np.float32)
+
+        started = time.perf_counter()
+        for scores in probabilities:
+            best = np.argsort(scores)[-k:][::-1]
+            [index_to_char[i] for i in best]
+        argsort_us = (time.perf_counter() - started) / repeat * 1e6
+
+        started = time.perf_counter()
+        for scores in probabilities:
+            labels[top_k(scores, k)]
+        argpartition_us = (time.perf_counter() - started) / repeat * 1e6
+
+        started = time.perf_counter()
+        for query in queries:
+            index.search(query, k)
+        centroid_us = (time.perf_counter() - started) / repeat * 1e6
+
+        rows.append((count, argsort_us, argpartition_us, centroid_us))
+    return rows
+
+
+def format_benchmark(rows):
+    lines = [f"{'classes':>8} {'argsort us':>11} {'argpartition us':>16} {'centroid us':>12}"]
+    for count, argsort_us, argpartition_us, centroid_us in rows:
+        lines.append(f"{count:>8} {argsort_us:>11.1f} {argpartition_us:>16.1f} {centroid_us:>12.1f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Class-centroid index for embedding-based recognition')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Build an index from <images>/<character>/*.png')
+    build.add_argument('images')
+    build.add_argument('--model-dir', required=True, help='Artifact directory holding model.keras')
+    build.add_argument('--temperature', type=float, default=0.05)
+
+    add = commands.add_parser('add', help='Add characters to an existing index from <images>/<character>/*.png')
+    add.add_argument('images')
+    add.add_argument('--model-dir', required=True)
+
+    bench = commands.add_parser('bench', help='Decoding latency as a function of class count')
+    bench.add_argument('--classes', default='50,500,2000,5000,20000')
+    bench.add_argument('--dim', type=int, default=128)
+    bench.add_argument('--repeat', type=int, default=2000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        print(format_benchmark(benchmark([int(c) for c in args.classes.split(',')], args.dim, args.repeat)))
+        return
+
+    from app.model.registry import resolve_model_path
+    from app.model.predict_character import HiraganaRecognizer
+
+    # Load the softmax model itself; the embedding is taken from its penultimate layer
+    recognizer = HiraganaRecognizer(model_path=resolve_model_path(args.model_dir), base_dir=args.model_dir,
+                                    use_index=False, use_cascade=False)
+    embeddings, labels = _embed_directory(recognizer, args.images)
+    index_path = os.path.join(args.model_dir, INDEX_FILE)
+
+    if args.command == 'build':
+        index = CentroidIndex.build(embeddings, labels, args.temperature)
+    else:
+        index = CentroidIndex.load(index_path)
+        labels = np.asarray(labels, dtype=object)
+        for label in dict.fromkeys(labels):
+            index.add_class(label, embeddings[labels == label])
+
+    index.save(index_path)
+    print(f"Index with {len(index)} classes written to {index_path}")
+
+
+if __name__ == '__main__':
+    # Usage: python -m app.model.centroids build|add <images> --model-dir <dir>, or bench
+    main()
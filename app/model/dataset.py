@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def list_image_directory(directory):
+    """
+    Paths and labels of the drawings under <directory>/<character>/*.png, one folder per character
+    """
+    paths, labels = [], []
+    for label in sorted(os.listdir(directory)):
+        class_dir = os.path.join(directory, label)
+        if not os.path.isdir(class_dir):
+            continue
+        for name in sorted(os.listdir(class_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(class_dir, name))
+                labels.append(label)
+    if not paths:
+        raise ValueError(f'No images found under {directory}')
+    return paths, labels
+
+
+def read_image(path):
+    with Image.open(path) as image:
+        return np.array(image.convert('L'))
+
+
+def read_image_directory(directory):
+    """
+    Grayscale drawings and their labels from <directory>/<character>/*.png
+    """
+    paths, labels = list_image_directory(directory)
+    return [read_image(path) for path in paths], labels
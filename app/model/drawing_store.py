@@ -0,0 +1,245 @@
+import argparse
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# One fixed-size record per drawing: the preprocessed image as the model sees it (0-255), the character
+# being practised ('' when there was none), the top-3 answer and the capture time (Unix seconds)
+RECORD_DTYPE = np.dtype([
+    ('image', np.uint8, (28, 28)),
+    ('target', 'U4'),
+    ('top_chars', 'U4', (3,)),
+    ('top_confidences', np.float32, (3,)),
+    ('timestamp', np.float64),
+])
+
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.json'
+
+
+def _to_uint8(image):
+    image = np.asarray(image)
+    if image.dtype != np.uint8:
+        image = np.clip(np.rint(image * 255), 0, 255).astype(np.uint8)
+    return image
+
+
+class _Segment:
+    # A segment file being filled by this process, memory-mapped at its full capacity
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.count = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='w+', shape=(capacity,))
+
+    def append(self, record):
+        self.records[self.count] = record
+        self.count += 1
+        self.first_timestamp = self.first_timestamp or record[-1]
+        self.last_timestamp = record[-1]
+
+    def full(self):
+        return self.count >= self.capacity
+
+    def commit(self, sealed=False):
+        # Records reach the file before the index counts them, so readers never see a partial record
+        self.records.flush()
+        if sealed:
+            del self.records
+            # Trim the unused capacity of a closed segment
+            os.truncate(self.path, self.count * RECORD_DTYPE.itemsize)
+        index = {
+            'count': self.count,
+            'capacity': self.count if sealed else self.capacity,
+            'sealed': sealed,
+            'first_timestamp': self.first_timestamp,
+            'last_timestamp': self.last_timestamp,
+            'dtype': RECORD_DTYPE.descr,
+        }
+        index_path = self.path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+
+
+class DrawingStore:
+    """
+    Append-only store of submitted drawings under <directory>/<course>/, in fixed-record segment
+    files of `segment_records` records, each with a JSON sidecar index holding its record count.
+    capture() only queues the drawing: preprocessing and writes happen on a background thread, and
+    drawings are dropped (and counted) when the queue is full. Each process writes its own segments,
+    so several workers can capture into the same directory.
+    """
+
+    def __init__(self, directory, segment_records, queue_size):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.queue_size = queue_size
+        self.captured = 0
+        self.dropped = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def capture(self, image, target_char, result, course='hiragana'):
+        """
+        Capture hook for HiraganaRecognizer: image is the preprocessed 28x28 drawing, or a callable
+        producing it (run on the writer thread)
+        """
+        if os.getpid() != self._pid:
+            self._start()
+        top = result.get('top_predictions', [])[:3]
+        item = (course, image, target_char or '',
+                [p['character'] for p in top], [p['confidence'] for p in top], time.time())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        # Lazily per process: a writer thread does not survive fork
+        with self._lock:
+            if os.getpid() == self._pid:
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name='drawing-store', daemon=True)
+            self._thread.start()
+            atexit.register(self._stop)
+
+    def _stop(self):
+        # Write what is still queued and seal the open segments
+        if os.getpid() == self._pid:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+
+    def _run(self, items):
+        writer_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        segments = {}  # course -> _Segment
+        numbers = {}  # course -> next segment number
+        while True:
+            batch = [items.get()]
+            # Write whatever else is already waiting, then commit once for the whole batch
+            while len(batch) < 256 and batch[-1] is not None:
+                try:
+                    batch.append(items.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+
+            touched = set()
+            for course, image, target, chars, confidences, timestamp in batch:
+                try:
+                    if callable(image):
+                        image = image()
+                    chars = (chars + [''] * 3)[:3]
+                    confidences = (confidences + [0.0] * 3)[:3]
+                    record = (_to_uint8(image), target, chars, confidences, timestamp)
+
+                    segment = segments.get(course)
+                    if segment is None:
+                        course_dir = os.path.join(self.directory, course)
+                        os.makedirs(course_dir, exist_ok=True)
+                        number = numbers.get(course, 0)
+                        numbers[course] = number + 1
+                        path = os.path.join(course_dir, f'{writer_id}-{number:05d}{SEGMENT_SUFFIX}')
+                        segment = segments[course] = _Segment(path, self.segment_records)
+                    segment.append(record)
+                    touched.add(course)
+                    self.captured += 1
+
+                    if segment.full():
+                        segment.commit(sealed=True)
+                        del segments[course]
+                        touched.discard(course)
+                except Exception:
+                    logger.exception("Failed to store a drawing for %s", course)
+
+            for course in (list(segments) if stopping else touched):
+                try:
+                    segments[course].commit(sealed=stopping)
+                except Exception:
+                    logger.exception("Failed to commit the %s drawing segment", course)
+            if stopping:
+                return
+
+
+def segment_paths(directory, course):
+    """
+    Segment files of a course (each writing process has its own numbered series)
+    """
+    return sorted(glob.glob(os.path.join(directory, course.lower(), '*' + SEGMENT_SUFFIX)))
+
+
+def open_segment(path):
+    """
+    The committed records of a segment as a read-only memory-mapped structured array (no copy).
+    Fields are views too: open_segment(path)['image'] is an (n, 28, 28) uint8 array.
+    """
+    with open(path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX, encoding='utf-8') as f:
+        count = json.load(f)['count']
+    if count == 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+
+def iter_segments(directory, course):
+    """
+    Yield the records of each segment of a course, for jobs that stream through them
+    """
+    for path in segment_paths(directory, course):
+        if os.path.exists(path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX):
+            yield open_segment(path)
+
+
+def load_records(directory, course):
+    """
+    All records of a course in one array (this one is a copy)
+    """
+    segments = list(iter_segments(directory, course))
+    return np.concatenate(segments) if segments else np.empty(0, dtype=RECORD_DTYPE)
+
+
+store = DrawingStore(Config.DRAWING_STORE_DIR, Config.DRAWING_SEGMENT_RECORDS, Config.DRAWING_CAPTURE_QUEUE)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize the captured drawings')
+    parser.add_argument('--dir', default=Config.DRAWING_STORE_DIR)
+    parser.add_argument('--course', help='Only this course (default: every course in the store)')
+    args = parser.parse_args(argv)
+
+    courses = [args.course] if args.course else sorted(
+        name for name in os.listdir(args.dir) if os.path.isdir(os.path.join(args.dir, name)))
+    for course in courses:
+        segments = list(iter_segments(args.dir, course))
+        count = sum(len(records) for records in segments)
+        labelled = sum(int(np.count_nonzero(records['target'])) for records in segments)
+        correct = sum(int(np.count_nonzero((records['target'] != '') &
+                                           (records['target'] == records['top_chars'][:, 0])))
+                      for records in segments)
+        print(f"{course}: {count} drawings in {len(segments)} segments, {labelled} with a target "
+              f"({correct / labelled if labelled else 0:.1%} recognized as it)")
+
+
+if __name__ == '__main__':
+    # Usage: python -m app.model.drawing_store [--dir ./drawings] [--course hiragana]
+    main()
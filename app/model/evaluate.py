@@ -0,0 +1,242 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.model import drawing_store
+from app.model.dataset import list_image_directory, read_image
+
+CALIBRATION_BINS = 10
+
+# The recognizer of this worker process, loaded once by _init_worker
+_recognizer = None
+
+
+def _init_worker(model_dir, threads):
+    global _recognizer
+    from app.model.runtime import configure_opencv, configure_tensorflow
+
+    # One process per core does the parallelism; more TensorFlow threads per process would only contend
+    configure_tensorflow(threads, 1)
+    configure_opencv(1)
+
+    from app.model.predict_character import HiraganaRecognizer
+    from app.model.registry import resolve_model_path
+
+    _recognizer = HiraganaRecognizer(model_path=resolve_model_path(model_dir), base_dir=model_dir,
+                                     use_cascade=False)
+
+
+def _worker_labels():
+    return list(_recognizer.labels)
+
+
+def _evaluate_shard(shard, batch_size):
+    """
+    (top-3 class indices, top-1 confidence) for one shard: ('store', segment path, start, stop)
+    of already preprocessed drawings, or ('images', [paths]) of canvases to preprocess
+    """
+    if shard[0] == 'store':
+        _, path, start, stop = shard
+        images = drawing_store.open_segment(path)['image'][start:stop]
+    else:
+        images = np.empty((len(shard[1]), 28, 28), dtype=np.float32)
+        for row, path in enumerate(shard[1]):
+            _recognizer.preprocess_drawing(read_image(path), out=images[row])
+
+    top_3 = np.empty((len(images), 3), dtype=np.int32)
+    confidence = np.empty(len(images), dtype=np.float32)
+    for begin in range(0, len(images), batch_size):
+        batch = images[begin:begin + batch_size]
+        if batch.dtype == np.uint8:
+            batch = batch.astype(np.float32) / 255.0
+        scores = _recognizer.full_scores(batch)
+        k = min(3, scores.shape[1])
+        best = np.argpartition(scores, -k, axis=1)[:, -k:]
+        order = np.argsort(np.take_along_axis(scores, best, axis=1), axis=1)[:, ::-1]
+        best = np.take_along_axis(best, order, axis=1)
+        top_3[begin:begin + len(batch), :k] = best
+        top_3[begin:begin + len(batch), k:] = -1
+        confidence[begin:begin + len(batch)] = np.take_along_axis(scores, best[:, :1], axis=1)[:, 0]
+    return top_3, confidence
+
+
+def store_shards(directory, course, shard_size):
+    """
+    Shards over the labelled records of a drawing store, and their targets. Workers map the
+    segments themselves, so no image crosses the process boundary.
+    """
+    shards, targets = [], []
+    for path in drawing_store.segment_paths(directory, course):
+        records = drawing_store.open_segment(path)
+        labelled = np.flatnonzero(records['target'] != '')
+        # Runs of consecutive labelled records become shards
+        for run in np.split(labelled, np.flatnonzero(np.diff(labelled) != 1) + 1):
+            for begin in range(0, len(run), shard_size):
+                chunk = run[begin:begin + shard_size]
+                shards.append(('store', path, int(chunk[0]), int(chunk[-1]) + 1))
+                targets.extend(records['target'][chunk].tolist())
+    return shards, targets
+
+
+def image_shards(directory, shard_size):
+    paths, labels = list_image_directory(directory)
+    return [('images', paths[i:i + shard_size]) for i in range(0, len(paths), shard_size)], labels
+
+
+def summarize(labels, targets, top_3, confidence, elapsed):
+    """
+    Accuracy overall and per class, confusion matrix and calibration of the top-1 confidence
+    """
+    index_of = {label: i for i, label in enumerate(labels)}
+    true = np.array([index_of.get(target, -1) for target in targets], dtype=np.int64)
+    known = true >= 0
+    true, top_3, confidence = true[known], top_3[known], confidence[known]
+    predicted = top_3[:, 0]
+    correct = predicted == true
+
+    n = len(labels)
+    confusion = np.bincount(true * n + predicted, minlength=n * n).reshape(n, n)
+    support = confusion.sum(axis=1)
+    per_class = [
+        {'label': labels[i], 'support': int(support[i]),
+         'accuracy': float(confusion[i, i] / support[i]) if support[i] else None}
+        for i in range(n)
+    ]
+
+    edges = np.linspace(0, 1, CALIBRATION_BINS + 1)
+    bins = np.clip(np.digitize(confidence, edges[1:-1]), 0, CALIBRATION_BINS - 1)
+    calibration = []
+    ece = 0.0
+    for b in range(CALIBRATION_BINS):
+        in_bin = bins == b
+        count = int(in_bin.sum())
+        mean_confidence = float(confidence[in_bin].mean()) if count else None
+        accuracy = float(correct[in_bin].mean()) if count else None
+        if count:
+            ece += count / len(correct) * abs(accuracy - mean_confidence)
+        calibration.append({'low': float(edges[b]), 'high': float(edges[b + 1]), 'count': count,
+                            'confidence': mean_confidence, 'accuracy': accuracy})
+
+    return {
+        'samples': len(targets),
+        'evaluated': int(known.sum()),
+        'unknown_labels': int((~known).sum()),
+        'accuracy': float(correct.mean()) if len(correct) else 0.0,
+        'top_3_accuracy': float((top_3 == true[:, np.newaxis]).any(axis=1).mean()) if len(correct) else 0.0,
+        'expected_calibration_error': ece,
+        'seconds': elapsed,
+        'images_per_second': len(targets) / elapsed if elapsed else 0.0,
+        'per_class': per_class,
+        'calibration': calibration,
+        'confusion': confusion,
+    }
+
+
+def write_report(report, labels, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'confusion.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['true \\ predicted'] + list(labels))
+        for label, row in zip(labels, report['confusion']):
+            writer.writerow([label] + row.tolist())
+    with open(os.path.join(output_dir, 'calibration.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['low', 'high', 'count', 'confidence', 'accuracy'])
+        writer.writeheader()
+        writer.writerows(report['calibration'])
+    with open(os.path.join(output_dir, 'report.json'), 'w', encoding='utf-8') as f:
+        json.dump({key: value for key, value in report.items() if key != 'confusion'}, f, ensure_ascii=False,
+                  indent=2)
+
+
+def format_report(report, labels, worst=10):
+    lines = [
+        f"{report['samples']} samples ({report['unknown_labels']} with labels the model does not know) "
+        f"in {report['seconds']:.1f}s, {report['images_per_second']:.0f} images/s",
+        f"Accuracy {report['accuracy']:.2%}, top-3 {report['top_3_accuracy']:.2%}, "
+        f"expected calibration error {report['expected_calibration_error']:.3f}",
+        '',
+        "Worst classes:",
+    ]
+    scored = sorted((c for c in report['per_class'] if c['support']), key=lambda c: c['accuracy'])
+    for entry in scored[:worst]:
+        lines.append(f"  {entry['label']}  {entry['accuracy']:7.2%}  of {entry['support']}")
+
+    confusion = report['confusion'].copy()
+    np.fill_diagonal(confusion, 0)
+    lines.append('')
+    lines.append('Most frequent confusions:')
+    for flat in np.argsort(confusion, axis=None)[::-1][:worst]:
+        true, predicted = divmod(int(flat), len(labels))
+        if confusion[true, predicted] == 0:
+            break
+        lines.append(f"  {labels[true]} -> {labels[predicted]}  {confusion[true, predicted]}")
+
+    lines.append('')
+    lines.append(f"{'confidence':>12} {'count':>9} {'mean conf':>10} {'accuracy':>9}")
+    for entry in report['calibration']:
+        if entry['count']:
+            lines.append(f"{entry['low']:>5.1f}-{entry['high']:<6.1f} {entry['count']:>9} "
+                         f"{entry['confidence']:>10.3f} {entry['accuracy']:>9.3f}")
+    return '\n'.join(lines)
+
+
+def evaluate(model_dir, shards, targets, workers, threads=1, batch_size=1024):
+    """
+    Run the shards across a pool of worker processes, each with its own recognizer.
+    Returns (labels, report).
+    """
+    # spawn: workers start clean instead of inheriting a forked TensorFlow runtime
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(model_dir, threads)) as pool:
+        labels = pool.submit(_worker_labels).result()
+        # Model loading is not part of the throughput
+        started = time.perf_counter()
+        results = list(pool.map(_evaluate_shard, shards, [batch_size] * len(shards)))
+        elapsed = time.perf_counter() - started
+
+    top_3 = np.concatenate([r[0] for r in results]) if results else np.empty((0, 3), dtype=np.int32)
+    confidence = np.concatenate([r[1] for r in results]) if results else np.empty(0, dtype=np.float32)
+    return labels, summarize(labels, targets, top_3, confidence, elapsed)
+
+
+def main(argv=None):
+    from app.config import Config
+
+    parser = argparse.ArgumentParser(description='Measure recognizer accuracy on a dataset')
+    parser.add_argument('--model-dir', required=True, help='Artifact directory of the model to evaluate')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--images', help='Drawings under <images>/<character>/*.png')
+    source.add_argument('--store', nargs='?', const=Config.DRAWING_STORE_DIR,
+                        help='Captured drawings with a target (default directory: DRAWING_STORE_DIR)')
+    parser.add_argument('--course', default='hiragana', help='Course of the captured drawings')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--threads', type=int, default=1, help='TensorFlow threads per worker')
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--shard-size', type=int, default=8192, help='Samples handed to a worker at a time')
+    parser.add_argument('--output', help='Write confusion.csv, calibration.csv and report.json here')
+    args = parser.parse_args(argv)
+
+    if args.images:
+        shards, targets = image_shards(args.images, args.shard_size)
+    else:
+        shards, targets = store_shards(args.store, args.course, args.shard_size)
+    if not targets:
+        raise SystemExit('Nothing to evaluate')
+
+    labels, report = evaluate(args.model_dir, shards, targets, args.workers, args.threads, args.batch_size)
+    print(format_report(report, labels))
+    if args.output:
+        write_report(report, labels, args.output)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == '__main__':
+    # Usage: python -m app.model.evaluate --model-dir app/model --images <dir> | --store [dir] [--workers N]
+    main()
@@ -4,25 +4,36 @@ import tensorflow as tf
 from tensorflow import keras
 import pickle
 import json
-import base64
-from io import BytesIO
-from PIL import Image
 import os
+import time
+import logging
+import functools
+
+from app.model.cascade import ink_fraction
+from app.model.preprocess import decode_drawing, preprocess_drawing
+
+logger = logging.getLogger(__name__)
 
 class HiraganaRecognizer:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, base_dir=None, use_index=True, use_cascade=True,
+                 min_ink=0.001, fast_confidence=0.98):
         """
-        Initialize the Hiragana recognizer
+        Initialize the recognizer from the model and label files in base_dir
+        (defaults to this directory, which holds the Hiragana artifacts).
+        If base_dir has a class-centroid index (centroids.npz) and use_index is set, drawings are
+        classified by nearest centroid of the model's embedding instead of its softmax head.
+        Canvases with less than min_ink ink are rejected as blank before any model runs, and if
+        base_dir has a fast first stage (cascade.npz) and use_cascade is set, its answer is used
+        whenever it is at least fast_confidence sure.
         """
         # Determine base directory
-        self.base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
         
         # Set default paths if not provided
         if model_path is None:
             model_path = os.path.join(self.base_dir, 'hiragana_model.keras')
         
-        print(f"Loading model from: {model_path}")
-        print(f"Base directory: {self.base_dir}")
+        logger.info("Loading model from %s", model_path)
         
         # Check if model file exists
         if not os.path.exists(model_path):
@@ -30,25 +41,40 @@ class HiraganaRecognizer:
         
         # Load model
         self.model = keras.models.load_model(model_path)
-        print("✅ Model loaded successfully")
-        
-        # Load label encoder
-        label_encoder_path = os.path.join(self.base_dir, 'label_encoder.pkl')
-        if not os.path.exists(label_encoder_path):
-            raise FileNotFoundError(f"Label encoder not found: {label_encoder_path}")
-        
-        with open(label_encoder_path, 'rb') as f:
-            self.label_encoder = pickle.load(f)
-        print("✅ Label encoder loaded")
         
-        # Load label mapping
-        label_mapping_path = os.path.join(self.base_dir, 'label_mapping.json')
-        if not os.path.exists(label_mapping_path):
-            raise FileNotFoundError(f"Label mapping not found: {label_mapping_path}")
+        # Embedding + nearest-centroid mode: labels come from the index, so new characters
+        # can be added to it without retraining the softmax head
+        self.index = None
+        index_path = os.path.join(self.base_dir, 'centroids.npz')
+        if use_index and os.path.exists(index_path):
+            from app.model.centroids import CentroidIndex, embedding_model
+            self.index = CentroidIndex.load(index_path)
+            self.embedder = embedding_model(self.model)
+            self.label_encoder = {
+                'index_to_char': dict(enumerate(self.index.labels)),
+                'char_to_index': {char: i for i, char in enumerate(self.index.labels)},
+            }
+            self.label_mapping = {}
+        else:
+            # Load label encoder
+            label_encoder_path = os.path.join(self.base_dir, 'label_encoder.pkl')
+            if not os.path.exists(label_encoder_path):
+                raise FileNotFoundError(f"Label encoder not found: {label_encoder_path}")
+            
+            with open(label_encoder_path, 'rb') as f:
+                self.label_encoder = pickle.load(f)
+            
+            # Load label mapping
+            label_mapping_path = os.path.join(self.base_dir, 'label_mapping.json')
+            if not os.path.exists(label_mapping_path):
+                raise FileNotFoundError(f"Label mapping not found: {label_mapping_path}")
+            
+            with open(label_mapping_path, 'r', encoding='utf-8') as f:
+                self.label_mapping = json.load(f)
         
-        with open(label_mapping_path, 'r', encoding='utf-8') as f:
-            self.label_mapping = json.load(f)
-        print("✅ Label mapping loaded")
+        # Labels by class index as an array, so top-k decoding is a single fancy-index
+        index_to_char = self.label_encoder['index_to_char']
+        self.labels = np.array([index_to_char[i] for i in range(len(index_to_char))], dtype=object)
         
         # Load romaji mapping
         romaji_path = os.path.join(self.base_dir, 'char_to_romaji.json')
@@ -57,111 +83,137 @@ class HiraganaRecognizer:
         
         with open(romaji_path, 'r', encoding='utf-8') as f:
             self.char_to_romaji = json.load(f)
-        print("✅ Romaji mapping loaded")
         
-        print(f"✅ Model initialized. Number of classes: {len(self.label_encoder['index_to_char'])}")
-        print(f"📚 Characters recognized: {list(self.label_encoder['index_to_char'].values())}")
+        # Cascade: blank-canvas check, then the fast stage, then the full model for the rest
+        self.min_ink = min_ink
+        self.fast_confidence = fast_confidence
+        self.fast_stage = None
+        cascade_path = os.path.join(self.base_dir, 'cascade.npz')
+        if use_cascade and os.path.exists(cascade_path):
+            from app.model.cascade import FastStage
+            fast_stage = FastStage.load(cascade_path)
+            if list(fast_stage.labels) == list(self.labels):
+                self.fast_stage = fast_stage
+            else:
+                logger.warning("Ignoring %s: it was trained for different classes", cascade_path)
+        
+        # Artifact version, set by the registry that loaded it
+        self.version = None
+        
+        # Optional callable(stage, seconds) receiving per-stage timings of predict()
+        self.timing_hook = None
+        # Optional callable(stage) told which cascade stage answered each prediction (blank, fast or full)
+        self.exit_hook = None
+        # Optional semaphore shared by the recognizers of a process, capping how many predictions run at
+        # once so concurrent requests don't oversubscribe the cores TensorFlow and OpenCV already use
+        self.limiter = None
+        # Optional callable(image, target_char, result) receiving each recognized drawing; image is the
+        # preprocessed drawing, or a callable producing it when the cascade answered without preprocessing
+        self.capture_hook = None
+
+        logger.info("Model initialized with %d classes (%s%s)", len(self.labels),
+                    'centroid index' if self.index is not None else 'softmax',
+                    ', fast first stage' if self.fast_stage is not None else '')
+        logger.debug("Characters recognized: %s", list(self.label_encoder['index_to_char'].values()))
     
-    def preprocess_drawing(self, image_data):
+    def decode_drawing(self, image_data):
         """
-        Preprocess drawing from canvas for 28x28 model
+        Decode a canvas drawing (base64 data URL or array) into a grayscale array
         """
-        # Convert base64 to image
-        if isinstance(image_data, str):
-            # Remove data URL prefix if present
-            if ',' in image_data:
-                image_data = image_data.split(',')[1]
-            
-            # Decode base64
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(BytesIO(image_bytes))
-        else:
-            image = Image.fromarray(image_data)
-        
-        # Convert to grayscale
-        if image.mode != 'L':
-            image = image.convert('L')
-        
-        # Convert to numpy array
-        img_array = np.array(image)
-        
-        # Invert colors (canvas is white background, black drawing)
-        img_array = 255 - img_array
-        
-        # Apply threshold to make lines clearer
-        _, binary = cv2.threshold(img_array, 25, 255, cv2.THRESH_BINARY)
-        
-        # Find contours to extract character
-        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        if contours:
-            # Get bounding box of all contours
-            all_contours = np.vstack(contours)
-            x, y, w, h = cv2.boundingRect(all_contours)
-            
-            # Add small padding
-            padding = 5
-            x = max(0, x - padding)
-            y = max(0, y - padding)
-            w = min(img_array.shape[1] - x, w + 2 * padding)
-            h = min(img_array.shape[0] - y, h + 2 * padding)
-            
-            # Crop to character
-            cropped = img_array[y:y+h, x:x+w]
-            
-            # Create square canvas
-            size = 28
-            max_dim = max(w, h)
-            scale = size / max_dim
-            new_h, new_w = int(h * scale), int(w * scale)
-            
-            # Resize maintaining aspect ratio
-            resized = cv2.resize(cropped, (new_w, new_h))
-            
-            # Create square image with padding
-            square = np.zeros((size, size), dtype=np.uint8)
-            
-            # Center the character
-            y_offset = (size - new_h) // 2
-            x_offset = (size - new_w) // 2
-            square[y_offset:y_offset+new_h, x_offset:x_offset+new_w] = resized
-        else:
-            # If no contours found, resize the entire image
-            square = cv2.resize(img_array, (28, 28))
-        
-        # Normalize
-        final_image = square.astype('float32') / 255.0
-        
-        return final_image
+        return decode_drawing(image_data)
+
+    def preprocess_drawing(self, image_data, out=None):
+        """
+        Preprocess drawing from canvas for 28x28 model (into `out` if given)
+        """
+        return preprocess_drawing(image_data, out=out)
     
+    def full_scores(self, processed_images):
+        """
+        Class scores of the full model (or centroid index) for a batch of preprocessed 28x28 drawings
+        """
+        # Add the channel dimension
+        image_input = np.asarray(processed_images)[..., np.newaxis]
+        started = time.perf_counter()
+        if self.index is not None:
+            embeddings = self.embedder.predict(image_input, batch_size=len(image_input), verbose=0)
+            started = self._record_stage('model', started)
+            scores = np.stack([self.index.scores(embedding) for embedding in embeddings])
+            self._record_stage('search', started)
+        else:
+            scores = self.model.predict(image_input, batch_size=len(image_input), verbose=0)
+            self._record_stage('model', started)
+        return scores
+
+    def top_predictions(self, scores, k=3):
+        """
+        The k best classes of a score vector, best first (partial selection instead of sorting every class)
+        """
+        k = min(k, len(scores))
+        indices = np.argpartition(scores, -k)[-k:]
+        indices = indices[np.argsort(scores[indices])[::-1]]
+        # Romaji falls back to the character itself
+        return [{'character': char, 'confidence': float(scores[i]), 'romaji': self.char_to_romaji.get(char, char)}
+                for i, char in zip(indices, self.labels[indices])]
+
     def predict(self, image_data, target_char=None):
         """
-        Predict character from drawing
+        Predict character from drawing, once the limiter (if any) has a free slot
         """
+        if self.limiter is None:
+            return self._predict(image_data, target_char)
+        started = time.perf_counter()
+        with self.limiter:
+            self._record_stage('wait', started)
+            return self._predict(image_data, target_char)
+
+    def _predict(self, image_data, target_char):
         try:
-            # Preprocess the drawing
-            processed_image = self.preprocess_drawing(image_data)
-            
-            # Add batch and channel dimensions
-            image_input = np.expand_dims(processed_image, axis=0)  # Add batch dimension
-            image_input = np.expand_dims(image_input, axis=-1)     # Add channel dimension
-            
-            # Predict
-            predictions = self.model.predict(image_input, verbose=0)
+            started = time.perf_counter()
+            decoded = self.decode_drawing(image_data)
+            started = self._record_stage('decode', started)
+
+            # Blank canvas: nothing to recognize, skip the models entirely
+            if self.min_ink and ink_fraction(decoded) < self.min_ink:
+                self._record_stage('ink', started)
+                self._record_exit('blank')
+                return {
+                    'success': True,
+                    'recognized_text': '',
+                    'romaji': '',
+                    'confidence': 0.0,
+                    'is_correct': False,
+                    'message': "✏️ Nothing drawn yet. Draw the character first!",
+                    'top_predictions': [],
+                    'stage': 'blank',
+                }
+            started = self._record_stage('ink', started)
+
+            # Clear drawings are answered by the fast stage; the rest go through the full model
+            scores = None
+            processed_image = None
+            if self.fast_stage is not None:
+                fast_scores = self.fast_stage.scores(decoded)
+                started = self._record_stage('fast', started)
+                if fast_scores.max() >= self.fast_confidence:
+                    scores, stage = fast_scores, 'fast'
+
+            if scores is None:
+                processed_image = self.preprocess_drawing(decoded)
+                self._record_stage('preprocess', started)
+                scores, stage = self.full_scores(processed_image[np.newaxis])[0], 'full'
+            started = time.perf_counter()
+            self._record_exit(stage)
             
             # Get top predictions
-            top_3_indices = np.argsort(predictions[0])[-3:][::-1]
-            top_3_confidences = predictions[0][top_3_indices]
-            
-            # Decode predictions
-            top_3_chars = [self.label_encoder['index_to_char'][i] for i in top_3_indices]
+            top_predictions = self.top_predictions(scores)
             
             # Get the best prediction
-            best_char = top_3_chars[0]
-            best_confidence = float(top_3_confidences[0])
+            best_char = top_predictions[0]['character']
+            best_confidence = top_predictions[0]['confidence']
             
             # Get romaji if available
-            romaji = self.char_to_romaji.get(best_char, best_char)  # Fallback to character itself
+            romaji = top_predictions[0]['romaji']
             
             # Check if correct
             is_correct = False
@@ -176,17 +228,20 @@ class HiraganaRecognizer:
                 'confidence': best_confidence,
                 'is_correct': is_correct,
                 'message': self.get_message(is_correct, best_confidence),
-                'top_predictions': [
-                    {'character': char, 'confidence': float(conf), 'romaji': self.char_to_romaji.get(char, char)}
-                    for char, conf in zip(top_3_chars, top_3_confidences)
-                ]
+                'top_predictions': top_predictions,
+                'stage': stage,
             }
+            self._record_stage('postprocess', started)
+            
+            if self.capture_hook is not None:
+                if processed_image is None:
+                    processed_image = functools.partial(self.preprocess_drawing, decoded)
+                self.capture_hook(processed_image, target_char, result)
             
             return result
             
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            logger.exception("Prediction failed")
             return {
                 'success': False,
                 'error': str(e),
@@ -194,6 +249,17 @@ class HiraganaRecognizer:
                 'is_correct': False
             }
     
+    def _record_stage(self, stage, started):
+        # Report the time since `started` to the timing hook and return the new start time
+        now = time.perf_counter()
+        if self.timing_hook is not None:
+            self.timing_hook(stage, now - started)
+        return now
+
+    def _record_exit(self, stage):
+        if self.exit_hook is not None:
+            self.exit_hook(stage)
+
     def get_message(self, is_correct, confidence):
         """
         Generate appropriate message based on prediction
@@ -222,9 +288,8 @@ def get_recognizer():
     if _recognizer_instance is None:
         try:
             _recognizer_instance = HiraganaRecognizer()
-            print("✅ Hiragana recognizer created successfully")
-        except Exception as e:
-            print(f"❌ Failed to create recognizer: {e}")
+        except Exception:
+            logger.exception("Failed to create recognizer")
             _recognizer_instance = None
     return _recognizer_instance
 
@@ -0,0 +1,235 @@
+import argparse
+import base64
+import threading
+import time
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Drawing decoding and preprocessing, kept free of TensorFlow so data-loading worker processes can use it
+
+IMAGE_SIZE = 28
+# A pixel is ink when darker than this (inverted: brighter than 25)
+INK_LEVEL = 230
+# Margin kept around the ink's bounding box, in canvas pixels
+PADDING = 5
+# Bilinear, as the shipped models were trained with. cv2.INTER_AREA averages every canvas pixel instead of
+# sampling a few, but changes what a model sees: compare both with the benchmark below before switching.
+INTERPOLATION = cv2.INTER_LINEAR
+
+# Per-thread scratch buffers: the ink mask of the last canvas size and the uint8 28x28 square
+_buffers = threading.local()
+
+
+def decode_drawing(image_data):
+    """
+    Decode a canvas drawing (base64 data URL, encoded image bytes or array) into a grayscale array
+    """
+    # Already decoded
+    if isinstance(image_data, np.ndarray) and image_data.ndim == 2 and image_data.dtype == np.uint8:
+        return image_data
+
+    if isinstance(image_data, str):
+        # Remove data URL prefix if present
+        image_data = base64.b64decode(image_data.rpartition(',')[2])
+
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        # Straight from the encoded buffer to one grayscale array, no intermediate RGB(A) image
+        gray = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError('Drawing is not a decodable image')
+        return gray
+
+    image = np.asarray(image_data)
+    if image.ndim == 3:
+        code = cv2.COLOR_RGBA2GRAY if image.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+        image = cv2.cvtColor(np.ascontiguousarray(image, dtype=np.uint8), code)
+    return np.ascontiguousarray(image, dtype=np.uint8)
+
+
+def _mask_buffer(shape):
+    mask = getattr(_buffers, 'mask', None)
+    if mask is None or mask.shape != shape:
+        mask = _buffers.mask = np.empty(shape, dtype=np.uint8)
+    return mask
+
+
+def _square_buffer():
+    square = getattr(_buffers, 'square', None)
+    if square is None:
+        square = _buffers.square = np.empty((IMAGE_SIZE, IMAGE_SIZE), dtype=np.uint8)
+    return square
+
+
+def preprocess_drawing(image_data, out=None, interpolation=INTERPOLATION):
+    """
+    Preprocess drawing from canvas for 28x28 model: the ink cropped with a small margin, scaled to fit
+    and centred, inverted to white on black, as float32 in [0, 1]. The decoded canvas is never copied or
+    modified; the only full-size pass besides decoding is the ink mask, written into a reused buffer.
+    `out` is an optional float32 28x28 array (e.g. a row of a batch) to write the result into.
+    """
+    gray = decode_drawing(image_data)
+
+    # Ink mask (the inverted canvas above 25) and its bounding box
+    mask = _mask_buffer(gray.shape)
+    cv2.threshold(gray, INK_LEVEL - 1, 255, cv2.THRESH_BINARY_INV, dst=mask)
+    x, y, w, h = cv2.boundingRect(mask)
+
+    # Scaled in the canvas' own polarity on a white square, inverted in place afterwards
+    square = _square_buffer()
+    square.fill(255)
+    if w and h:
+        x = max(0, x - PADDING)
+        y = max(0, y - PADDING)
+        w = min(gray.shape[1] - x, w + 2 * PADDING)
+        h = min(gray.shape[0] - y, h + 2 * PADDING)
+
+        # Fit the longer side, keep the aspect ratio and centre the other one
+        scale = IMAGE_SIZE / max(w, h)
+        new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
+        x_offset = (IMAGE_SIZE - new_w) // 2
+        y_offset = (IMAGE_SIZE - new_h) // 2
+        cv2.resize(gray[y:y + h, x:x + w], (new_w, new_h),
+                   dst=square[y_offset:y_offset + new_h, x_offset:x_offset + new_w], interpolation=interpolation)
+    else:
+        # No ink: scale the entire canvas
+        cv2.resize(gray, (IMAGE_SIZE, IMAGE_SIZE), dst=square, interpolation=interpolation)
+    cv2.bitwise_not(square, dst=square)
+
+    if out is None:
+        out = np.empty((IMAGE_SIZE, IMAGE_SIZE), dtype=np.float32)
+    np.divide(square, np.float32(255), out=out)
+    return out
+
+
+def reference_preprocess_drawing(image_data):
+    """
+    The previous pipeline (PIL decode, full-size inverted and thresholded copies, contour bounding box),
+    kept as the baseline of the benchmark below
+    """
+    if isinstance(image_data, np.ndarray):
+        img_array = image_data
+    else:
+        image = Image.open(BytesIO(base64.b64decode(image_data.split(',')[1])))
+        if image.mode != 'L':
+            image = image.convert('L')
+        img_array = np.array(image)
+
+    img_array = 255 - img_array
+    _, binary = cv2.threshold(img_array, 25, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    if contours:
+        x, y, w, h = cv2.boundingRect(np.vstack(contours))
+        x = max(0, x - PADDING)
+        y = max(0, y - PADDING)
+        w = min(img_array.shape[1] - x, w + 2 * PADDING)
+        h = min(img_array.shape[0] - y, h + 2 * PADDING)
+        cropped = img_array[y:y + h, x:x + w]
+
+        scale = IMAGE_SIZE / max(w, h)
+        new_h, new_w = int(h * scale), int(w * scale)
+        resized = cv2.resize(cropped, (new_w, new_h))
+        square = np.zeros((IMAGE_SIZE, IMAGE_SIZE), dtype=np.uint8)
+        y_offset = (IMAGE_SIZE - new_h) // 2
+        x_offset = (IMAGE_SIZE - new_w) // 2
+        square[y_offset:y_offset + new_h, x_offset:x_offset + new_w] = resized
+    else:
+        square = cv2.resize(img_array, (IMAGE_SIZE, IMAGE_SIZE))
+
+    return square.astype('float32') / 255.0
+
+
+def _time_per_drawing(function, drawings, repeat):
+    # Best of `repeat` passes over the drawings, in microseconds per drawing
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for drawing in drawings:
+            function(drawing)
+        best = min(best, time.perf_counter() - started)
+    return best / len(drawings) * 1e6
+
+
+def benchmark(drawings, repeat=5):
+    """
+    Microseconds per drawing of the reference and current pipelines, from data URLs (decode included)
+    and from decoded canvases, plus the largest pixel difference between their outputs
+    """
+    decoded = [decode_drawing(drawing) for drawing in drawings]
+    batch = np.empty((len(drawings), IMAGE_SIZE, IMAGE_SIZE), dtype=np.float32)
+    for row, drawing in enumerate(decoded):
+        preprocess_drawing(drawing, out=batch[row])
+    reference = np.stack([reference_preprocess_drawing(drawing) for drawing in decoded])
+    return {
+        'drawings': len(drawings),
+        'reference_url_us': _time_per_drawing(reference_preprocess_drawing, drawings, repeat),
+        'current_url_us': _time_per_drawing(preprocess_drawing, drawings, repeat),
+        'reference_decoded_us': _time_per_drawing(reference_preprocess_drawing, decoded, repeat),
+        'current_decoded_us': _time_per_drawing(preprocess_drawing, decoded, repeat),
+        'max_difference': float(np.abs(batch - reference).max()),
+        'mean_difference': float(np.abs(batch - reference).mean()),
+    }
+
+
+def compare_accuracy(recognizer, drawings, labels):
+    """
+    Top-1 accuracy of a recognizer's full model on the reference pipeline and on the current one with
+    bilinear and area interpolation, and how often each answers the same as the reference
+    """
+    labels = np.asarray(labels, dtype=object)
+    reference = recognizer.full_scores(np.stack([reference_preprocess_drawing(d) for d in drawings])).argmax(axis=1)
+    rows = [{'pipeline': 'reference', 'accuracy': float((recognizer.labels[reference] == labels).mean()),
+             'agreement': 1.0}]
+    for name, interpolation in (('bilinear', cv2.INTER_LINEAR), ('area', cv2.INTER_AREA)):
+        batch = np.empty((len(drawings), IMAGE_SIZE, IMAGE_SIZE), dtype=np.float32)
+        for row, drawing in enumerate(drawings):
+            preprocess_drawing(drawing, out=batch[row], interpolation=interpolation)
+        answers = recognizer.full_scores(batch).argmax(axis=1)
+        rows.append({'pipeline': name, 'accuracy': float((recognizer.labels[answers] == labels).mean()),
+                     'agreement': float((answers == reference).mean())})
+    return rows
+
+
+def main(argv=None):
+    from app.model.synthetic import render_strokes, synthetic_drawing, synthetic_strokes
+
+    parser = argparse.ArgumentParser(description='Benchmark drawing preprocessing against the previous pipeline')
+    parser.add_argument('--synthetic', type=int, default=500, help='Number of synthetic drawings to time')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--images', help='Labelled drawings under <images>/<character>/*.png for the accuracy check')
+    parser.add_argument('--model-dir', help='Artifact directory of the model for the accuracy check')
+    args = parser.parse_args(argv)
+
+    result = benchmark([synthetic_drawing(seed) for seed in range(args.synthetic)], args.repeat)
+    print(f"{result['drawings']} synthetic drawings, microseconds per drawing:")
+    print(f"{'':>16} {'reference':>10} {'current':>10} {'speedup':>8}")
+    for source in ('url', 'decoded'):
+        before, after = result[f'reference_{source}_us'], result[f'current_{source}_us']
+        print(f"{'from ' + source:>16} {before:>10.1f} {after:>10.1f} {before / after:>7.2f}x")
+    print(f"Pixel difference: max {result['max_difference']:.3f}, mean {result['mean_difference']:.4f}")
+
+    if args.model_dir:
+        from app.model.dataset import read_image_directory
+        from app.model.predict_character import HiraganaRecognizer
+        from app.model.registry import resolve_model_path
+
+        recognizer = HiraganaRecognizer(model_path=resolve_model_path(args.model_dir), base_dir=args.model_dir,
+                                        use_index=False, use_cascade=False)
+        if args.images:
+            drawings, labels = read_image_directory(args.images)
+        else:
+            # Without labelled drawings, only the agreement between the two pipelines is meaningful
+            drawings = [np.array(render_strokes(synthetic_strokes(seed))) for seed in range(args.synthetic)]
+            labels = [''] * len(drawings)
+        print(f"{'pipeline':>10} {'accuracy':>9} {'same answer':>12}")
+        for row in compare_accuracy(recognizer, drawings, labels):
+            accuracy = f"{row['accuracy']:.2%}" if args.images else '-'
+            print(f"{row['pipeline']:>10} {accuracy:>9} {row['agreement']:>12.2%}")
+
+
+if __name__ == '__main__':
+    # Usage: python -m app.model.preprocess [--synthetic 500] [--model-dir app/model --images <dir>]
+    main()
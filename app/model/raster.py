@@ -0,0 +1,155 @@
+import math
+import threading
+
+import numpy as np
+
+from app.model.preprocess import IMAGE_SIZE, PADDING
+
+# The drawing page's canvas and pen (see synthetic.py)
+CANVAS_WIDTH = 500
+CANVAS_HEIGHT = 400
+LINE_WIDTH = 25
+
+
+class StrokeRaster:
+    """
+    The 28x28 model input of a drawing built from its pen strokes instead of a canvas image, kept up
+    to date as points arrive. preprocess_drawing crops the canvas to the ink, scales it bilinearly and
+    centres it; each output pixel is then the canvas sampled at one point. Here those sample points
+    are computed from the same crop and scale, and a pixel is ink when its sample point lies within
+    the pen radius of a stroke. The distance of each sample point to the nearest stroke segment is
+    kept, so new segments only update it, and everything is recomputed only when the crop changes.
+    Memory is the points plus a few 28x28 arrays, whatever the canvas size.
+    """
+
+    def __init__(self, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, line_width=LINE_WIDTH, max_points=5000):
+        self.width = width
+        self.height = height
+        self.radius = line_width / 2
+        self.max_points = max_points
+        self.strokes = {}  # stroke id -> [(x, y), ...], in drawing order
+        self.points = 0
+        self._segments = []  # segments not yet in the distance field: ((x0, y0), (x1, y1))
+        self._box = None  # extent of the ink: [x_min, y_min, x_max, y_max]
+        self._frame = None  # crop and scale the distance field was computed for
+        self._samples = None  # canvas coordinates of each output pixel's sample point, (28, 28, 2)
+        self._distance = np.full((IMAGE_SIZE, IMAGE_SIZE), np.inf, dtype=np.float32)
+        # Strokes arrive on the event loop and are rendered on the inference pool
+        self._lock = threading.Lock()
+
+    def add(self, stroke_id, points):
+        """
+        Append points to a stroke (a new id starts a new stroke). Returns False once the drawing
+        has reached max_points and the points were ignored.
+        """
+        with self._lock:
+            if self.points + len(points) > self.max_points:
+                return False
+            stroke = self.strokes.setdefault(stroke_id, [])
+            for point in points:
+                x = min(max(float(point[0]), 0.0), self.width)
+                y = min(max(float(point[1]), 0.0), self.height)
+                # A dot is a segment of length zero
+                self._segments.append((stroke[-1] if stroke else (x, y), (x, y)))
+                stroke.append((x, y))
+                self._extend_box(x, y)
+            self.points += len(points)
+            return True
+
+    def remove(self, stroke_id):
+        """
+        Remove a stroke (undo)
+        """
+        with self._lock:
+            stroke = self.strokes.pop(stroke_id, None)
+            if stroke is not None:
+                self.points -= len(stroke)
+                self._rebuild()
+
+    def clear(self):
+        with self._lock:
+            self.strokes.clear()
+            self.points = 0
+            self._rebuild()
+
+    def _rebuild(self):
+        # A fresh extent; render() then recomputes the distance field for the new crop
+        self._segments = []
+        self._box = None
+        self._frame = None
+        for stroke in self.strokes.values():
+            for x, y in stroke:
+                self._extend_box(x, y)
+
+    def _extend_box(self, x, y):
+        if self._box is None:
+            self._box = [x, y, x, y]
+        else:
+            box = self._box
+            box[0], box[1], box[2], box[3] = min(box[0], x), min(box[1], y), max(box[2], x), max(box[3], y)
+
+    def _crop(self):
+        # The crop preprocess_drawing would take: the ink's pixel bounding box plus padding, inside the canvas
+        x_min, y_min, x_max, y_max = self._box
+        x = max(0, math.floor(x_min - self.radius))
+        y = max(0, math.floor(y_min - self.radius))
+        w = min(self.width, math.ceil(x_max + self.radius)) - x
+        h = min(self.height, math.ceil(y_max + self.radius)) - y
+        x, y = max(0, x - PADDING), max(0, y - PADDING)
+        w, h = min(self.width - x, w + 2 * PADDING), min(self.height - y, h + 2 * PADDING)
+        scale = IMAGE_SIZE / max(w, h, 1)
+        return x, y, max(1, w), max(1, h), max(1, int(w * scale)), max(1, int(h * scale))
+
+    def _sample_points(self, frame):
+        # Bilinear resizing samples the crop at the centre of each output pixel
+        x, y, w, h, new_w, new_h = frame
+        samples = np.full((IMAGE_SIZE, IMAGE_SIZE, 2), np.nan, dtype=np.float32)
+        x_offset, y_offset = (IMAGE_SIZE - new_w) // 2, (IMAGE_SIZE - new_h) // 2
+        columns = x + (np.arange(new_w, dtype=np.float32) + 0.5) * (w / new_w)
+        rows = y + (np.arange(new_h, dtype=np.float32) + 0.5) * (h / new_h)
+        samples[y_offset:y_offset + new_h, x_offset:x_offset + new_w, 0] = columns[np.newaxis, :]
+        samples[y_offset:y_offset + new_h, x_offset:x_offset + new_w, 1] = rows[:, np.newaxis]
+        return samples
+
+    def _update_distance(self, segments, chunk=256):
+        points = self._samples.reshape(-1, 1, 2)
+        for begin in range(0, len(segments), chunk):
+            starts = np.array([segment[0] for segment in segments[begin:begin + chunk]], dtype=np.float32)
+            ends = np.array([segment[1] for segment in segments[begin:begin + chunk]], dtype=np.float32)
+            direction = ends - starts
+            length = np.maximum((direction ** 2).sum(axis=1), 1e-12)
+            # Distance of every sample point to every new segment, then the minimum over old and new.
+            # Points outside the crop are NaN, which fmin ignores, so they stay infinitely far.
+            t = np.clip(((points - starts) * direction).sum(axis=2) / length, 0, 1)
+            nearest = starts + t[..., np.newaxis] * direction
+            distance = np.sqrt(((points - nearest) ** 2).sum(axis=2)).min(axis=1)
+            np.fmin(self._distance, distance.reshape(IMAGE_SIZE, IMAGE_SIZE), out=self._distance)
+
+    def render(self, out=None):
+        """
+        The drawing as preprocess_drawing would return it for the canvas: float32 28x28 in [0, 1],
+        white ink on black (all zeros before the first stroke)
+        """
+        with self._lock:
+            if out is None:
+                out = np.empty((IMAGE_SIZE, IMAGE_SIZE), dtype=np.float32)
+            if self._box is None:
+                out.fill(0)
+                return out
+
+            frame = self._crop()
+            if frame != self._frame:
+                # The crop moved: every sample point did too
+                self._frame = frame
+                self._samples = self._sample_points(frame)
+                self._distance.fill(np.inf)
+                self._segments = [segment for stroke in self.strokes.values()
+                                  for segment in zip([stroke[0]] + stroke[:-1], stroke)]
+            if self._segments:
+                self._update_distance(self._segments)
+                self._segments = []
+
+            # Full ink inside the pen radius, fading over one canvas pixel at its edge like the
+            # antialiased canvas does
+            np.clip(self.radius + 0.5 - self._distance, 0, 1, out=out)
+            return out
@@ -0,0 +1,291 @@
+import functools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.config import Config
+from app.model.predict_character import HiraganaRecognizer
+from app.model.runtime import configure_runtime
+
+logger = logging.getLogger(__name__)
+
+# The original Hiragana artifacts live directly in app/model
+LEGACY_DIR = os.path.dirname(os.path.abspath(__file__))
+LEGACY_MODEL = 'hiragana_model.keras'
+MODEL_FILE = 'model.keras'
+# Versioned layout: <course>/versions/<version>/ artifact directories, <course>/CURRENT naming the active one
+VERSIONS_DIR = 'versions'
+CURRENT_FILE = 'CURRENT'
+
+
+def resolve_model_path(directory):
+    """
+    Model file of an artifact directory (app/model itself holds the Hiragana model under its original name)
+    """
+    path = os.path.join(directory, MODEL_FILE)
+    if not os.path.exists(path) and os.path.abspath(directory) == LEGACY_DIR:
+        return os.path.join(LEGACY_DIR, LEGACY_MODEL)
+    return path
+
+
+class RecognizerUnavailable(Exception):
+    """
+    Raised when a course has no recognizer artifacts
+    """
+
+
+def model_size(model):
+    # Bytes held by the weights, the bulk of a loaded model's memory
+    return int(sum(np.prod(weight.shape) * np.dtype(weight.dtype).itemsize for weight in model.weights))
+
+
+def warm_up(recognizer, rounds):
+    """
+    Run synthetic drawings through a freshly loaded recognizer, so its first real request
+    doesn't pay for graph tracing and lazy allocations
+    """
+    from app.model.synthetic import synthetic_drawing
+
+    started = time.perf_counter()
+    for seed in range(rounds):
+        recognizer.predict(synthetic_drawing(seed))
+    # The cascade may have answered those without the full model
+    recognizer.full_scores(np.zeros((1, 28, 28), dtype=np.float32))
+    return time.perf_counter() - started
+
+
+class RecognizerRegistry:
+    """
+    Recognizers keyed by course name, loaded from <model_dir>/<course>/ on first use.
+    Loaded models stay resident while their combined size fits the memory budget; beyond it
+    the least recently used ones are dropped (requests still holding one finish normally).
+    A course directory may hold versioned artifacts; a newly activated version is loaded and
+    warmed up next to the serving one, then swapped in, so requests never wait for a load.
+    """
+
+    def __init__(self, model_dir, budget_mb, timing_hook=None, exit_hook=None, min_ink=0.001, fast_confidence=0.98,
+                 warmup_rounds=3, watch_interval=0, concurrency=0):
+        self.model_dir = model_dir
+        self.budget = int(budget_mb * 1024 * 1024)
+        # Optional callable(stage, seconds, course=...) attached to every loaded recognizer
+        self.timing_hook = timing_hook
+        # Optional callable(stage, course=...) counting which cascade stage answered
+        self.exit_hook = exit_hook
+        # Optional callable(image, target_char, result, course=...) receiving recognized drawings
+        self.capture_hook = None
+        self.min_ink = min_ink
+        self.fast_confidence = fast_confidence
+        self.warmup_rounds = warmup_rounds
+        # Seconds between checks for a newly activated version (0 = only on request)
+        self.watch_interval = watch_interval
+        # Predictions running at once across every loaded recognizer, warm-ups included (0 = no limit)
+        self.limiter = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self._loaded = OrderedDict()  # course -> (recognizer, size), least recently used first
+        self._lock = threading.Lock()
+        self._loading = {}  # course -> lock, so concurrent first requests load a model once
+        self._watcher_pid = None
+
+    def course_dir(self, course_name):
+        return os.path.join(self.model_dir, course_name.lower())
+
+    def versions(self, course_name):
+        """
+        Versions available for a course, in name order
+        """
+        directory = os.path.join(self.course_dir(course_name), VERSIONS_DIR)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name for name in os.listdir(directory)
+                      if os.path.exists(os.path.join(directory, name, MODEL_FILE)))
+
+    def active_version(self, course_name):
+        """
+        The version named in CURRENT, or the last one by name when there is no CURRENT file
+        """
+        versions = self.versions(course_name)
+        try:
+            with open(os.path.join(self.course_dir(course_name), CURRENT_FILE), encoding='utf-8') as f:
+                current = f.read().strip()
+        except FileNotFoundError:
+            current = None
+        if current in versions:
+            return current
+        return versions[-1] if versions else None
+
+    def activate(self, course_name, version):
+        """
+        Make a version the active one (every worker watching the directory follows)
+        """
+        if version not in self.versions(course_name):
+            raise RecognizerUnavailable(f'{course_name} has no model version {version}')
+        path = os.path.join(self.course_dir(course_name), CURRENT_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(version + '\n')
+        os.replace(path + '.tmp', path)
+
+    def artifact_dir(self, course_name):
+        """
+        (directory, model path, version) of a course's active artifacts, or None if it has no model
+        """
+        directory = self.course_dir(course_name)
+        version = self.active_version(course_name)
+        if version is not None:
+            version_dir = os.path.join(directory, VERSIONS_DIR, version)
+            return version_dir, os.path.join(version_dir, MODEL_FILE), version
+        if os.path.exists(os.path.join(directory, MODEL_FILE)):
+            return directory, os.path.join(directory, MODEL_FILE), 'unversioned'
+        if course_name.lower() == 'hiragana' and os.path.exists(os.path.join(LEGACY_DIR, LEGACY_MODEL)):
+            return LEGACY_DIR, os.path.join(LEGACY_DIR, LEGACY_MODEL), 'legacy'
+        return None
+
+    def available(self, course_name):
+        return self.artifact_dir(course_name) is not None
+
+    def get(self, course_name):
+        """
+        The recognizer of a course, loading it if needed (raises RecognizerUnavailable)
+        """
+        key = course_name.lower()
+        if self.watch_interval and self._watcher_pid != os.getpid():
+            self._start_watcher()
+        with self._lock:
+            entry = self._loaded.get(key)
+            if entry is not None:
+                self._loaded.move_to_end(key)
+                return entry[0]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Another request may have finished loading it while we waited
+            with self._lock:
+                entry = self._loaded.get(key)
+                if entry is not None:
+                    self._loaded.move_to_end(key)
+                    return entry[0]
+
+            return self._load(course_name)
+
+    def preload(self, course_names):
+        """
+        Load and warm up recognizers before the first request, logging failures. Servers call it in
+        each worker process: a TensorFlow runtime created before a fork hangs the child on its first prediction.
+        """
+        for course_name in course_names:
+            try:
+                self.get(course_name)
+            except Exception:
+                logger.exception("Failed to load the %s recognizer", course_name)
+
+    def reload(self, course_name, force=False):
+        """
+        Load the course's active version next to the one serving, warm it up and swap it in.
+        Requests already holding the previous recognizer finish on it. Returns the serving recognizer.
+        """
+        key = course_name.lower()
+        with self._lock:
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                entry = self._loaded.get(key)
+            artifacts = self.artifact_dir(course_name)
+            if entry is not None and artifacts is not None and entry[0].version == artifacts[2] and not force:
+                return entry[0]
+            return self._load(course_name, previous=entry[0] if entry else None)
+
+    def reload_in_background(self, course_name, force=False):
+        def run():
+            try:
+                self.reload(course_name, force)
+            except Exception:
+                logger.exception("Failed to reload the %s recognizer", course_name)
+
+        threading.Thread(target=run, name=f'reload-{course_name.lower()}', daemon=True).start()
+
+    def _load(self, course_name, previous=None):
+        # Called with the course's load lock held
+        key = course_name.lower()
+        artifacts = self.artifact_dir(course_name)
+        if artifacts is None:
+            raise RecognizerUnavailable(f'No recognizer available for {course_name}')
+
+        base_dir, model_path, version = artifacts
+        # Thread pools are sized before the first model of the process (a no-op afterwards)
+        configure_runtime()
+        recognizer = HiraganaRecognizer(model_path=model_path, base_dir=base_dir, min_ink=self.min_ink,
+                                        fast_confidence=self.fast_confidence)
+        recognizer.version = version
+        # A warm-up competes for the cores like any request
+        recognizer.limiter = self.limiter
+        # Before the hooks are attached, so warm-up drawings stay out of the metrics and the drawing store
+        warmup_seconds = warm_up(recognizer, self.warmup_rounds)
+        if self.timing_hook is not None:
+            recognizer.timing_hook = functools.partial(self.timing_hook, course=key)
+        if self.exit_hook is not None:
+            recognizer.exit_hook = functools.partial(self.exit_hook, course=key, version=version)
+        if self.capture_hook is not None:
+            recognizer.capture_hook = functools.partial(self.capture_hook, course=key)
+        size = model_size(recognizer.model)
+
+        with self._lock:
+            self._loaded[key] = (recognizer, size)
+            self._loaded.move_to_end(key)
+            self._evict(keep=key)
+        if previous is None:
+            logger.info("Loaded %s recognizer %s (%.1f MB, warmed up in %.2fs) from %s", course_name, version,
+                        size / 1024 / 1024, warmup_seconds, base_dir)
+        else:
+            logger.info("Swapped %s recognizer %s -> %s (warmed up in %.2fs)", course_name, previous.version,
+                        version, warmup_seconds)
+        return recognizer
+
+    def _start_watcher(self):
+        # One watcher thread per process, started lazily since threads do not survive fork
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name='model-watcher', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            with self._lock:
+                serving = [(course, recognizer.version) for course, (recognizer, _) in self._loaded.items()]
+            for course, version in serving:
+                try:
+                    artifacts = self.artifact_dir(course)
+                    if artifacts is not None and artifacts[2] != version:
+                        self.reload(course)
+                except Exception:
+                    logger.exception("Failed to reload the %s recognizer", course)
+
+    def _evict(self, keep):
+        # Called with the lock held; the model just loaded is always kept, even over budget
+        while self.resident_bytes() > self.budget and len(self._loaded) > 1:
+            course, (_, size) = next((item for item in self._loaded.items() if item[0] != keep))
+            del self._loaded[course]
+            logger.info("Evicted %s recognizer (%.1f MB) to stay within the model memory budget",
+                        course, size / 1024 / 1024)
+        if self.resident_bytes() > self.budget:
+            logger.warning("%s recognizer alone exceeds the model memory budget of %d MB",
+                           keep, self.budget // 1024 // 1024)
+
+    def resident_bytes(self):
+        return sum(size for _, size in self._loaded.values())
+
+    def loaded(self):
+        """
+        [(course, version, size in bytes)] of resident models, least recently used first
+        """
+        with self._lock:
+            return [(course, recognizer.version, size) for course, (recognizer, size) in self._loaded.items()]
+
+
+recognizers = RecognizerRegistry(Config.MODEL_DIR, Config.MODEL_MEMORY_BUDGET_MB,
+                                 min_ink=Config.CASCADE_MIN_INK, fast_confidence=Config.CASCADE_CONFIDENCE,
+                                 warmup_rounds=Config.MODEL_WARMUP_ROUNDS, watch_interval=Config.MODEL_WATCH_INTERVAL,
+                                 concurrency=Config.INFERENCE_CONCURRENCY)
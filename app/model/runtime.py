@@ -0,0 +1,234 @@
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Set once configure_runtime() has applied the Config thread settings in this process
+_configured = False
+
+# Seconds a benchmark process may take to load and warm up its model, on top of the load duration
+STARTUP_TIMEOUT = 300
+
+
+def configure_tensorflow(intra_op_threads=0, inter_op_threads=0):
+    """
+    Set TensorFlow's thread pool sizes (0 keeps TensorFlow's default of one thread per core).
+    Must run before the first TensorFlow op, i.e. before the recognizer is loaded.
+    """
+    if intra_op_threads:
+        os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op_threads)
+        os.environ.setdefault('OMP_NUM_THREADS', str(intra_op_threads))
+    if inter_op_threads:
+        os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op_threads)
+
+    import tensorflow as tf
+
+    try:
+        if intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        # TensorFlow was already initialized, the environment variables above no longer apply either
+        logger.warning("Could not set TensorFlow thread counts: %s", e)
+
+
+def configure_opencv(threads=0):
+    """
+    Set OpenCV's thread pool size (0 keeps OpenCV's default of one thread per core)
+    """
+    if threads:
+        import cv2
+
+        cv2.setNumThreads(threads)
+
+
+def configure_runtime():
+    """
+    Apply the Config thread settings of TensorFlow and OpenCV to this process, once.
+    Every entry point serving the recognizer calls it before the first model is loaded.
+    """
+    global _configured
+    if _configured:
+        return
+    from app.config import Config
+
+    configure_tensorflow(Config.TF_INTRA_OP_THREADS, Config.TF_INTER_OP_THREADS)
+    configure_opencv(Config.OPENCV_THREADS)
+    _configured = True
+
+
+def _bench_process(model_dir, setting, clients, duration, barrier, results):
+    # One simulated server process: the recognizer behind a limiter of `concurrency` slots (0 = no
+    # limiter, as with INFERENCE_CONCURRENCY), saturated by `clients` request threads for `duration` seconds
+    processes, intra, inter, opencv, concurrency = setting
+    configure_tensorflow(intra, inter)
+    configure_opencv(opencv)
+
+    from app.model.predict_character import HiraganaRecognizer
+    from app.model.registry import resolve_model_path, warm_up
+    from app.model.synthetic import synthetic_drawing
+
+    recognizer = HiraganaRecognizer(model_path=resolve_model_path(model_dir), base_dir=model_dir)
+    recognizer.limiter = threading.BoundedSemaphore(concurrency) if concurrency else None
+    drawings = [synthetic_drawing(seed) for seed in range(64)]
+    warm_up(recognizer, 3)
+
+    latencies = [[] for _ in range(clients)]
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+
+    def client(number):
+        for i in itertools.count(number):
+            started = time.perf_counter()
+            if started >= deadline:
+                return
+            recognizer.predict(drawings[i % len(drawings)])
+            latencies[number].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(np.concatenate([np.array(l) for l in latencies]))
+
+
+def _collect(workers, results, timeout):
+    # One result per benchmark process, failing instead of waiting forever when one of them dies
+    deadline = time.monotonic() + timeout
+    collected = []
+    try:
+        while len(collected) < len(workers):
+            try:
+                collected.append(results.get(timeout=1.0))
+            except queue.Empty:
+                failed = [worker.exitcode for worker in workers if worker.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f'a benchmark process exited with code {failed[0]}')
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'no result within {timeout:.0f}s')
+    except RuntimeError:
+        # The others may be stuck at the start barrier waiting for the failed one
+        for worker in workers:
+            worker.terminate()
+        raise
+    return collected
+
+
+def benchmark(model_dir, settings, clients=8, duration=5.0):
+    """
+    Requests/s and latency of the recognizer for each (processes, intra-op threads, inter-op threads,
+    OpenCV threads, inference concurrency) setting. Every setting runs in fresh processes, since thread
+    pools cannot be resized once TensorFlow is initialized; latency includes the wait for a limiter slot.
+    A setting whose processes crash or hang is reported and left out.
+    """
+    # spawn: each process starts without an initialized TensorFlow runtime
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    for setting in settings:
+        processes = setting[0]
+        barrier = context.Barrier(processes)
+        results = context.Queue()
+        workers = [context.Process(target=_bench_process,
+                                   args=(model_dir, setting, max(clients, setting[4]), duration, barrier, results))
+                   for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        row = {'processes': processes, 'intra': setting[1], 'inter': setting[2], 'opencv': setting[3],
+               'concurrency': setting[4]}
+        try:
+            latencies = np.concatenate(_collect(workers, results, STARTUP_TIMEOUT + duration))
+        except RuntimeError as e:
+            print(f"[ERROR] {format_setting(row)}: {e}")
+            continue
+        finally:
+            for worker in workers:
+                worker.join()
+
+        row.update({
+            'requests_per_second': len(latencies) / duration,
+            'p50_ms': float(np.percentile(latencies, 50)) * 1000 if len(latencies) else 0.0,
+            'p99_ms': float(np.percentile(latencies, 99)) * 1000 if len(latencies) else 0.0,
+        })
+        rows.append(row)
+        print(f"[INFO] {format_setting(row)}: {row['requests_per_second']:.0f} requests/s")
+    return rows
+
+
+def best_setting(rows, max_p99_ms=None):
+    """
+    Highest-throughput row, among those within the p99 latency budget if one is given
+    """
+    eligible = [row for row in rows if max_p99_ms is None or row['p99_ms'] <= max_p99_ms]
+    return max(eligible, key=lambda row: row['requests_per_second']) if eligible else None
+
+
+def format_setting(row):
+    def threads(count):
+        return str(count) if count else 'default'
+
+    return (f"{row['processes']} process(es), intra {threads(row['intra'])}, inter {threads(row['inter'])}, "
+            f"opencv {threads(row['opencv'])}, concurrency {row['concurrency'] or 'unlimited'}")
+
+
+def format_benchmark(rows, best):
+    lines = [f"{'processes':>9} {'intra':>7} {'inter':>7} {'opencv':>7} {'concurrency':>11} "
+             f"{'requests/s':>11} {'p50 ms':>8} {'p99 ms':>8}"]
+    for row in sorted(rows, key=lambda row: row['requests_per_second'], reverse=True):
+        lines.append(f"{row['processes']:>9} {row['intra'] or 'default':>7} {row['inter'] or 'default':>7} "
+                     f"{row['opencv'] or 'default':>7} {row['concurrency'] or 'unlimited':>11} "
+                     f"{row['requests_per_second']:>11.1f} "
+                     f"{row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+    lines.append('')
+    if best is None:
+        lines.append('No setting met the p99 budget')
+    else:
+        lines.append(f"Best: {format_setting(best)}")
+        lines.append(f"  WEB_CONCURRENCY={best['processes']} TF_INTRA_OP_THREADS={best['intra']} "
+                     f"TF_INTER_OP_THREADS={best['inter']} OPENCV_THREADS={best['opencv']} "
+                     f"INFERENCE_CONCURRENCY={best['concurrency']}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    from app.model.registry import LEGACY_DIR
+
+    cpu_count = os.cpu_count() or 1
+
+    def counts(value):
+        return sorted({int(count) for count in value.split(',')})
+
+    parser = argparse.ArgumentParser(
+        description='Sweep thread pool sizes, inference concurrency and process counts for recognizer throughput')
+    parser.add_argument('--model-dir', default=LEGACY_DIR, help='Artifact directory of the model to serve')
+    parser.add_argument('--processes', type=counts, default=counts(f'1,{cpu_count}'),
+                        help='Server worker processes (WEB_CONCURRENCY)')
+    parser.add_argument('--intra', type=counts, default=counts(f'1,{cpu_count}'),
+                        help='TensorFlow intra-op threads per process (0 = TensorFlow default)')
+    parser.add_argument('--inter', type=counts, default=[1], help='TensorFlow inter-op threads per process')
+    parser.add_argument('--opencv', type=counts, default=[1, 0], help='OpenCV threads per process (0 = default)')
+    parser.add_argument('--concurrency', type=counts, default=counts('1,2,4'),
+                        help='Predictions running at once per process (INFERENCE_CONCURRENCY, 0 = no limit)')
+    parser.add_argument('--clients', type=int, default=8, help='Request threads per process')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds of load per setting')
+    parser.add_argument('--max-p99-ms', type=float, help='Only recommend settings within this p99 latency')
+    args = parser.parse_args(argv)
+
+    settings = list(itertools.product(args.processes, args.intra, args.inter, args.opencv, args.concurrency))
+    print(f"[INFO] {len(settings)} settings on {cpu_count} cores, {args.duration:g}s each")
+    rows = benchmark(args.model_dir, settings, args.clients, args.duration)
+    print(format_benchmark(rows, best_setting(rows, args.max_p99_ms)))
+
+
+if __name__ == '__main__':
+    # Usage: python -m app.model.runtime [--processes 1,4] [--intra 1,4] [--concurrency 1,2,4] [--duration 5]
+    main()
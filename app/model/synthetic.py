@@ -0,0 +1,58 @@
+import base64
+import random
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+# Same canvas the drawing page posts (white background, black 25px pen)
+CANVAS_WIDTH = 500
+CANVAS_HEIGHT = 400
+LINE_WIDTH = 25
+
+
+def synthetic_strokes(seed, min_strokes=2, max_strokes=4, points_per_stroke=12):
+    """
+    Deterministic pen strokes for a seed: a few smooth curves (quadratic Bezier) inside the
+    central area of the canvas, like a learner drawing a character. Returns [[(x, y), ...], ...].
+    """
+    rng = random.Random(seed)
+    margin_x, margin_y = CANVAS_WIDTH * 0.2, CANVAS_HEIGHT * 0.15
+
+    def point():
+        return (rng.uniform(margin_x, CANVAS_WIDTH - margin_x), rng.uniform(margin_y, CANVAS_HEIGHT - margin_y))
+
+    strokes = []
+    for _ in range(rng.randint(min_strokes, max_strokes)):
+        (x0, y0), (x1, y1), (x2, y2) = point(), point(), point()
+        stroke = []
+        for i in range(points_per_stroke):
+            t = i / (points_per_stroke - 1)
+            stroke.append((
+                (1 - t) ** 2 * x0 + 2 * (1 - t) * t * x1 + t ** 2 * x2,
+                (1 - t) ** 2 * y0 + 2 * (1 - t) * t * y1 + t ** 2 * y2,
+            ))
+        strokes.append(stroke)
+    return strokes
+
+
+def render_strokes(strokes, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, line_width=LINE_WIDTH):
+    """
+    Rasterize strokes the way the canvas does (round caps and joins), as a grayscale PIL image
+    """
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    radius = line_width / 2
+    for stroke in strokes:
+        draw.line(stroke, fill=0, width=line_width, joint='curve')
+        for x, y in (stroke[0], stroke[-1]):
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=0)
+    return image
+
+
+def synthetic_drawing(seed):
+    """
+    PNG data URL of the synthetic drawing for a seed, ready to post to /hiragana/predict
+    """
+    buffer = BytesIO()
+    render_strokes(synthetic_strokes(seed)).save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
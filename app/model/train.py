@@ -0,0 +1,316 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import shutil
+import time
+
+import cv2
+import numpy as np
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from app.model import drawing_store
+from app.model.dataset import list_image_directory, read_image
+from app.model.preprocess import preprocess_drawing
+
+IMAGE_SIZE = 28
+
+
+def augment(image, rng):
+    """
+    Random variation of one preprocessed drawing (float32 28x28, ink 1 on 0): affine jitter
+    (rotation, scale, shear, shift), stroke thickness and elastic distortion
+    """
+    size = IMAGE_SIZE
+    angle = rng.uniform(-12, 12)
+    scale = rng.uniform(0.9, 1.1)
+    shear = rng.uniform(-0.15, 0.15)
+    matrix = cv2.getRotationMatrix2D((size / 2, size / 2), angle, scale)
+    matrix[0, 1] += shear
+    matrix[:, 2] += rng.uniform(-2, 2, size=2)
+    image = cv2.warpAffine(image, matrix, (size, size), flags=cv2.INTER_LINEAR, borderValue=0)
+
+    thickness = rng.integers(-1, 2)
+    if thickness:
+        kernel = np.ones((2, 2), dtype=np.uint8)
+        image = cv2.dilate(image, kernel) if thickness > 0 else cv2.erode(image, kernel)
+
+    if rng.random() < 0.5:
+        # Smooth random displacement field (Simard et al. style elastic distortion)
+        alpha, sigma = 5.0, 4.0
+        dx = cv2.GaussianBlur(rng.uniform(-1, 1, (size, size)).astype(np.float32), (0, 0), sigma) * alpha
+        dy = cv2.GaussianBlur(rng.uniform(-1, 1, (size, size)).astype(np.float32), (0, 0), sigma) * alpha
+        grid_x, grid_y = np.meshgrid(np.arange(size, dtype=np.float32), np.arange(size, dtype=np.float32))
+        image = cv2.remap(image, grid_x + dx, grid_y + dy, cv2.INTER_LINEAR, borderValue=0)
+
+    return image
+
+
+class StoreSource:
+    """
+    Labelled drawings of a drawing store, read through the segments' memory maps
+    """
+
+    def __init__(self, directory, course):
+        self.directory = directory
+        self.course = course
+        self.locations = []  # (segment number, record) of each labelled drawing
+        self.labels = []
+        self.paths = drawing_store.segment_paths(directory, course)
+        for number, path in enumerate(self.paths):
+            targets = drawing_store.open_segment(path)['target']
+            labelled = np.flatnonzero(targets != '')
+            self.locations.extend((number, int(i)) for i in labelled)
+            self.labels.extend(targets[labelled].tolist())
+        self._segments = None
+
+    def load(self, index):
+        # Mapped on first use in each worker process
+        if self._segments is None:
+            self._segments = [drawing_store.open_segment(path)['image'] for path in self.paths]
+        number, record = self.locations[index]
+        return self._segments[number][record].astype(np.float32) / 255.0
+
+    def __getstate__(self):
+        return {**self.__dict__, '_segments': None}
+
+
+class ImageSource:
+    """
+    Canvas drawings under <directory>/<character>/*.png, preprocessed as they are read
+    """
+
+    def __init__(self, directory):
+        self.paths, self.labels = list_image_directory(directory)
+
+    def load(self, index):
+        return preprocess_drawing(read_image(self.paths[index]))
+
+
+class DrawingDataset(keras.utils.PyDataset):
+    """
+    Batches streamed from a source, augmented in the worker processes Keras runs the dataset in.
+    Only indices live in memory; each batch reads (and augments) its own drawings.
+    """
+
+    def __init__(self, source, indices, class_index, batch_size, augment_data, seed, **kwargs):
+        super().__init__(**kwargs)
+        self.source = source
+        self.indices = np.asarray(indices)
+        self.class_index = class_index
+        self.batch_size = batch_size
+        self.augment_data = augment_data
+        self.seed = seed
+        self.epoch = 0
+        self.order = self._shuffled()
+
+    def _shuffled(self):
+        if not self.augment_data:
+            return self.indices
+        return np.random.default_rng([self.seed, self.epoch]).permutation(self.indices)
+
+    def __len__(self):
+        return math.ceil(len(self.indices) / self.batch_size)
+
+    def __getitem__(self, batch):
+        chosen = self.order[batch * self.batch_size:(batch + 1) * self.batch_size]
+        rng = np.random.default_rng([self.seed, self.epoch, batch])
+        x = np.empty((len(chosen), IMAGE_SIZE, IMAGE_SIZE, 1), dtype=np.float32)
+        y = np.zeros((len(chosen), len(self.class_index)), dtype=np.float32)
+        for row, index in enumerate(chosen):
+            image = self.source.load(index)
+            x[row, :, :, 0] = augment(image, rng) if self.augment_data else image
+            y[row, self.class_index[self.source.labels[index]]] = 1.0
+        return x, y
+
+    def on_epoch_end(self):
+        # Keras hands the dataset to its workers again at the start of every epoch
+        self.epoch += 1
+        self.order = self._shuffled()
+
+
+def build_model(num_classes):
+    """
+    The architecture of the shipped Hiragana model. Its random rotation/zoom/translation layers are left
+    out: augmentation happens in the input pipeline, in parallel, instead of on the training thread.
+    """
+    model = keras.Sequential([
+        keras.Input(shape=(IMAGE_SIZE, IMAGE_SIZE, 1)),
+        layers.Conv2D(32, 3, padding='same', activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D(),
+        layers.Dropout(0.25),
+        layers.Conv2D(64, 3, padding='same', activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D(),
+        layers.Dropout(0.25),
+        layers.Conv2D(128, 3, padding='same', activation='relu'),
+        layers.BatchNormalization(),
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.4),
+        layers.Dense(128, activation='relu'),
+        layers.BatchNormalization(),
+        layers.Dropout(0.3),
+        layers.Dense(num_classes, activation='softmax'),
+    ])
+    model.compile(optimizer=keras.optimizers.Adam(1e-3), loss='categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+# Dataset of the input pipeline measurement, handed to each worker process once
+_measured = None
+
+
+def _set_measured(dataset):
+    global _measured
+    _measured = dataset
+
+
+def _batch_size_of(batch):
+    return len(_measured[batch][0])
+
+
+def measure_input_pipeline(dataset, workers, batches):
+    """
+    Samples per second the augmentation workers produce on their own, without training
+    """
+    batches = min(batches, len(dataset))
+    started = time.perf_counter()
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=_set_measured, initargs=(dataset,)) as pool:
+            samples = sum(pool.map(_batch_size_of, range(batches)))
+    else:
+        _set_measured(dataset)
+        samples = sum(_batch_size_of(batch) for batch in range(batches))
+    return samples / (time.perf_counter() - started)
+
+
+class Throughput(keras.callbacks.Callback):
+    """
+    Training steps and seconds of each epoch, validation excluded
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.epochs = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.steps = 0
+        self.started = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.steps += 1
+        self.ended = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epochs.append((self.steps, self.ended - self.started))
+
+
+def write_artifacts(model, classes, output_dir, romaji_source=None):
+    """
+    Write model.keras, label_encoder.pkl and label_mapping.json for `classes` (in class index order),
+    plus char_to_romaji.json. Everything is written to a staging directory first and moved into place
+    once complete, so the three files always describe the same model.
+    """
+    staging = output_dir.rstrip('/') + '.partial'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    model.save(os.path.join(staging, 'model.keras'))
+    with open(os.path.join(staging, 'label_encoder.pkl'), 'wb') as f:
+        pickle.dump({
+            'index_to_char': dict(enumerate(classes)),
+            'char_to_index': {char: i for i, char in enumerate(classes)},
+        }, f)
+    with open(os.path.join(staging, 'label_mapping.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            str(i): {'unicode': ord(char[0]), 'character': char, 'name': char, 'hex_code': f'U+{ord(char[0]):04X}'}
+            for i, char in enumerate(classes)
+        }, f, ensure_ascii=False, indent=2)
+
+    romaji = {}
+    for path in (os.path.join(output_dir, 'char_to_romaji.json'), romaji_source):
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                romaji = json.load(f)
+            break
+    with open(os.path.join(staging, 'char_to_romaji.json'), 'w', encoding='utf-8') as f:
+        json.dump({char: romaji[char] for char in classes if char in romaji}, f, ensure_ascii=False, indent=2)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in os.listdir(staging):
+        os.replace(os.path.join(staging, name), os.path.join(output_dir, name))
+    os.rmdir(staging)
+
+
+def main(argv=None):
+    from app.config import Config
+
+    parser = argparse.ArgumentParser(description='Train a handwriting recognizer')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--images', help='Drawings under <images>/<character>/*.png')
+    source.add_argument('--store', nargs='?', const=Config.DRAWING_STORE_DIR,
+                        help='Captured drawings with a target (default directory: DRAWING_STORE_DIR)')
+    parser.add_argument('--course', default='hiragana', help='Course of the captured drawings')
+    parser.add_argument('--output', required=True, help='Artifact directory to write, e.g. app/model/hiragana')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--validation', type=float, default=0.1, help='Share of the drawings held out')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Augmentation worker processes')
+    parser.add_argument('--no-augment', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    data = ImageSource(args.images) if args.images else StoreSource(args.store, args.course)
+    if not data.labels:
+        raise SystemExit('Nothing to train on')
+    # Unicode order, the order of the shipped Hiragana classes
+    classes = sorted(set(data.labels))
+    class_index = {char: i for i, char in enumerate(classes)}
+
+    indices = np.random.default_rng(args.seed).permutation(len(data.labels))
+    held_out = int(len(indices) * args.validation)
+    multiprocess = args.workers > 1
+    train_data = DrawingDataset(data, indices[held_out:], class_index, args.batch_size, not args.no_augment,
+                                args.seed, workers=args.workers, use_multiprocessing=multiprocess,
+                                max_queue_size=4 * args.workers)
+    validation_data = None
+    if held_out:
+        validation_data = DrawingDataset(data, indices[:held_out], class_index, args.batch_size, False, args.seed,
+                                         workers=args.workers, use_multiprocessing=multiprocess)
+
+    print(f"[INFO] {len(indices) - held_out} training and {held_out} validation drawings, {len(classes)} classes")
+    pipeline_rate = measure_input_pipeline(train_data, args.workers, batches=4 * max(args.workers, 1))
+    print(f"[INFO] Input pipeline: {pipeline_rate:.0f} samples/s with {args.workers} workers")
+
+    model = build_model(len(classes))
+    throughput = Throughput()
+    callbacks = [throughput]
+    if validation_data is not None:
+        callbacks.append(keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=4,
+                                                       restore_best_weights=True))
+    history = model.fit(train_data, validation_data=validation_data, epochs=args.epochs, callbacks=callbacks,
+                        verbose=2)
+
+    steps = sum(s for s, _ in throughput.epochs)
+    seconds = sum(t for _, t in throughput.epochs)
+    train_rate = len(throughput.epochs) * (len(indices) - held_out) / seconds if seconds else 0.0
+    print(f"[INFO] Training: {steps / seconds if seconds else 0:.1f} steps/s, {train_rate:.0f} samples/s "
+          f"over {len(throughput.epochs)} epochs")
+    if train_rate and pipeline_rate < train_rate * 1.1:
+        print("[INFO] The input pipeline is the bottleneck; more --workers would speed training up")
+
+    from app.model.registry import LEGACY_DIR
+
+    write_artifacts(model, classes, args.output, romaji_source=os.path.join(LEGACY_DIR, 'char_to_romaji.json'))
+    accuracy = history.history.get('val_accuracy')
+    summary = f" (best validation accuracy {max(accuracy):.2%})" if accuracy else ''
+    print(f"[INFO] Artifacts written to {args.output}{summary}")
+
+
+if __name__ == '__main__':
+    # Usage: python -m app.model.train --images <dir> | --store [dir] --output app/model/<course> [--workers N]
+    main()
@@ -0,0 +1,424 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from app.config import Config
+from app.model.preprocess import IMAGE_SIZE, INK_LEVEL, PADDING, preprocess_drawing
+
+logger = logging.getLogger(__name__)
+
+# Browser-side recognition bundles: <WEB_MODEL_DIR>/<course>.json describes the layers and labels,
+# <course>-<version>.bin holds every weight as little-endian float32. The version is a hash of both,
+# so a bundle URL never changes meaning once published.
+
+# The drawing page's runtime, also run under node to validate an export
+RUNTIME_JS = Path(__file__).resolve().parent.parent / 'web' / 'static' / 'js' / 'recognizer.js'
+
+# Layers that only act while training
+_TRAINING_ONLY = ('Dropout', 'SpatialDropout2D', 'GaussianNoise', 'GaussianDropout', 'ActivityRegularization')
+_ACTIVATIONS = ('linear', 'relu', 'softmax')
+
+# Parsed manifests keyed by course name, invalidated by file mtime
+_manifest_cache = {}
+
+
+def bundle_dir():
+    return Path(Config.WEB_MODEL_DIR).resolve()
+
+
+def _course_key(course_name):
+    return course_name.lower()
+
+
+def manifest_path(course_name):
+    return bundle_dir() / f'{_course_key(course_name)}.json'
+
+
+def weights_path(course_name, version):
+    return bundle_dir() / f'{_course_key(course_name)}-{version}.bin'
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(course_name):
+    """
+    The bundle manifest of a course, or None if none has been exported
+    """
+    path = manifest_path(course_name)
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+    cached = _manifest_cache.get(course_name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    _manifest_cache[course_name] = (mtime, manifest)
+    return manifest
+
+
+def _activation(layer):
+    name = getattr(getattr(layer, 'activation', None), '__name__', 'linear')
+    if name not in _ACTIVATIONS:
+        raise ValueError(f'{layer.name}: activation {name} is not supported in the browser')
+    return name
+
+
+def export_layers(model):
+    """
+    The model as a list of (layer spec, [float32 arrays]) the browser runtime understands: conv2d,
+    scale (an inference-mode batch normalization folded into a per-channel scale and shift),
+    max_pool, global_average_pool, flatten and dense. Random augmentation and dropout layers are
+    dropped, and a final softmax is left to the runtime so the bundle's output is the logits.
+    Raises ValueError for anything else.
+    """
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == 'InputLayer' or kind.startswith('Random') or kind in _TRAINING_ONLY:
+            continue
+        if kind == 'Conv2D':
+            if tuple(layer.dilation_rate) != (1, 1) or layer.groups != 1:
+                raise ValueError(f'{layer.name}: dilated and grouped convolutions are not supported')
+            kernel = layer.kernel.numpy()
+            bias = layer.bias.numpy() if layer.use_bias else np.zeros(kernel.shape[-1], dtype=np.float32)
+            layers.append(({'type': 'conv2d', 'strides': list(layer.strides), 'padding': layer.padding,
+                            'activation': _activation(layer)}, [kernel, bias]))
+        elif kind == 'Dense':
+            kernel = layer.kernel.numpy()
+            bias = layer.bias.numpy() if layer.use_bias else np.zeros(kernel.shape[-1], dtype=np.float32)
+            layers.append(({'type': 'dense', 'activation': _activation(layer)}, [kernel, bias]))
+        elif kind == 'BatchNormalization':
+            if layer.axis not in (-1, len(layer.input.shape) - 1):
+                raise ValueError(f'{layer.name}: only channel-last batch normalization is supported')
+            variance = layer.moving_variance.numpy()
+            scale = 1 / np.sqrt(variance + layer.epsilon)
+            if layer.scale:
+                scale = scale * layer.gamma.numpy()
+            shift = -layer.moving_mean.numpy() * scale
+            if layer.center:
+                shift = shift + layer.beta.numpy()
+            layers.append(({'type': 'scale'}, [scale, shift]))
+        elif kind == 'MaxPooling2D':
+            layers.append(({'type': 'max_pool', 'pool_size': list(layer.pool_size), 'strides': list(layer.strides),
+                            'padding': layer.padding}, []))
+        elif kind == 'GlobalAveragePooling2D':
+            layers.append(({'type': 'global_average_pool'}, []))
+        elif kind == 'Flatten':
+            layers.append(({'type': 'flatten'}, []))
+        elif kind == 'Activation':
+            layers.append(({'type': 'activation', 'activation': _activation(layer)}, []))
+        else:
+            raise ValueError(f'{layer.name}: {kind} layers are not supported in the browser')
+
+    for spec, _ in layers[:-1]:
+        if spec.get('activation') == 'softmax':
+            raise ValueError('Only the last layer may apply softmax')
+    if layers and layers[-1][0].get('activation') == 'softmax':
+        if layers[-1][0]['type'] == 'activation':
+            layers.pop()
+        else:
+            layers[-1][0]['activation'] = 'linear'
+    return layers
+
+
+def build_bundle(model, labels, romaji, course_name, model_version):
+    """
+    (manifest, weight bytes) of a model. Each layer lists its weights as [shape, offset] in float32
+    elements of the weight file.
+    """
+    specs, blobs, offset = [], [], 0
+    for spec, arrays in export_layers(model):
+        spec = dict(spec, weights=[])
+        for array in arrays:
+            array = np.ascontiguousarray(array, dtype='<f4')
+            spec['weights'].append([list(array.shape), offset])
+            blobs.append(array.tobytes())
+            offset += array.size
+        specs.append(spec)
+    weights = b''.join(blobs)
+
+    manifest = {
+        'course': course_name,
+        'model_version': model_version,
+        'input': {'size': IMAGE_SIZE, 'ink_level': INK_LEVEL, 'padding': PADDING},
+        'output': 'softmax',
+        'layers': specs,
+        'labels': list(labels),
+        'romaji': {char: romaji.get(char, char) for char in labels},
+        'weights_length': len(weights),
+    }
+    digest = hashlib.sha256(weights)
+    digest.update(json.dumps(manifest, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    manifest['version'] = digest.hexdigest()[:12]
+    return manifest, weights
+
+
+def _weights(spec, weights):
+    return [weights[offset:offset + int(np.prod(shape))].reshape(shape) for shape, offset in spec['weights']]
+
+
+def _same_padding(size, kernel, stride):
+    # TensorFlow's "same": the output covers ceil(size / stride) positions, the extra row/column goes after
+    total = max((-(-size // stride) - 1) * stride + kernel - size, 0)
+    return total // 2, total - total // 2
+
+
+def _windows(x, kernel, strides, padding, fill):
+    # (batch, out_h, out_w, kh, kw, channels) view of every window of x
+    if padding == 'same':
+        (top, bottom), (left, right) = (_same_padding(x.shape[1], kernel[0], strides[0]),
+                                        _same_padding(x.shape[2], kernel[1], strides[1]))
+        x = np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)), constant_values=fill)
+    windows = np.lib.stride_tricks.sliding_window_view(x, tuple(kernel), axis=(1, 2))
+    return windows[:, ::strides[0], ::strides[1]].transpose(0, 1, 2, 4, 5, 3)
+
+
+def _activate(x, activation):
+    if activation == 'relu':
+        return np.maximum(x, 0)
+    if activation == 'softmax':
+        return softmax(x)
+    return x
+
+
+def softmax(logits):
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def forward(manifest, weights, images):
+    """
+    Logits of a bundle for a batch of preprocessed 28x28 drawings, computed layer by layer from the
+    manifest the way the browser runtime does (float32 throughout)
+    """
+    weights = np.frombuffer(weights, dtype='<f4')
+    x = np.asarray(images, dtype=np.float32)[..., np.newaxis]
+    for spec in manifest['layers']:
+        kind = spec['type']
+        if kind == 'conv2d':
+            kernel, bias = _weights(spec, weights)
+            windows = _windows(x, kernel.shape[:2], spec['strides'], spec['padding'], 0)
+            x = _activate(np.tensordot(windows, kernel, axes=3) + bias, spec['activation'])
+        elif kind == 'dense':
+            kernel, bias = _weights(spec, weights)
+            x = _activate(x @ kernel + bias, spec['activation'])
+        elif kind == 'scale':
+            scale, shift = _weights(spec, weights)
+            x = x * scale + shift
+        elif kind == 'max_pool':
+            x = _windows(x, spec['pool_size'], spec['strides'], spec['padding'], -np.inf).max(axis=(3, 4))
+        elif kind == 'global_average_pool':
+            x = x.mean(axis=(1, 2))
+        elif kind == 'flatten':
+            x = x.reshape(len(x), -1)
+        elif kind == 'activation':
+            x = _activate(x, spec['activation'])
+        else:
+            raise ValueError(f'Unknown layer type {kind}')
+    return x.astype(np.float32)
+
+
+def keras_logits(model, images):
+    """
+    The server model's probabilities and pre-softmax logits for a batch of preprocessed drawings
+    """
+    import keras
+
+    image_input = np.asarray(images, dtype=np.float32)[..., np.newaxis]
+    probabilities = np.asarray(model(image_input, training=False))
+    last = model.layers[-1]
+    features = np.asarray(keras.Model(model.inputs, last.input)([image_input], training=False))
+    if type(last).__name__ == 'Activation':
+        return probabilities, features
+    return probabilities, features @ last.kernel.numpy() + last.bias.numpy()
+
+
+def node_outputs(manifest, weights, images, canvases=()):
+    """
+    Run the browser runtime under node: the logits it computes for the preprocessed drawings, and the
+    28x28 inputs it preprocesses from the grayscale canvases. None when node is not installed.
+    """
+    node = shutil.which('node')
+    if node is None:
+        return None
+
+    script = """
+        const fs = require('fs');
+        const path = require('path');
+        const { Model, preprocess } = require(process.argv[1]);
+        const dir = process.argv[2];
+        const manifest = JSON.parse(fs.readFileSync(path.join(dir, 'model.json'), 'utf8'));
+        const read = (name) => { const b = fs.readFileSync(path.join(dir, name)); return b.buffer.slice(b.byteOffset, b.byteOffset + b.length); };
+        const model = new Model(manifest, new Float32Array(read('weights.bin')));
+        const images = new Float32Array(read('images.bin'));
+        const size = manifest.input.size * manifest.input.size;
+        const logits = [];
+        for (let i = 0; i < images.length; i += size) logits.push(...model.logits(images.subarray(i, i + size)));
+        fs.writeFileSync(path.join(dir, 'logits.bin'), Buffer.from(new Float32Array(logits).buffer));
+        const canvases = JSON.parse(fs.readFileSync(path.join(dir, 'canvases.json'), 'utf8'));
+        const pixels = new Uint8Array(read('canvases.bin'));
+        const processed = [];
+        let offset = 0;
+        for (const [height, width] of canvases) {
+            processed.push(...preprocess(pixels.subarray(offset, offset + width * height), width, height));
+            offset += width * height;
+        }
+        fs.writeFileSync(path.join(dir, 'processed.bin'), Buffer.from(new Float32Array(processed).buffer));
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        (directory / 'model.json').write_text(json.dumps(manifest), encoding='utf-8')
+        (directory / 'weights.bin').write_bytes(weights)
+        (directory / 'images.bin').write_bytes(np.ascontiguousarray(images, dtype='<f4').tobytes())
+        (directory / 'canvases.json').write_text(json.dumps([canvas.shape for canvas in canvases]), encoding='utf-8')
+        (directory / 'canvases.bin').write_bytes(b''.join(np.ascontiguousarray(c, dtype=np.uint8).tobytes()
+                                                          for c in canvases))
+        subprocess.run([node, '-e', script, str(RUNTIME_JS), str(directory)], check=True)
+        logits = np.fromfile(directory / 'logits.bin', dtype='<f4').reshape(len(images), -1)
+        processed = np.fromfile(directory / 'processed.bin', dtype='<f4').reshape(-1, IMAGE_SIZE, IMAGE_SIZE)
+    return logits, processed
+
+
+def _compare(logits, reference_logits, reference_probabilities):
+    return {
+        'max_logit_difference': float(np.abs(logits - reference_logits).max()),
+        'max_probability_difference': float(np.abs(softmax(logits) - reference_probabilities).max()),
+        'top1_agreement': float((logits.argmax(axis=1) == reference_probabilities.argmax(axis=1)).mean()),
+    }
+
+
+def validate(model, manifest, weights, canvases, use_node=True):
+    """
+    Compare a bundle with the server model on a test set of grayscale canvases: the logits and
+    probabilities of the numpy interpreter of the manifest and, when node is installed, of the browser
+    runtime itself, including its own preprocessing of the canvases
+    """
+    images = np.empty((len(canvases), IMAGE_SIZE, IMAGE_SIZE), dtype=np.float32)
+    for row, canvas in enumerate(canvases):
+        preprocess_drawing(canvas, out=images[row])
+    probabilities, reference = keras_logits(model, images)
+
+    report = {'samples': len(canvases), 'bundle': _compare(forward(manifest, weights, images), reference,
+                                                           probabilities)}
+    outputs = node_outputs(manifest, weights, images, canvases) if use_node else None
+    if outputs is not None:
+        logits, processed = outputs
+        report['runtime'] = _compare(logits, reference, probabilities)
+        # The whole browser pipeline: its preprocessing, then its model
+        report['runtime_preprocess'] = {
+            'max_pixel_difference': float(np.abs(processed - images).max()),
+            'mean_pixel_difference': float(np.abs(processed - images).mean()),
+            'top1_agreement': float((forward(manifest, weights, processed).argmax(axis=1)
+                                     == probabilities.argmax(axis=1)).mean()),
+        }
+    return report
+
+
+def publish(manifest, weights, validation):
+    """
+    Write a bundle and point the course's manifest at it, keeping the previous weight file for
+    pages that loaded the old manifest
+    """
+    course_name = manifest['course']
+    existing = load_manifest(course_name)
+    path = weights_path(course_name, manifest['version'])
+    if not path.exists():
+        _write_atomic(path, weights)
+    manifest = dict(manifest, validation=validation)
+    _write_atomic(manifest_path(course_name), json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    if existing and existing['version'] != manifest['version']:
+        keep = (path.name, weights_path(course_name, existing['version']).name)
+        for old in path.parent.glob(f'{_course_key(course_name)}-*.bin'):
+            if old.name not in keep:
+                old.unlink(missing_ok=True)
+    return manifest
+
+
+def _passed(result, tolerance):
+    return result['max_probability_difference'] <= tolerance and result['top1_agreement'] == 1.0
+
+
+def main(argv=None):
+    from app.model.predict_character import HiraganaRecognizer
+    from app.model.registry import recognizers, resolve_model_path
+    from app.model.synthetic import render_strokes, synthetic_strokes
+
+    parser = argparse.ArgumentParser(description='Export a recognizer as a weight bundle for the drawing page')
+    parser.add_argument('--course', default='Hiragana')
+    parser.add_argument('--model-dir', help="Artifact directory to export (default: the course's active version)")
+    parser.add_argument('--images', help='Drawings under <images>/<character>/*.png to validate on')
+    parser.add_argument('--synthetic', type=int, default=500,
+                        help='Number of synthetic drawings to validate on without --images')
+    parser.add_argument('--tolerance', type=float, default=1e-4,
+                        help='Largest probability difference to the server model allowed')
+    parser.add_argument('--no-node', action='store_true', help='Skip running the browser runtime under node')
+    args = parser.parse_args(argv)
+
+    if args.model_dir:
+        base_dir, model_path, version = args.model_dir, resolve_model_path(args.model_dir), 'unversioned'
+    else:
+        artifacts = recognizers.artifact_dir(args.course)
+        if artifacts is None:
+            parser.error(f'{args.course} has no recognizer')
+        base_dir, model_path, version = artifacts
+    if os.path.exists(os.path.join(base_dir, 'centroids.npz')):
+        parser.error('The server classifies this model by centroid index, which the browser runtime cannot')
+
+    recognizer = HiraganaRecognizer(model_path=model_path, base_dir=base_dir, use_index=False, use_cascade=False)
+    manifest, weights = build_bundle(recognizer.model, recognizer.labels, recognizer.char_to_romaji,
+                                     _course_key(args.course), version)
+    print(f"[INFO] {len(manifest['layers'])} layers, {len(weights) / 1024:.0f} KB of weights, "
+          f"bundle version {manifest['version']}")
+
+    if args.images:
+        from app.model.dataset import read_image_directory
+
+        canvases, _ = read_image_directory(args.images)
+    else:
+        canvases = [np.array(render_strokes(synthetic_strokes(seed))) for seed in range(args.synthetic)]
+    report = validate(recognizer.model, manifest, weights, canvases, use_node=not args.no_node)
+
+    print(f"[INFO] Validated on {report['samples']} drawings against the server model:")
+    for name in ('bundle', 'runtime'):
+        if name in report:
+            result = report[name]
+            print(f"  {name:>8}: max logit difference {result['max_logit_difference']:.2e}, "
+                  f"max probability difference {result['max_probability_difference']:.2e}, "
+                  f"same answer {result['top1_agreement']:.2%}")
+    if 'runtime' not in report:
+        print("  runtime: not checked (node is not installed)")
+    else:
+        result = report['runtime_preprocess']
+        print(f"  preprocessing in the browser: max pixel difference {result['max_pixel_difference']:.3f}, "
+              f"mean {result['mean_pixel_difference']:.5f}, same answer {result['top1_agreement']:.2%}")
+
+    if not all(_passed(report[name], args.tolerance) for name in ('bundle', 'runtime') if name in report):
+        print(f"[ERROR] The bundle does not match the server model within {args.tolerance:g}; not published")
+        sys.exit(1)
+    manifest = publish(manifest, weights, report)
+    print(f"[INFO] Published {manifest_path(manifest['course'])} -> {weights_path(manifest['course'], manifest['version']).name}")
+
+
+if __name__ == '__main__':
+    # Usage: python -m app.model.web_bundle [--course Hiragana] [--images <dir>] [--no-node]
+    main()
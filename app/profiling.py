@@ -0,0 +1,204 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+from flask_login import current_user
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Endpoints never worth profiling (and the profile viewer itself)
+_SKIPPED_ENDPOINTS = {'static', 'assets', 'metrics', 'admin.profiles', 'admin.profile_download'}
+
+# <timestamp>-<duration>ms-<id>.<ext>, so listings need no index file
+_FILENAME = re.compile(r'^(\d{8}-\d{6})-(\d+)ms-[0-9a-f]+\.(folded|pstats)$')
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread at a fixed interval from a background thread and
+    counts identical stacks, producing collapsed-stack output for flame graph tools.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{_short_path(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _short_path(filename):
+    # Last two path components are enough to tell modules apart and keep lines short
+    parts = filename.replace('\\', '/').rsplit('/', 2)
+    return '/'.join(parts[-2:])
+
+
+def _endpoint_dir(endpoint):
+    return os.path.join(Config.PROFILE_DIR, re.sub(r'[^A-Za-z0-9_.-]', '_', endpoint))
+
+
+def _rotate(directory):
+    # Keep the newest PROFILE_KEEP samples per endpoint
+    files = sorted(
+        (entry for entry in os.scandir(directory) if _FILENAME.match(entry.name)),
+        key=lambda entry: entry.stat().st_mtime_ns,
+        reverse=True
+    )
+    for entry in files[Config.PROFILE_KEEP:]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _requested():
+    header = request.headers.get('X-Profile')
+    if header is not None:
+        # Explicit requests come from admins, or from tools that know the profile token
+        if Config.PROFILE_TOKEN and header == Config.PROFILE_TOKEN:
+            return True
+        if current_user.is_authenticated and current_user.role_code == 'ADMIN':
+            return True
+    return Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE
+
+
+def _before_request():
+    if request.endpoint is None or request.endpoint in _SKIPPED_ENDPOINTS or not _requested():
+        return
+
+    if Config.PROFILE_MODE == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another request on this process is already being traced
+            return
+    else:
+        profiler = StackSampler(threading.get_ident(), Config.PROFILE_INTERVAL)
+        profiler.start()
+
+    g.profile = (profiler, time.perf_counter())
+
+
+def _finish(profile, endpoint):
+    # Stop the profiler and write its sample; returns the sample's <endpoint>/<file> name, or None
+    profiler, started = profile
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler.stop()
+    elapsed_ms = int((time.perf_counter() - started) * 1000)
+
+    directory = _endpoint_dir(endpoint)
+    os.makedirs(directory, exist_ok=True)
+    extension = 'pstats' if isinstance(profiler, cProfile.Profile) else 'folded'
+    filename = f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{elapsed_ms}ms-{uuid.uuid4().hex[:8]}.{extension}"
+
+    try:
+        if isinstance(profiler, cProfile.Profile):
+            profiler.dump_stats(os.path.join(directory, filename))
+        else:
+            profiler.dump(os.path.join(directory, filename))
+        _rotate(directory)
+    except OSError as e:
+        logger.warning("Could not write profile %s: %s", filename, e)
+        return None
+    return f'{os.path.basename(directory)}/{filename}'
+
+
+def _after_request(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+
+    name = _finish(profile, request.endpoint)
+    if name is not None:
+        response.headers['X-Profile-File'] = name
+    return response
+
+
+def _teardown_request(exception=None):
+    # after_request is skipped when an exception propagates; the profiler must stop regardless
+    profile = g.pop('profile', None)
+    if profile is not None:
+        _finish(profile, request.endpoint)
+
+
+def recent_profiles(limit=50):
+    """
+    The slowest stored samples across all endpoints: [{endpoint, filename, duration_ms, recorded_at, format}]
+    """
+    if not os.path.isdir(Config.PROFILE_DIR):
+        return []
+
+    samples = []
+    for endpoint in os.scandir(Config.PROFILE_DIR):
+        if not endpoint.is_dir():
+            continue
+        for entry in os.scandir(endpoint.path):
+            match = _FILENAME.match(entry.name)
+            if match:
+                samples.append({
+                    'endpoint': endpoint.name,
+                    'filename': entry.name,
+                    'duration_ms': int(match.group(2)),
+                    'recorded_at': datetime.strptime(match.group(1), '%Y%m%d-%H%M%S'),
+                    'format': match.group(3),
+                })
+
+    samples.sort(key=lambda sample: sample['duration_ms'], reverse=True)
+    return samples[:limit]
+
+
+def profile_path(endpoint, filename):
+    """
+    Absolute path of a stored sample, or None if the name is not one of ours
+    """
+    if not _FILENAME.match(filename) or endpoint.startswith('.') or \
+            _endpoint_dir(endpoint) != os.path.join(Config.PROFILE_DIR, endpoint):
+        return None
+    return os.path.abspath(os.path.join(_endpoint_dir(endpoint), filename))
+
+
+def init_app(app):
+    # Nothing is registered unless profiling is enabled, so disabled costs nothing per request
+    if not Config.PROFILING_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -1,11 +1,19 @@
-from flask import render_template, Blueprint, request, redirect, url_for, flash
+import os
+
+from flask import render_template, Blueprint, request, redirect, url_for, flash, jsonify, send_from_directory, abort
 from flask_login import login_required, current_user
 from functools import wraps
-from datetime import datetime
-from sqlalchemy import func
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update, delete
 
 from app.database.models import User, Course, Character, Pricing, Transaction, Enrollment, Progress, Role
-from app import get_session
+from app.database.models import CourseDailyRollup, UserDailyRollup
+from app.database.rollups import record_user_deletions
+from app import get_read_session, get_session
+from app.cache import bump_catalog_version, invalidate_catalog
+from app.profiling import recent_profiles, profile_path
+from app.model.registry import recognizers, RecognizerUnavailable
+from app.config import Config
 
 admin = Blueprint('admin', __name__)
 
@@ -26,12 +34,15 @@ def admin_required(f):
 @login_required
 @admin_required
 def dashboard():
-    with get_session() as db:
-        # Get statistics
-        total_users = db.query(User).count()
+    with get_read_session() as db:
+        # Get statistics from the daily rollups (one row per day, not per user or transaction).
+        # Rollup enrollments count purchases, revoked enrollments included (see record_purchase).
+        total_users = db.query(func.coalesce(func.sum(UserDailyRollup.new_users), 0)).scalar()
         total_courses = db.query(Course).count()
-        total_enrollments = db.query(Enrollment).count()
-        total_revenue = db.query(func.sum(Transaction.price)).scalar()
+        total_purchases, total_revenue = db.query(
+            func.coalesce(func.sum(CourseDailyRollup.enrollments), 0),
+            func.coalesce(func.sum(CourseDailyRollup.revenue), 0)
+        ).one()
 
         # Recent transactions
         recent_transactions = db.query(Transaction).order_by(
@@ -42,26 +53,65 @@ def dashboard():
             'admin/dashboard.html',
             total_users=total_users,
             total_courses=total_courses,
-            total_enrollments=total_enrollments,
+            total_purchases=total_purchases,
             total_revenue=total_revenue,
             recent_transactions=recent_transactions
         )
 
 
+@admin.route('/revenue')
+@login_required
+@admin_required
+def revenue():
+    with get_read_session() as db:
+        days = min(max(request.args.get('days', 30, type=int), 1), 366)
+        start = datetime.utcnow().date() - timedelta(days=days - 1)
+
+        courses = db.query(Course).order_by(Course.id).all()
+        rows = db.query(CourseDailyRollup).filter(CourseDailyRollup.day >= start).all()
+
+        # One entry per day (including days without sales), with revenue split by course
+        series = []
+        by_day = {(row.day, row.course_id): row for row in rows}
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            per_course = {course.id: by_day.get((day, course.id)) for course in courses}
+            series.append({
+                'day': day,
+                'revenue': sum(row.revenue for row in per_course.values() if row),
+                'purchases': sum(row.enrollments for row in per_course.values() if row),
+                'per_course': {course_id: row.revenue if row else 0 for course_id, row in per_course.items()},
+            })
+
+        peak = max((entry['revenue'] for entry in series), default=0)
+
+        return render_template(
+            'admin/revenue.html',
+            days=days,
+            courses=courses,
+            series=series,
+            peak=peak,
+            period_revenue=sum(entry['revenue'] for entry in series),
+            period_purchases=sum(entry['purchases'] for entry in series)
+        )
+
+
 @admin.route('/users')
 @login_required
 @admin_required
 def users():
     with get_session() as db:
         all_users = db.query(User).all()
-        return render_template('admin/users.html', users=all_users)
+        roles = db.query(Role).all()
+        return render_template('admin/users.html', users=all_users, roles=roles,
+                               max_batch=Config.BULK_MAX_BATCH)
 
 
 @admin.route('/users/<int:user_id>')
 @login_required
 @admin_required
 def user_detail(user_id):
-    with get_session() as db:
+    with get_read_session() as db:
         user = db.query(User).filter_by(id=user_id).first()
         if not user:
             flash('User not found', 'error')
@@ -153,6 +203,7 @@ def delete_user(user_id):
             flash('You cannot delete your own account', 'error')
             return redirect(url_for('admin.users'))
 
+        record_user_deletions(db, [user.id])
         db.delete(user)
         db.commit()
 
@@ -160,6 +211,202 @@ def delete_user(user_id):
         return redirect(url_for('admin.users'))
 
 
+def _bulk_params():
+    # Bulk requests come from the users page form or as JSON from scripts
+    if request.is_json:
+        data = request.get_json() or {}
+        return data, data.get('user_ids')
+    return request.form, request.form.getlist('user_ids')
+
+
+def _bulk_ids(values):
+    """
+    The ids of a bulk request: a JSON list of integers, or form values of digits (None or empty = no ids).
+    Raises ValueError for anything else, so a string is never read as its characters.
+    """
+    if values is None:
+        return set()
+    if not isinstance(values, list):
+        raise ValueError('Ids must be a list of integers')
+    if request.is_json:
+        # bool is an int subclass, but true is no id
+        if not all(type(value) is int for value in values):
+            raise ValueError('Ids must be a list of integers')
+        return set(values)
+    if not all(value.isdigit() for value in values):
+        raise ValueError('Ids must be integers')
+    return {int(value) for value in values}
+
+
+def _bulk_text(params, name):
+    # A filter value of a bulk request ('' when absent); JSON may carry any type
+    value = params.get(name) or ''
+    if not isinstance(value, str):
+        raise ValueError(f'{name} must be a string')
+    return value
+
+
+def _bulk_day(params, name):
+    # A YYYY-MM-DD filter date of a bulk request, or None
+    value = _bulk_text(params, name)
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+
+def _bulk_targets(db, params, user_ids):
+    """
+    Resolve the users a bulk request applies to: an explicit id list, or a filter capped at
+    BULK_MAX_BATCH users. Returns (ids, matched) where matched counts every user the filter selects.
+    The acting admin is never included.
+    """
+    explicit = _bulk_ids(user_ids)
+    if explicit:
+        ids = sorted(explicit - {current_user.id})
+        if len(ids) > Config.BULK_MAX_BATCH:
+            raise ValueError(f'At most {Config.BULK_MAX_BATCH} users can be changed at once')
+        return ids, len(ids)
+
+    conditions = [User.id != current_user.id]
+    filter_role = _bulk_text(params, 'filter_role')
+    created_after = _bulk_day(params, 'created_after')
+    created_before = _bulk_day(params, 'created_before')
+    course = _bulk_text(params, 'course')
+    if filter_role:
+        conditions.append(User.role_code == filter_role)
+    if created_after:
+        conditions.append(User.created_at >= created_after)
+    if created_before:
+        conditions.append(User.created_at < created_before)
+    if course:
+        enrolled = select(Enrollment.user_id).join(Course, Course.id == Enrollment.course_id).where(
+            Course.name == course)
+        conditions.append(User.id.in_(enrolled))
+
+    if len(conditions) == 1:
+        raise ValueError('Select users or provide a filter')
+
+    matched = db.scalar(select(func.count(User.id)).where(*conditions))
+    ids = db.scalars(select(User.id).where(*conditions).order_by(User.id).limit(Config.BULK_MAX_BATCH)).all()
+    return list(ids), matched
+
+
+@admin.route('/users/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_users():
+    """
+    Delete users or change their role with set-based statements in a single transaction
+    """
+    params, user_ids = _bulk_params()
+
+    with get_session() as db:
+        try:
+            action = _bulk_text(params, 'action')
+            if action not in ('delete', 'set_role'):
+                raise ValueError('Unknown bulk action')
+            if action == 'set_role' and not db.get(Role, _bulk_text(params, 'role_code')):
+                raise ValueError('Unknown role')
+            ids, matched = _bulk_targets(db, params, user_ids)
+        except (ValueError, TypeError) as e:
+            # Malformed ids, dates or filters (TypeError: a JSON value of the wrong type)
+            if request.is_json:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            flash(str(e), 'error')
+            return redirect(url_for('admin.users'))
+
+        report = {'action': action, 'matched': matched, 'remaining': max(matched - len(ids), 0)}
+
+        if ids and action == 'delete':
+            # Dependent rows go with the users through the ON DELETE CASCADE foreign keys
+            for name, model in (('transactions', Transaction), ('enrollments', Enrollment), ('progress', Progress)):
+                report[name] = db.scalar(select(func.count()).select_from(model).where(model.user_id.in_(ids)))
+            record_user_deletions(db, ids)
+            report['users'] = db.execute(delete(User).where(User.id.in_(ids))).rowcount
+        elif ids:
+            report['users'] = db.execute(
+                update(User).where(User.id.in_(ids)).values(role_code=params['role_code'], updated_at=datetime.utcnow())
+            ).rowcount
+        else:
+            report['users'] = 0
+
+        db.commit()
+
+    if request.is_json:
+        return jsonify({'success': True, **report})
+
+    verb = 'Deleted' if action == 'delete' else 'Updated'
+    message = f"{verb} {report['users']} users"
+    if report['remaining']:
+        message += f" ({report['remaining']} more match the filter, run it again to continue)"
+    flash(message, 'success')
+    return redirect(url_for('admin.users'))
+
+
+@admin.route('/enrollments/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_enrollments():
+    """
+    Revoke enrollments by id list or by course (optionally limited to the users enrolled before a date).
+    The purchase transactions and dashboard rollups are kept, they record what was sold: rollup
+    enrollments count purchases, here as in backfill_rollups. Only deleting a user (and with it the
+    user's transactions) takes purchases out of the rollups.
+    """
+    if request.is_json:
+        params = request.get_json() or {}
+        enrollment_ids = params.get('enrollment_ids')
+    else:
+        params = request.form
+        enrollment_ids = params.getlist('enrollment_ids')
+
+    with get_session() as db:
+        try:
+            explicit = _bulk_ids(enrollment_ids)
+            course = _bulk_text(params, 'course')
+            if explicit:
+                ids = sorted(explicit)
+                matched = len(ids)
+                if matched > Config.BULK_MAX_BATCH:
+                    raise ValueError(f'At most {Config.BULK_MAX_BATCH} enrollments can be changed at once')
+            elif course:
+                conditions = [Course.name == course]
+                enrolled_before = _bulk_day(params, 'enrolled_before')
+                if enrolled_before:
+                    conditions.append(Transaction.created_at < enrolled_before)
+                stmt = select(Enrollment.id).join(Course, Course.id == Enrollment.course_id).join(
+                    Transaction, Transaction.id == Enrollment.transaction_id).where(*conditions)
+                matched = db.scalar(select(func.count()).select_from(stmt.subquery()))
+                ids = list(db.scalars(stmt.order_by(Enrollment.id).limit(Config.BULK_MAX_BATCH)).all())
+            else:
+                raise ValueError('Select enrollments or provide a course')
+            error = None
+        except (ValueError, TypeError) as e:
+            # Malformed ids or dates (TypeError: a JSON value of the wrong type)
+            error = str(e)
+
+        if error:
+            if request.is_json:
+                return jsonify({'success': False, 'error': error}), 400
+            flash(error, 'error')
+            return redirect(url_for('admin.enrollments'))
+
+        revoked = db.execute(delete(Enrollment).where(Enrollment.id.in_(ids))).rowcount if ids else 0
+        if revoked:
+            # Course lists keep the learners' enrollments per catalog version
+            bump_catalog_version(db)
+        db.commit()
+        invalidate_catalog()
+
+    report = {'enrollments': revoked, 'matched': matched, 'remaining': max(matched - len(ids), 0)}
+    if request.is_json:
+        return jsonify({'success': True, **report})
+
+    message = f'Revoked {revoked} enrollments'
+    if report['remaining']:
+        message += f" ({report['remaining']} more match, run it again to continue)"
+    flash(message, 'success')
+    return redirect(url_for('admin.enrollments'))
+
+
 @admin.route('/pricing')
 @login_required
 @admin_required
@@ -199,7 +446,9 @@ def edit_pricing(course_id):
                 pricing = Pricing(course_id=course_id, price=int(new_price))
                 db.add(pricing)
 
+            bump_catalog_version(db)
             db.commit()
+            invalidate_catalog()
 
             flash('Pricing updated successfully', 'success')
             return redirect(url_for('admin.pricing'))
@@ -211,7 +460,7 @@ def edit_pricing(course_id):
 @login_required
 @admin_required
 def transactions():
-    with get_session() as db:
+    with get_read_session() as db:
         page = request.args.get('page', 1, type=int)
         per_page = 20
 
@@ -233,7 +482,7 @@ def transactions():
 @login_required
 @admin_required
 def transaction_detail(transaction_id):
-    with get_session() as db:
+    with get_read_session() as db:
         transaction = db.query(Transaction).filter_by(id=transaction_id).first()
         if not transaction:
             flash('Transaction not found', 'error')
@@ -245,7 +494,7 @@ def transaction_detail(transaction_id):
 @login_required
 @admin_required
 def enrollments():
-    with get_session() as db:
+    with get_read_session() as db:
         all_enrollments = db.query(Enrollment).all()
 
         # Group enrollments by course
@@ -266,7 +515,7 @@ def enrollments():
 @login_required
 @admin_required
 def progress():
-    with get_session() as db:
+    with get_read_session() as db:
         courses = db.query(Course).all()
         progress_stats = []
 
@@ -290,4 +539,79 @@ def progress():
                     'percentage': (learned / total_chars * 100) if total_chars > 0 else 0
                 })
 
-        return render_template('admin/progress.html', progress_stats=progress_stats)
\ No newline at end of file
+        return render_template('admin/progress.html', progress_stats=progress_stats)
+
+
+@admin.route('/profiles')
+@login_required
+@admin_required
+def profiles():
+    return render_template(
+        'admin/profiles.html',
+        samples=recent_profiles(),
+        enabled=Config.PROFILING_ENABLED,
+        sample_rate=Config.PROFILE_SAMPLE_RATE
+    )
+
+
+@admin.route('/profiles/<endpoint_name>/<filename>')
+@login_required
+@admin_required
+def profile_download(endpoint_name, filename):
+    path = profile_path(endpoint_name, filename)
+    if path is None:
+        abort(404)
+    return send_from_directory(os.path.dirname(path), filename, as_attachment=True)
+
+
+@admin.route('/models')
+@login_required
+@admin_required
+def models():
+    """
+    Recognizer versions per course: available, active, and serving in this worker
+    """
+    with get_session() as db:
+        course_names = [name for (name,) in db.query(Course.name).order_by(Course.id).all()]
+
+    serving = {course: (version, size) for course, version, size in recognizers.loaded()}
+    courses = []
+    for name in course_names:
+        artifacts = recognizers.artifact_dir(name)
+        version, size = serving.get(name.lower(), (None, 0))
+        courses.append({
+            'name': name,
+            'versions': recognizers.versions(name),
+            'active': artifacts[2] if artifacts else None,
+            'serving': version,
+            'size_mb': round(size / 1024 / 1024, 1),
+        })
+    return render_template('admin/models.html', courses=courses, watch_interval=Config.MODEL_WATCH_INTERVAL)
+
+
+@admin.route('/models/<course_name>/activate', methods=['POST'])
+@login_required
+@admin_required
+def activate_model(course_name):
+    """
+    Make a model version the active one and swap it in without a restart: this worker reloads in
+    the background right away, the others when their directory watcher notices
+    """
+    version = (request.get_json(silent=True) or {}).get('version') if request.is_json else request.form.get('version')
+    try:
+        if version:
+            recognizers.activate(course_name, version)
+        elif not recognizers.available(course_name):
+            raise RecognizerUnavailable(f'No recognizer available for {course_name}')
+    except RecognizerUnavailable as e:
+        if request.is_json:
+            return jsonify({'success': False, 'error': str(e)}), 404
+        flash(str(e), 'error')
+        return redirect(url_for('admin.models'))
+
+    recognizers.reload_in_background(course_name, force=not version)
+    if request.is_json:
+        return jsonify({'success': True, 'course': course_name,
+                        'version': version or recognizers.active_version(course_name)}), 202
+    flash(f"Loading {course_name} model {version or 'again'}; it is swapped in once warmed up", 'success')
+    return redirect(url_for('admin.models'))
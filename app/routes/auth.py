@@ -4,6 +4,9 @@ from flask_login import current_user, login_user, login_required, logout_user
 
 from app import get_session
 from app.database.models import User
+from app.database.rollups import record_signups
+from app.executors import ExecutorBusy
+from app.security import hash_password, needs_rehash, run_hashing
 from app.web.forms.auth import LoginForm, RegistrationForm
 
 auth = Blueprint('auth', __name__)
@@ -21,9 +24,24 @@ def login():
         with get_session() as session:
             user = session.scalar(
                 sa.select(User).where(User.username == form.username.data))
-            if user is None or not user.verify_password(form.password.data):
+            try:
+                valid = user is not None and run_hashing(user.verify_password, form.password.data)
+            except ExecutorBusy:
+                flash('Too many people are logging in right now. Please try again in a moment.')
+                return render_template('auth/login.html', title='Log In', form=form), 503
+
+            if not valid:
                 flash('Invalid username or password')
                 return redirect(url_for('auth.login'))
+
+            # Upgrade hashes made with outdated algorithm or cost settings while we know the password
+            if needs_rehash(user.password_hash):
+                try:
+                    user.password_hash = run_hashing(hash_password, form.password.data)
+                    session.commit()
+                except ExecutorBusy:
+                    pass  # Try again on a later login
+
             login_user(user, remember=form.remember_me.data)
 
             if user.role_code == 'ADMIN':
@@ -45,11 +63,18 @@ def logout():
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
+        try:
+            password_hash = run_hashing(hash_password, form.password.data)
+        except ExecutorBusy:
+            flash('Too many people are signing up right now. Please try again in a moment.')
+            return render_template('auth/register.html', title="Sign In", form=form), 503
+
         user = User(name=form.name.data,
                     username=form.username.data,
-                    password=form.password.data)
+                    password_hash=password_hash)
         with get_session() as session:
             session.add(user)
+            record_signups(session)
             session.commit()
             flash('You can now login.')
             return redirect(url_for('auth.login'))
@@ -1,24 +1,29 @@
+import logging
 import random
 from datetime import datetime
 from io import BytesIO
 
-from flask import render_template, Blueprint, session, redirect, url_for, flash, send_file
+from flask import render_template, Blueprint, session, redirect, url_for, flash, send_file, jsonify, request, current_app
 from flask_login import login_required, current_user
-from gtts import gTTS
 
+from app.audio import get_clip, load_manifest, sprite_path
+from app.config import Config
+from app.model.web_bundle import load_manifest as load_web_bundle, weights_path as web_bundle_weights
+from app.streaming import make_stream_token
+from app.routes.hiragana import predict_drawing
 from app.database.models import Character, Course, Progress, Enrollment
 from app import get_session
 
+logger = logging.getLogger(__name__)
+
 course = Blueprint('course', __name__)
 
 
 @course.route('/<course_name>/draw', methods=['GET'])
 @login_required
 def draw(course_name):
-    if hasattr(current_user, 'id'):
-        print(f"User ID: {current_user.id}")
-    else:
-        print("User has no ID attribute!")
+    if not hasattr(current_user, 'id'):
+        logger.warning("Authenticated user has no id attribute")
         flash('Authentication error. Please log in again.', 'error')
         return redirect(url_for('auth.login'))
 
@@ -93,10 +98,22 @@ def draw(course_name):
         learned_character_ids = {p.character_id for p in learned_progress}
         progress_percentage = (len(learned_character_ids) / len(all_characters)) * 100 if all_characters else 0
 
+        # Lets the page stream strokes for live recognition, when the ASGI app serves the stream
+        live_token = None
+        if Config.LIVE_RECOGNITION_ENABLED and current_app.config.get('LIVE_RECOGNITION_SERVED'):
+            live_token = make_stream_token(current_user.id, course.name, selected_character.kana)
+
+        # Lets the page recognize drawings itself once a bundle has been exported for the course
+        web_model_url = None
+        if Config.BROWSER_RECOGNITION_ENABLED and load_web_bundle(course.name):
+            web_model_url = url_for('course.web_model_manifest', course_name=course.name)
+
         return render_template('customer/draw.html',
                                character=selected_character,
                                course=course,
-                               progress=progress_percentage)
+                               progress=progress_percentage,
+                               live_token=live_token,
+                               web_model_url=web_model_url)
 
 
 @course.route('/<course_name>/learn', methods=['GET'])
@@ -153,11 +170,24 @@ def learn(course_name):
         # Calculate progress percentage
         progress_percentage = (len(learned_character_ids) / len(all_characters)) * 100 if all_characters else 0
 
+        # Locate the character's segment in the course audio sprite (falls back to per-character TTS)
+        audio_sprite = None
+        manifest = load_manifest(course_obj.name)
+        if manifest:
+            segment = manifest['segments'].get(str(selected_character.id))
+            if segment:
+                audio_sprite = {
+                    'url': url_for('course.audio_sprite', course_name=course_obj.name, version=manifest['version']),
+                    'start': segment['start'],
+                    'duration': segment['duration'],
+                }
+
         return render_template(
             'customer/learn.html',
             character=selected_character,
             course=course_obj,
-            progress=progress_percentage
+            progress=progress_percentage,
+            audio_sprite=audio_sprite
         )
 
 
@@ -170,14 +200,9 @@ def tts(course_name, character_id):
         if not character:
             return "Character not found", 404
 
-        # Generate TTS audio using gTTS
+        # Generate TTS audio using gTTS (cached on disk after the first request)
         try:
-            tts = gTTS(text=character.kana, lang='ja', slow=False)
-
-            # Save to BytesIO object
-            audio_io = BytesIO()
-            tts.write_to_fp(audio_io)
-            audio_io.seek(0)
+            audio_io = BytesIO(get_clip(character))
 
             return send_file(
                 audio_io,
@@ -189,6 +214,75 @@ def tts(course_name, character_id):
             return f"Error generating audio: {str(e)}", 500
 
 
+@course.route('/<course_name>/audio/manifest.json', methods=['GET'])
+@login_required
+def audio_manifest(course_name):
+    manifest = load_manifest(course_name)
+    if not manifest:
+        return jsonify({'success': False, 'error': 'No audio sprite built for this course'}), 404
+
+    response = jsonify({
+        'version': manifest['version'],
+        'url': url_for('course.audio_sprite', course_name=course_name, version=manifest['version']),
+        'sample_rate': manifest['sample_rate'],
+        'segments': manifest['segments'],
+    })
+    # The manifest changes when the sprite is rebuilt, so clients revalidate it by version
+    response.set_etag(manifest['version'])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@course.route('/<course_name>/audio/<version>.mp3', methods=['GET'])
+def audio_sprite(course_name, version):
+    if not version.isalnum():
+        return "Audio sprite not found", 404
+
+    path = sprite_path(course_name, version)
+    if not path.exists():
+        return "Audio sprite not found", 404
+
+    # Sprite names are content-addressed, so they never change once published
+    response = send_file(path, mimetype='audio/mpeg', max_age=31536000, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@course.route('/<course_name>/model/manifest.json', methods=['GET'])
+@login_required
+def web_model_manifest(course_name):
+    manifest = load_web_bundle(course_name)
+    if not manifest:
+        return jsonify({'success': False, 'error': 'No browser model exported for this course'}), 404
+
+    response = jsonify(dict(
+        {key: manifest[key] for key in ('version', 'model_version', 'input', 'output', 'layers', 'labels', 'romaji',
+                                        'weights_length')},
+        weights_url=url_for('course.web_model_weights', course_name=course_name, version=manifest['version']),
+    ))
+    # The manifest changes when a bundle is exported, so clients revalidate it by version
+    response.set_etag(manifest['version'])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@course.route('/<course_name>/model/<version>.bin', methods=['GET'])
+def web_model_weights(course_name, version):
+    if not version.isalnum():
+        return "Model weights not found", 404
+
+    path = web_bundle_weights(course_name, version)
+    if not path.exists():
+        return "Model weights not found", 404
+
+    # Weight files are content-addressed, so they never change once published
+    response = send_file(path, mimetype='application/octet-stream', max_age=31536000, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 @course.route('/<course_name>/learn/next', methods=['POST'])
 @login_required
 def learn_next(course_name):
@@ -298,6 +392,15 @@ def learn_previous(course_name):
         return redirect(url_for('course.learn', course_name=course_name))
 
 
+@course.route('/<course_name>/predict', methods=['POST'])
+@login_required
+def predict(course_name):
+    """
+    Recognize a drawing with the course's own model
+    """
+    return predict_drawing(course_name)
+
+
 @course.route('/<course_name>/draw/next', methods=['POST'])
 @login_required
 def draw_next(course_name):
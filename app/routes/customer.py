@@ -2,13 +2,21 @@ from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
 from sqlalchemy.orm import Session
 from app.database.models import Course, Enrollment, Transaction, Pricing
-from app import get_engine
+from app import get_engine, current_user_key
+from app.cache import cached_page, enrolled_courses, forget_enrolled_courses
+from app.database.rollups import record_purchase
 
 customer = Blueprint('customer', __name__)
 
 
-@login_required
+def enrollment_key():
+    # Course list pages differ only by the user and the courses they are enrolled in
+    return current_user_key() + (tuple(enrolled_courses(current_user.id)),)
+
+
 @customer.route('/courses', methods=['GET'])
+@login_required
+@cached_page(vary=enrollment_key)
 def courses():
     engine = get_engine()
     with Session(engine) as db:
@@ -88,7 +96,11 @@ def purchase():
             )
             db.add(enrollment)
 
+            # Dashboard rollups are updated in the same transaction
+            record_purchase(db, course.id, pricing.price)
+
             db.commit()
+            forget_enrolled_courses()
 
             return jsonify({
                 'success': True,
@@ -0,0 +1,175 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, request, jsonify
+from flask_login import login_required
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import get_read_engine
+from app.config import Config
+from app.database.models import User, Course, Character, Transaction, Enrollment, Progress
+from app.routes.admin import admin_required
+
+export = Blueprint('export', __name__)
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _transactions_query(course_name, start, end):
+    stmt = select(
+        Transaction.id.label('transaction_id'),
+        Transaction.user_id,
+        User.username,
+        Course.name.label('course'),
+        Transaction.price,
+        Transaction.card_number,
+        Transaction.created_at,
+    ).join(User, User.id == Transaction.user_id).join(Course, Course.id == Transaction.course_id)
+
+    if course_name:
+        stmt = stmt.where(Course.name == course_name)
+    if start:
+        stmt = stmt.where(Transaction.created_at >= start)
+    if end:
+        stmt = stmt.where(Transaction.created_at < end)
+    return stmt.order_by(Transaction.id)
+
+
+def _enrollments_query(course_name, start, end):
+    stmt = select(
+        Enrollment.id.label('enrollment_id'),
+        Enrollment.user_id,
+        User.username,
+        Course.name.label('course'),
+        Enrollment.transaction_id,
+        Transaction.created_at.label('enrolled_at'),
+    ).join(User, User.id == Enrollment.user_id).join(Course, Course.id == Enrollment.course_id).join(
+        Transaction, Transaction.id == Enrollment.transaction_id
+    )
+
+    if course_name:
+        stmt = stmt.where(Course.name == course_name)
+    if start:
+        stmt = stmt.where(Transaction.created_at >= start)
+    if end:
+        stmt = stmt.where(Transaction.created_at < end)
+    return stmt.order_by(Enrollment.id)
+
+
+def _progress_query(course_name, start, end):
+    stmt = select(
+        Progress.user_id,
+        User.username,
+        Course.name.label('course'),
+        Character.kana,
+        Character.romaji,
+        Progress.learned,
+        Progress.answered,
+        Progress.created_at,
+        Progress.updated_at,
+    ).join(User, User.id == Progress.user_id).join(Course, Course.id == Progress.course_id).join(
+        Character, Character.id == Progress.character_id
+    )
+
+    if course_name:
+        stmt = stmt.where(Course.name == course_name)
+    if start:
+        stmt = stmt.where(Progress.updated_at >= start)
+    if end:
+        stmt = stmt.where(Progress.updated_at < end)
+    return stmt.order_by(Progress.user_id, Progress.course_id, Progress.character_id)
+
+
+EXPORTS = {
+    'transactions': _transactions_query,
+    'enrollments': _enrollments_query,
+    'progress': _progress_query,
+}
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _mask_card(row):
+    # Exports leave the admin area, so card numbers only keep their last four digits
+    if 'card_number' in row and row['card_number']:
+        row['card_number'] = '****' + row['card_number'][-4:]
+    return row
+
+
+def stream_rows(stmt, fmt):
+    """
+    Yield the export body in chunks, one chunk per batch of rows fetched from a server-side cursor
+    (on the read replica when one is configured)
+    """
+    with Session(get_read_engine()) as db:
+        result = db.execute(stmt.execution_options(yield_per=Config.EXPORT_BATCH_SIZE))
+        columns = list(result.keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == 'csv' else None
+
+        if writer:
+            writer.writerow(columns)
+
+        for partition in result.partitions():
+            for row in partition:
+                record = _mask_card({column: _serialize(value) for column, value in zip(columns, row)})
+                if writer:
+                    writer.writerow(record.values())
+                else:
+                    buffer.write(json.dumps(record, ensure_ascii=False))
+                    buffer.write('\n')
+
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        # Header-only CSV (or nothing at all) when no rows match
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+def _parse_day(value):
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+@export.route('/<kind>.<fmt>', methods=['GET'])
+@login_required
+@admin_required
+def download(kind, fmt):
+    """
+    Stream a full export, e.g. /admin/export/transactions.csv?course=Hiragana&start=2026-01-01&end=2026-01-31
+    """
+    if kind not in EXPORTS or fmt not in FORMATS:
+        return jsonify({'success': False, 'error': 'Unknown export'}), 404
+
+    try:
+        start = _parse_day(request.args.get('start'))
+        end = _parse_day(request.args.get('end'))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must use the YYYY-MM-DD format'}), 400
+
+    # The end date is inclusive
+    if end:
+        end += timedelta(days=1)
+
+    stmt = EXPORTS[kind](request.args.get('course'), start, end)
+    filename = f"{kind}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+
+    response = Response(stream_rows(stmt, fmt), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Let proxies pass chunks through as they are produced
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.cache_control.no_store = True
+    return response
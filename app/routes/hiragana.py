@@ -1,77 +1,77 @@
-import sys
-import os
+import logging
+import random
 from flask import Blueprint, request, jsonify, session
 from flask_login import login_required, current_user
 from datetime import datetime
 
-# Get the absolute path to the project root
-current_dir = os.path.dirname(os.path.abspath(__file__))
-project_root = os.path.dirname(os.path.dirname(current_dir))  # Goes up two levels from app/routes
-
-# Add model directory to path - THREE possible locations to try
-possible_model_paths = [
-    os.path.join(project_root, 'app', 'model'),  # /Language-learn/app/model
-    os.path.join(project_root, 'model'),         # /Language-learn/model
-    os.path.join(current_dir, '..', 'model'),    # /app/routes/../model
-]
-
-model_path_added = False
-for model_path in possible_model_paths:
-    if os.path.exists(model_path):
-        sys.path.insert(0, model_path)  # Insert at beginning to ensure it's found first
-        sys.path.insert(0, os.path.dirname(model_path))  # Also add parent directory
-        print(f"✅ Added model path: {model_path}")
-        model_path_added = True
-        break
-
-if not model_path_added:
-    print(f"❌ Could not find model directory. Tried:")
-    for path in possible_model_paths:
-        print(f"  - {path}")
-    
-    # Print current directory structure for debugging
-    print(f"\nCurrent directory: {current_dir}")
-    print(f"Project root: {project_root}")
-    print(f"Files in project root:")
-    try:
-        for item in os.listdir(project_root):
-            print(f"  - {item}")
-    except:
-        pass
-
-# Import the recognizer
-try:
-    from predict_character import get_recognizer
-    recognizer = get_recognizer()
-    print("✅ Hiragana recognizer loaded successfully in hiragana blueprint")
-    print(f"📚 Characters available: {list(recognizer.label_encoder['index_to_char'].values())}")
-except ImportError as e:
-    print(f"❌ Import error: {e}")
-    print(f"Current sys.path:")
-    for path in sys.path:
-        print(f"  - {path}")
-    recognizer = None
-except Exception as e:
-    print(f"❌ Failed to load recognizer in hiragana blueprint: {e}")
-    import traceback
-    traceback.print_exc()
-    recognizer = None
+from app import metrics
+from app.config import Config
+from app.executors import ExecutorBusy, inference_executor
+from app.model.registry import recognizers, RecognizerUnavailable
+from app.model.web_bundle import load_manifest as load_web_bundle
+
+logger = logging.getLogger(__name__)
+
+recognizers.timing_hook = metrics.observe_recognizer_stage
+recognizers.exit_hook = metrics.count_recognizer_exit
+if Config.DRAWING_CAPTURE_ENABLED:
+    from app.model.drawing_store import store as drawing_store
+    recognizers.capture_hook = drawing_store.capture
 
 hiragana_bp = Blueprint('hiragana', __name__, url_prefix='/hiragana')
 
-# Rest of the code remains the same...
-@hiragana_bp.route('/predict', methods=['POST'])
-@login_required
-def predict_character():
+
+def _trust_claim(course_name, claim, recognizer, user_id):
     """
-    Handle character prediction from drawing
+    Whether a correct answer claimed by the page's browser-side recognizer may be recorded without
+    the server model: only claims from the course's current bundle of the serving model qualify, of
+    those CLIENT_VERIFY_SAMPLE_RATE are checked anyway, and a learner with a rejected claim is always checked
+    """
+    bundle = load_web_bundle(course_name)
+    if bundle is None or bundle['model_version'] != recognizer.version:
+        return False
+    if claim.get('bundle_version') != bundle['version']:
+        return False
+    if random.random() < Config.CLIENT_VERIFY_SAMPLE_RATE:
+        return False
+    from app import get_session
+    from app.database.models import ClaimRejection
+
+    with get_session() as db:
+        return db.get(ClaimRejection, user_id) is None
+
+
+def _record_rejected_claim(user_id):
+    # Resubmitting until a forged claim goes unchecked stops paying off after the first rejection
+    from app import get_session
+    from app.database.models import ClaimRejection
+
+    with get_session() as db:
+        if db.get(ClaimRejection, user_id) is None:
+            db.add(ClaimRejection(user_id=user_id))
+            db.commit()
+
+
+def predict_drawing(course_name):
+    """
+    Recognize a drawing with the course's model and record progress when it matches the
+    character being practised. A drawing the page already recognized in the browser carries
+    its answer as "client_result"; a correct one is re-checked by the server model on a sampled basis.
     """
-    if recognizer is None:
+    try:
+        recognizer = recognizers.get(course_name)
+    except RecognizerUnavailable as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+    except Exception:
+        logger.exception("Failed to load the %s recognizer", course_name)
         return jsonify({
             'success': False,
             'error': 'Recognizer not initialized. Please try again later.'
         }), 500
-    
+
     try:
         data = request.get_json()
         
@@ -88,21 +88,65 @@ def predict_character():
         target_char = None
         if current_character_id and current_course_id:
             from app import get_session
-            from app.database.models import Character
+            from app.database.models import Character, Course
             
             with get_session() as db:
                 character = db.query(Character).filter_by(id=current_character_id).first()
-                if character:
+                course = db.query(Course).filter_by(id=current_course_id).first()
+                # Only grade against the session's character when it belongs to this course
+                if character and course and course.name.lower() == course_name.lower():
                     target_char = character.kana
         
         # Get image data
         image_data = data['image']
         
-        # Make prediction
-        result = recognizer.predict(image_data, target_char)
+        claim = data.get('client_result')
+        if not isinstance(claim, dict):
+            claim = None
+        claimed_correct = claim is not None and bool(target_char) and claim.get('recognized_text') == target_char
+        
+        if claimed_correct and _trust_claim(course_name, claim, recognizer, current_user.id):
+            # Spared the server model: record the browser's answer as it is
+            try:
+                confidence = float(claim.get('confidence', 0))
+            except (TypeError, ValueError):
+                confidence = 0.0
+            if not 0.0 <= confidence <= 1.0:
+                confidence = 0.0
+            result = {
+                'success': True,
+                'recognized_text': target_char,
+                'romaji': recognizer.char_to_romaji.get(target_char, target_char),
+                'confidence': confidence,
+                'is_correct': True,
+                'message': recognizer.get_message(True, confidence),
+                'top_predictions': [],
+                'stage': 'browser',
+                'verified': False,
+            }
+            metrics.registry.inc('browser_recognition_claims_total',
+                                 (('course', course_name.lower()), ('outcome', 'trusted')))
+        else:
+            # Make prediction on the bounded inference pool
+            try:
+                result = inference_executor.run(recognizer.predict, image_data, target_char)
+            except ExecutorBusy:
+                return jsonify({
+                    'success': False,
+                    'error': 'Recognizer is busy. Please try again in a moment.'
+                }), 503
+            if claimed_correct:
+                result['verified'] = True
+                outcome = 'confirmed' if result.get('is_correct') else 'rejected'
+                metrics.registry.inc('browser_recognition_claims_total',
+                                     (('course', course_name.lower()), ('outcome', outcome)))
+                if outcome == 'rejected':
+                    _record_rejected_claim(current_user.id)
+        
+        result['model_version'] = recognizer.version
         
         # If prediction is correct, update progress
-        if result.get('is_correct', False) and current_character_id and current_course_id:
+        if result.get('is_correct', False) and target_char:
             from app.database.models import Progress
             
             with get_session() as db:
@@ -134,13 +178,22 @@ def predict_character():
         return jsonify(result)
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Prediction failed")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+
+@hiragana_bp.route('/predict', methods=['POST'])
+@login_required
+def predict_character():
+    """
+    Handle character prediction from drawing
+    """
+    return predict_drawing('Hiragana')
+
+
 @hiragana_bp.route('/skip', methods=['POST'])
 @login_required
 def skip_character():
@@ -0,0 +1,46 @@
+from concurrent.futures import TimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app.config import Config
+from app.executors import BoundedExecutor, ExecutorBusy
+
+# Password hashing is deliberately slow, so it runs on its own small pool. Once the pool and
+# its queue are full, further logins fail fast instead of starving every request thread.
+password_executor = BoundedExecutor('password', Config.PASSWORD_HASH_WORKERS, Config.PASSWORD_HASH_QUEUE)
+
+# Normalized method prefix of hashes produced with the current settings, e.g. "scrypt:32768:8:1"
+_current_method = None
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=Config.PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+def current_method():
+    global _current_method
+    if _current_method is None:
+        # Werkzeug fills in default parameters, so derive the full prefix from a real hash
+        _current_method = hash_password('').split('$', 1)[0]
+    return _current_method
+
+
+def needs_rehash(password_hash):
+    """
+    Whether a stored hash was produced with a different algorithm or cost than configured
+    """
+    return password_hash.split('$', 1)[0] != current_method()
+
+
+def run_hashing(fn, *args):
+    """
+    Run a hashing call on the password pool and wait for it (raises ExecutorBusy when saturated)
+    """
+    try:
+        return password_executor.run(fn, *args, timeout=Config.PASSWORD_HASH_TIMEOUT)
+    except TimeoutError:
+        raise ExecutorBusy('password hashing timed out')
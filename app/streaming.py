@@ -0,0 +1,256 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+import numpy as np
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from app import metrics
+from app.config import Config
+from app.executors import ExecutorBusy, inference_executor
+from app.model.raster import StrokeRaster
+
+logger = logging.getLogger(__name__)
+
+# Lifetime of the token the drawing page opens its stream with
+TOKEN_MAX_AGE = 3600
+
+# Prefix of this process's session ids: sessions live in one worker's memory, so a stroke delta
+# routed to another worker can be told apart from an unknown session
+WORKER_ID = secrets.token_hex(4)
+
+
+def _serializer():
+    return URLSafeTimedSerializer(Config.SECRET_KEY, salt='live-recognition')
+
+
+def make_stream_token(user_id, course_name, target_char=None):
+    """
+    Signed token letting the drawing page open a live-recognition stream for one course and character
+    """
+    return _serializer().dumps({'user': user_id, 'course': course_name.lower(), 'target': target_char})
+
+
+def read_stream_token(token):
+    """
+    The claims of a stream token, or None when it is forged or expired
+    """
+    try:
+        return _serializer().loads(token, max_age=TOKEN_MAX_AGE)
+    except BadSignature:
+        return None
+
+
+class LiveSession:
+    """
+    One open stream: the drawing's incremental raster and the events waiting to be sent
+    """
+
+    def __init__(self, course, target_char):
+        self.id = f'{WORKER_ID}-{secrets.token_urlsafe(16)}'
+        self.course = course
+        self.target_char = target_char
+        self.raster = StrokeRaster(max_points=Config.LIVE_RECOGNITION_MAX_POINTS)
+        # The raster as it was last recognized, only touched by the batch on the inference pool
+        self.recognized = np.zeros_like(self.raster.render())
+        self.events = asyncio.Queue(maxsize=4)
+        self.timer = None
+        self.pending_since = None
+        self.busy = False
+        self.closed = False
+        self.last_activity = time.monotonic()
+
+    def push(self, event, data):
+        # Only the latest answers matter: a slow client loses the oldest ones
+        if self.events.full():
+            self.events.get_nowait()
+        self.events.put_nowait((event, data))
+
+
+def _recognize_batch(course, sessions, min_change):
+    # On the inference pool: render each raster and run the ones that changed in one model call
+    from app.model.registry import recognizers
+
+    recognizer = recognizers.get(course)
+    images = np.empty((len(sessions), 28, 28), dtype=np.float32)
+    changed, results = [], []
+    for session in sessions:
+        image = session.raster.render(out=images[len(changed)])
+        if np.abs(image - session.recognized).mean() < min_change:
+            continue
+        session.recognized = image.copy()
+        if image.any():
+            changed.append(session)
+        else:
+            # Cleared canvas: nothing to recognize
+            results.append((session, {'top_predictions': [], 'is_correct': False,
+                                      'model_version': recognizer.version}))
+
+    if changed:
+        with recognizer.limiter or nullcontext():
+            scores = recognizer.full_scores(images[:len(changed)])
+        for session, row in zip(changed, scores):
+            top = recognizer.top_predictions(row)
+            results.append((session, {
+                'top_predictions': top,
+                'is_correct': bool(session.target_char) and top[0]['character'] == session.target_char,
+                'model_version': recognizer.version,
+            }))
+    return results
+
+
+class LiveRecognition:
+    """
+    Live-recognition streams of this process. Stroke deltas update a session's raster right away;
+    recognition runs once the drawing has paused for `debounce` seconds (and at least every
+    `max_delay` while it keeps changing). Sessions due at about the same time are collected for up
+    to `batch_window` seconds, or for as long as the course's previous batch is still running, and
+    recognized in one batch on the inference pool. A model call costs about the same for one drawing
+    as for dozens, so batches grow with the load. Only sessions whose raster changed by at least
+    `min_change` (mean absolute pixel difference) reach the model.
+    """
+
+    def __init__(self, max_streams, debounce, max_delay, min_change, batch_window, batch_size):
+        self.max_streams = max_streams
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.min_change = min_change
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.sessions = {}  # id -> LiveSession
+        self._waiting = {}  # course -> sessions due for recognition
+        self._flush_timers = {}  # course -> timer flushing its waiting sessions
+        self._running = Counter()  # course -> batches on the inference pool
+
+    def open(self, course, target_char):
+        """
+        A new session, or None when this process already holds max_streams
+        """
+        if len(self.sessions) >= self.max_streams:
+            return None
+        session = LiveSession(course.lower(), target_char)
+        self.sessions[session.id] = session
+        return session
+
+    def owns(self, session_id):
+        """
+        Whether the session id was issued by this process, open or not
+        """
+        return session_id.split('-', 1)[0] == WORKER_ID
+
+    def close(self, session):
+        session.closed = True
+        if session.timer is not None:
+            session.timer.cancel()
+        self.sessions.pop(session.id, None)
+
+    def apply(self, session, delta):
+        """
+        Apply a stroke delta: {"clear": true} and {"undo": [stroke ids]} first, then
+        {"strokes": [{"id": n, "points": [[x, y], ...]}, ...]}. Returns False when points were
+        dropped because the drawing is at its point limit; raises ValueError for a malformed delta.
+        """
+        if not isinstance(delta, dict):
+            raise ValueError('Delta must be an object')
+        try:
+            undone = [int(stroke_id) for stroke_id in delta.get('undo', [])]
+            parsed = [(int(stroke['id']), [(float(x), float(y)) for x, y in stroke['points']])
+                      for stroke in delta.get('strokes', [])]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('undo needs stroke ids, and each stroke an id and [x, y] points') from None
+
+        if delta.get('clear'):
+            session.raster.clear()
+        for stroke_id in undone:
+            session.raster.remove(stroke_id)
+        accepted = all([session.raster.add(stroke_id, points) for stroke_id, points in parsed])
+        session.last_activity = time.monotonic()
+        self._schedule(session)
+        return accepted
+
+    def _schedule(self, session):
+        # Debounce, but don't postpone past max_delay since the first unrecognized change
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if session.pending_since is None:
+            session.pending_since = now
+        delay = min(self.debounce, max(0.0, session.pending_since + self.max_delay - now))
+        if session.timer is not None:
+            session.timer.cancel()
+        session.timer = loop.call_later(delay, self._due, session)
+
+    def _due(self, session):
+        session.timer = None
+        if session.closed:
+            return
+        if session.busy:
+            # Its previous batch is still running; come back when the next one can see the result
+            session.timer = asyncio.get_running_loop().call_later(self.debounce, self._due, session)
+            return
+        session.pending_since = None
+        session.busy = True
+        waiting = self._waiting.setdefault(session.course, [])
+        waiting.append(session)
+        if len(waiting) >= self.batch_size:
+            self._flush(session.course)
+        elif session.course not in self._flush_timers and not self._running[session.course]:
+            self._flush_timers[session.course] = asyncio.get_running_loop().call_later(
+                self.batch_window, self._flush, session.course)
+
+    def _flush(self, course):
+        timer = self._flush_timers.pop(course, None)
+        if timer is not None:
+            timer.cancel()
+        # Waiting sessions join the next batch once the running one is done
+        if self._running[course] and len(self._waiting.get(course, [])) < self.batch_size:
+            return
+        sessions = self._waiting.pop(course, [])
+        if sessions:
+            self._running[course] += 1
+            asyncio.ensure_future(self._recognize(course, sessions))
+
+    async def _recognize(self, course, sessions):
+        try:
+            results = await inference_executor.run_async(_recognize_batch, course, sessions, self.min_change)
+        except ExecutorBusy:
+            # Live answers are best effort: try again after the next pause
+            results = None
+        except Exception:
+            logger.exception("Live recognition failed for %s", course)
+            results = []
+        finally:
+            self._running[course] -= 1
+
+        for session in sessions:
+            session.busy = False
+            if results is None and not session.closed:
+                self._schedule(session)
+        for session, result in results or []:
+            if not session.closed:
+                session.push('prediction', result)
+        if self._waiting.get(course):
+            self._flush(course)
+
+
+def encode_event(event, data):
+    """
+    One server-sent event
+    """
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode()
+
+
+live = LiveRecognition(
+    max_streams=Config.LIVE_RECOGNITION_MAX_STREAMS,
+    debounce=Config.LIVE_RECOGNITION_DEBOUNCE_MS / 1000,
+    max_delay=Config.LIVE_RECOGNITION_MAX_DELAY_MS / 1000,
+    min_change=Config.LIVE_RECOGNITION_MIN_CHANGE,
+    batch_window=Config.LIVE_RECOGNITION_BATCH_WINDOW_MS / 1000,
+    batch_size=Config.LIVE_RECOGNITION_BATCH_SIZE,
+)
+
+metrics.registry.gauge_callback('live_recognition_streams', 'Open live-recognition streams in this process.',
+                                lambda: [((), len(live.sessions))])
@@ -0,0 +1,309 @@
+// Browser-side handwriting recognition: runs a weight bundle exported by app/model/web_bundle.py.
+// Preprocessing follows app/model/preprocess.py (including OpenCV's fixed-point bilinear resize), and
+// the layers follow the bundle's numpy reference; "python -m app.model.web_bundle" runs this file under
+// node and compares its logits with the server model before publishing a bundle.
+(function (root) {
+    "use strict";
+
+    // OpenCV's resize coefficients: 11 fractional bits
+    const COEF_SCALE = 2048;
+
+    function roundHalfEven(value) {
+        const rounded = Math.round(value);
+        return Math.abs(value % 1) === 0.5 && rounded % 2 !== 0 ? rounded - 1 : rounded;
+    }
+
+    // Source index and fixed-point weights of each output pixel along one axis (cv2.INTER_LINEAR)
+    function linearTaps(srcSize, dstSize) {
+        const scale = srcSize / dstSize;
+        const taps = [];
+        for (let d = 0; d < dstSize; d++) {
+            let f = Math.fround((d + 0.5) * scale - 0.5);
+            let s = Math.floor(f);
+            f = Math.fround(f - s);
+            if (s < 0) {
+                f = 0;
+                s = 0;
+            }
+            if (s >= srcSize - 1) {
+                f = 0;
+                s = srcSize - 1;
+            }
+            taps.push([s, Math.min(s + 1, srcSize - 1),
+                roundHalfEven((1 - f) * COEF_SCALE), roundHalfEven(f * COEF_SCALE)]);
+        }
+        return taps;
+    }
+
+    // Resize the (x, y, w, h) region of a grayscale image into the (dx, dy, dw, dh) region of a 28x28 square
+    function resizeInto(gray, stride, x, y, w, h, square, size, dx, dy, dw, dh) {
+        if (w === 2 * dw && h === 2 * dh) {
+            // OpenCV averages 2x2 blocks for an exact halving
+            for (let r = 0; r < dh; r++) {
+                for (let c = 0; c < dw; c++) {
+                    const i = (y + 2 * r) * stride + x + 2 * c;
+                    square[(dy + r) * size + dx + c] = (gray[i] + gray[i + 1] + gray[i + stride] + gray[i + stride + 1] + 2) >> 2;
+                }
+            }
+            return;
+        }
+        const columns = linearTaps(w, dw);
+        const rows = linearTaps(h, dh);
+        const above = new Int32Array(dw);
+        const below = new Int32Array(dw);
+        for (let r = 0; r < dh; r++) {
+            const [s0, s1, b0, b1] = rows[r];
+            for (const [line, out] of [[s0, above], [s1, below]]) {
+                const offset = (y + line) * stride + x;
+                for (let c = 0; c < dw; c++) {
+                    const [t0, t1, a0, a1] = columns[c];
+                    out[c] = gray[offset + t0] * a0 + gray[offset + t1] * a1;
+                }
+            }
+            for (let c = 0; c < dw; c++) {
+                // OpenCV's vectorized vertical pass: 16-bit high multiplies, then a rounding shift
+                const value = (((above[c] >> 4) * b0) >> 16) + (((below[c] >> 4) * b1) >> 16);
+                square[(dy + r) * size + dx + c] = Math.min(255, Math.max(0, (value + 2) >> 2));
+            }
+        }
+    }
+
+    // A grayscale canvas (dark ink on white) as the model's 28x28 input: the ink cropped with a margin,
+    // scaled to fit and centred, inverted and scaled to [0, 1]
+    function preprocess(gray, width, height, size = 28, inkLevel = 230, padding = 5) {
+        let left = width, top = height, right = -1, bottom = -1;
+        for (let y = 0; y < height; y++) {
+            const offset = y * width;
+            for (let x = 0; x < width; x++) {
+                if (gray[offset + x] < inkLevel) {
+                    if (x < left) left = x;
+                    if (x > right) right = x;
+                    if (y < top) top = y;
+                    if (y > bottom) bottom = y;
+                }
+            }
+        }
+
+        const square = new Uint8Array(size * size).fill(255);
+        if (right >= 0) {
+            const x = Math.max(0, left - padding);
+            const y = Math.max(0, top - padding);
+            const w = Math.min(width - x, right - left + 1 + 2 * padding);
+            const h = Math.min(height - y, bottom - top + 1 + 2 * padding);
+            const scale = size / Math.max(w, h);
+            const newW = Math.max(1, Math.trunc(w * scale));
+            const newH = Math.max(1, Math.trunc(h * scale));
+            resizeInto(gray, width, x, y, w, h, square, size,
+                Math.floor((size - newW) / 2), Math.floor((size - newH) / 2), newW, newH);
+        } else {
+            resizeInto(gray, width, 0, 0, width, height, square, size, 0, 0, size, size);
+        }
+
+        const input = new Float32Array(size * size);
+        for (let i = 0; i < input.length; i++) {
+            input[i] = (255 - square[i]) / 255;
+        }
+        return input;
+    }
+
+    // The red channel of canvas RGBA pixels: the page draws black ink on white, so every pixel is gray
+    function canvasGray(imageData) {
+        const gray = new Uint8Array(imageData.width * imageData.height);
+        for (let i = 0; i < gray.length; i++) {
+            gray[i] = imageData.data[4 * i];
+        }
+        return gray;
+    }
+
+    function samePadding(size, kernel, stride) {
+        const total = Math.max((Math.ceil(size / stride) - 1) * stride + kernel - size, 0);
+        return Math.floor(total / 2);
+    }
+
+    function outputSize(size, kernel, stride, padding) {
+        return padding === "same" ? Math.ceil(size / stride) : Math.floor((size - kernel) / stride) + 1;
+    }
+
+    function activate(values, activation) {
+        if (activation === "relu") {
+            for (let i = 0; i < values.length; i++) {
+                if (values[i] < 0) values[i] = 0;
+            }
+        } else if (activation === "softmax") {
+            const probabilities = softmax(values);
+            values.set(probabilities);
+        }
+        return values;
+    }
+
+    function softmax(logits) {
+        let max = -Infinity;
+        for (const value of logits) max = Math.max(max, value);
+        const exp = Float64Array.from(logits, (value) => Math.exp(value - max));
+        const sum = exp.reduce((a, b) => a + b, 0);
+        return Float32Array.from(exp, (value) => value / sum);
+    }
+
+    // Feature maps are channel-last Float32Arrays with their [height, width, channels]
+    function conv2d(x, shape, kernel, kernelShape, bias, strides, padding) {
+        const [height, width, channels] = shape;
+        const [kh, kw, , filters] = kernelShape;
+        const outH = outputSize(height, kh, strides[0], padding);
+        const outW = outputSize(width, kw, strides[1], padding);
+        const top = padding === "same" ? samePadding(height, kh, strides[0]) : 0;
+        const left = padding === "same" ? samePadding(width, kw, strides[1]) : 0;
+        const out = new Float32Array(outH * outW * filters);
+        const sums = new Float64Array(filters);
+        for (let oy = 0; oy < outH; oy++) {
+            for (let ox = 0; ox < outW; ox++) {
+                sums.set(bias);
+                for (let ky = 0; ky < kh; ky++) {
+                    const iy = oy * strides[0] + ky - top;
+                    if (iy < 0 || iy >= height) continue;
+                    for (let kx = 0; kx < kw; kx++) {
+                        const ix = ox * strides[1] + kx - left;
+                        if (ix < 0 || ix >= width) continue;
+                        const inputOffset = (iy * width + ix) * channels;
+                        const kernelOffset = (ky * kw + kx) * channels * filters;
+                        for (let c = 0; c < channels; c++) {
+                            const value = x[inputOffset + c];
+                            if (value === 0) continue;
+                            const row = kernelOffset + c * filters;
+                            for (let f = 0; f < filters; f++) {
+                                sums[f] += value * kernel[row + f];
+                            }
+                        }
+                    }
+                }
+                out.set(sums, (oy * outW + ox) * filters);
+            }
+        }
+        return [out, [outH, outW, filters]];
+    }
+
+    function maxPool(x, shape, poolSize, strides, padding) {
+        const [height, width, channels] = shape;
+        const outH = outputSize(height, poolSize[0], strides[0], padding);
+        const outW = outputSize(width, poolSize[1], strides[1], padding);
+        const top = padding === "same" ? samePadding(height, poolSize[0], strides[0]) : 0;
+        const left = padding === "same" ? samePadding(width, poolSize[1], strides[1]) : 0;
+        const out = new Float32Array(outH * outW * channels).fill(-Infinity);
+        for (let oy = 0; oy < outH; oy++) {
+            for (let ox = 0; ox < outW; ox++) {
+                const outOffset = (oy * outW + ox) * channels;
+                for (let py = 0; py < poolSize[0]; py++) {
+                    const iy = oy * strides[0] + py - top;
+                    if (iy < 0 || iy >= height) continue;
+                    for (let px = 0; px < poolSize[1]; px++) {
+                        const ix = ox * strides[1] + px - left;
+                        if (ix < 0 || ix >= width) continue;
+                        const inputOffset = (iy * width + ix) * channels;
+                        for (let c = 0; c < channels; c++) {
+                            out[outOffset + c] = Math.max(out[outOffset + c], x[inputOffset + c]);
+                        }
+                    }
+                }
+            }
+        }
+        return [out, [outH, outW, channels]];
+    }
+
+    class Model {
+        constructor(manifest, weights) {
+            this.manifest = manifest;
+            this.version = manifest.version;
+            this.labels = manifest.labels;
+            this.romaji = manifest.romaji;
+            this.layers = manifest.layers.map((spec) => ({
+                spec,
+                weights: spec.weights.map(([shape, offset]) => ({
+                    shape,
+                    values: weights.subarray(offset, offset + shape.reduce((a, b) => a * b, 1)),
+                })),
+            }));
+        }
+
+        static async load(manifestUrl) {
+            const manifest = await (await fetch(manifestUrl, { credentials: "same-origin" })).json();
+            const response = await fetch(manifest.weights_url, { credentials: "same-origin" });
+            const weights = new Float32Array(await response.arrayBuffer());
+            if (weights.byteLength !== manifest.weights_length) {
+                throw new Error("Incomplete model weights");
+            }
+            return new Model(manifest, weights);
+        }
+
+        // Logits for one preprocessed 28x28 input
+        logits(input) {
+            const size = this.manifest.input.size;
+            let x = Float32Array.from(input);
+            let shape = [size, size, 1];
+            for (const { spec, weights } of this.layers) {
+                if (spec.type === "conv2d") {
+                    [x, shape] = conv2d(x, shape, weights[0].values, weights[0].shape, weights[1].values,
+                        spec.strides, spec.padding);
+                    activate(x, spec.activation);
+                } else if (spec.type === "dense") {
+                    const [inputs, units] = weights[0].shape;
+                    const kernel = weights[0].values;
+                    const sums = Float64Array.from(weights[1].values);
+                    for (let i = 0; i < inputs; i++) {
+                        const value = x[i];
+                        if (value === 0) continue;
+                        for (let u = 0; u < units; u++) {
+                            sums[u] += value * kernel[i * units + u];
+                        }
+                    }
+                    x = activate(Float32Array.from(sums), spec.activation);
+                    shape = [units];
+                } else if (spec.type === "scale") {
+                    const [scale, shift] = [weights[0].values, weights[1].values];
+                    for (let i = 0; i < x.length; i++) {
+                        const c = i % scale.length;
+                        x[i] = x[i] * scale[c] + shift[c];
+                    }
+                } else if (spec.type === "max_pool") {
+                    [x, shape] = maxPool(x, shape, spec.pool_size, spec.strides, spec.padding);
+                } else if (spec.type === "global_average_pool") {
+                    const channels = shape[2];
+                    const sums = new Float64Array(channels);
+                    for (let i = 0; i < x.length; i++) {
+                        sums[i % channels] += x[i];
+                    }
+                    const count = x.length / channels;
+                    x = Float32Array.from(sums, (sum) => sum / count);
+                    shape = [channels];
+                } else if (spec.type === "flatten") {
+                    shape = [x.length];
+                } else if (spec.type === "activation") {
+                    activate(x, spec.activation);
+                } else {
+                    throw new Error(`Unknown layer type ${spec.type}`);
+                }
+            }
+            return x;
+        }
+
+        // The k best characters of a canvas, best first, like the server's top_predictions
+        predictCanvas(imageData, k = 3) {
+            const input = preprocess(canvasGray(imageData), imageData.width, imageData.height,
+                this.manifest.input.size, this.manifest.input.ink_level, this.manifest.input.padding);
+            const probabilities = softmax(this.logits(input));
+            return Array.from(probabilities.keys())
+                .sort((a, b) => probabilities[b] - probabilities[a])
+                .slice(0, k)
+                .map((i) => ({
+                    character: this.labels[i],
+                    confidence: probabilities[i],
+                    romaji: this.romaji[this.labels[i]] || this.labels[i],
+                }));
+        }
+    }
+
+    const BrowserRecognizer = { Model, preprocess, softmax };
+    if (typeof module === "object" && module.exports) {
+        module.exports = BrowserRecognizer;
+    } else {
+        root.BrowserRecognizer = BrowserRecognizer;
+    }
+})(this);
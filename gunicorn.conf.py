@@ -0,0 +1,44 @@
+# Production launcher: gunicorn -c gunicorn.conf.py
+#
+# Every worker imports the app and loads the recognizer itself, after the fork. The app is not
+# preloaded in the master: a TensorFlow runtime created before fork() hangs the children on their
+# first prediction, so no TensorFlow state may exist in the master.
+import multiprocessing
+import os
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', str(max(1, cpu_count // 2))))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+wsgi_app = 'wsgi:app'
+preload_app = False
+
+# Split the cores between workers so their TensorFlow pools don't oversubscribe the box.
+# Set here so the workers inherit them before they import the app (and Config).
+os.environ.setdefault('TF_INTRA_OP_THREADS', str(max(1, cpu_count // workers)))
+os.environ.setdefault('TF_INTER_OP_THREADS', '1')
+os.environ.setdefault('OPENCV_THREADS', '1')
+
+
+def on_starting(server):
+    # Shared metric files of a previous run (Prometheus sees the restart as a counter reset)
+    from app.config import Config
+    if Config.METRICS_DIR:
+        import glob
+        for path in glob.glob(os.path.join(Config.METRICS_DIR, '*.json')):
+            os.remove(path)
+
+
+def post_worker_init(worker):
+    # Load and warm up the recognizer before the worker accepts requests
+    from app.model.registry import recognizers
+    recognizers.preload(['Hiragana'])
+
+    from app.memory import format_report, process_memory
+    worker.log.info("Worker memory after loading the recognizer:\n%s", format_report([process_memory(os.getpid())]))
@@ -3,6 +3,9 @@ from app.config import Config
 from app import create_app
 from app.database.seed import initialize_database as create_database
 from app.database.seed import clear_database, seed_database
+from app.audio import build_all_sprites
+from app.assets import build_assets
+from app.database.rollups import run_backfill
 
 app = create_app()
 
@@ -11,6 +14,11 @@ if __name__ == '__main__':
     parser.add_argument('--create', action='store_true', help='Create the database before seeding')
     parser.add_argument('--clear', action='store_true', help='Clear the database before seeding')
     parser.add_argument('--seed', action='store_true', help='Seed the database with predefined information')
+    parser.add_argument('--build-audio', action='store_true', help='Build the per-course audio sprites')
+    parser.add_argument('--build-assets', action='store_true', help='Fingerprint and precompress the static assets')
+    parser.add_argument('--backfill-rollups', action='store_true', help='Rebuild the admin dashboard rollups')
+    parser.add_argument('--asgi', action='store_true', help='Serve the app through the ASGI entry point (uvicorn)')
+    parser.add_argument('--force', action='store_true', help='Rebuild artifacts even if they are up to date')
     args = parser.parse_args()
 
     if args.create:
@@ -19,6 +27,17 @@ if __name__ == '__main__':
         clear_database()
     elif args.seed:
         seed_database()
+    elif args.build_audio:
+        build_all_sprites(force=args.force)
+    elif args.build_assets:
+        build_assets()
+    elif args.backfill_rollups:
+        run_backfill()
+    elif args.asgi:
+        import uvicorn
+        from app.asgi import create_asgi_app
+
+        uvicorn.run(create_asgi_app(app), host=Config.HOST, port=int(Config.PORT))
     else:
         app.run(
             host=Config.HOST,
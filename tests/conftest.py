@@ -0,0 +1,118 @@
+import os
+import tempfile
+from datetime import datetime
+
+import pytest
+
+# Config is read at import: point every path and the database at a scratch directory first
+_scratch = tempfile.mkdtemp(prefix='app-tests-')
+os.environ.update({
+    'DATABASE_URL': f'sqlite:///{_scratch}/test.sqlite',
+    'REPLICA_DATABASE_URL': '',
+    'SECRET_KEY': 'test-secret-key',
+    'DEBUG': 'False',
+    'LOG_FORMAT': 'text',
+    'LOG_LEVEL': 'WARNING',
+    'AUDIO_DIR': os.path.join(_scratch, 'audio'),
+    'ASSET_BUILD_DIR': os.path.join(_scratch, 'build'),
+    'PROFILE_DIR': os.path.join(_scratch, 'profiles'),
+    'DRAWING_STORE_DIR': os.path.join(_scratch, 'drawings'),
+    'WEB_MODEL_DIR': os.path.join(_scratch, 'web_models'),
+    'MODEL_WATCH_INTERVAL': '0',
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1',
+})
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+
+    flask_app = create_app()
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return flask_app
+
+
+@pytest.fixture
+def db(app):
+    """
+    Session on freshly created tables with the seeded roles. It is independent of the app's
+    thread-scoped session, which each request removes when it ends.
+    """
+    from sqlalchemy.orm import Session
+
+    from app import engine
+    from app.cache import page_cache
+    from app.database.models import Base, Role
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    page_cache.clear()
+    with Session(bind=engine, expire_on_commit=False) as session:
+        session.add_all([Role(code='ADMIN', name='Administrator'), Role(code='CUSTOMER', name='Customer')])
+        session.commit()
+        yield session
+
+
+@pytest.fixture
+def make_user(db):
+    from app.database.models import User
+
+    def make(username, role_code='CUSTOMER', created_at=None):
+        user = User(name=username, username=username, password_hash='-', role_code=role_code,
+                    created_at=created_at or datetime.utcnow())
+        db.add(user)
+        db.commit()
+        return user
+
+    return make
+
+
+@pytest.fixture
+def make_course(db):
+    from app.database.models import Course, Pricing
+
+    def make(name, price=1000):
+        course = Course(name=name)
+        db.add(course)
+        db.flush()
+        db.add(Pricing(course_id=course.id, price=price))
+        db.commit()
+        return course
+
+    return make
+
+
+@pytest.fixture
+def admin_client(app, make_user):
+    """
+    Test client signed in as an administrator
+    """
+    admin = make_user('admin', role_code='ADMIN')
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def make_enrollment(db):
+    """
+    A purchase as the checkout records it: transaction, enrollment and rollup increment
+    """
+    from app.database.models import Enrollment, Transaction
+    from app.database.rollups import record_purchase
+
+    def make(user, course, price=1000, created_at=None):
+        created_at = created_at or datetime.utcnow()
+        transaction = Transaction(user_id=user.id, course_id=course.id, card_number='4242424242424242',
+                                  price=price, created_at=created_at)
+        db.add(transaction)
+        db.flush()
+        enrollment = Enrollment(user_id=user.id, course_id=course.id, transaction_id=transaction.id)
+        db.add(enrollment)
+        record_purchase(db, course.id, price, day=created_at.date())
+        db.commit()
+        return enrollment
+
+    return make
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+
+from app.database.models import Enrollment, Transaction, User
+
+
+@pytest.fixture
+def enrolled(make_user, make_course, make_enrollment):
+    # Three customers enrolled in Hiragana, the first two before 2026-02-01
+    course = make_course('Hiragana')
+    users = [make_user(f'user{n}', created_at=datetime(2026, 1, n + 1)) for n in range(3)]
+    enrollments = [make_enrollment(user, course, created_at=datetime(2026, 1 + n // 2, 10))
+                   for n, user in enumerate(users)]
+    return users, enrollments
+
+
+def _ids(db, model):
+    db.expire_all()
+    return sorted(row.id for row in db.query(model).all())
+
+
+@pytest.mark.parametrize('enrollment_ids', ['12', [1, '2'], [True], 5, {'1': 1}])
+def test_revoke_rejects_malformed_ids(admin_client, db, enrolled, enrollment_ids):
+    before = _ids(db, Enrollment)
+    response = admin_client.post('/admin/enrollments/bulk', json={'enrollment_ids': enrollment_ids})
+    assert response.status_code == 400
+    assert _ids(db, Enrollment) == before
+
+
+@pytest.mark.parametrize('payload', [{'course': 'Hiragana', 'enrolled_before': 5},
+                                     {'course': 'Hiragana', 'enrolled_before': '01/02/2026'},
+                                     {'course': ['Hiragana']}])
+def test_revoke_rejects_malformed_filters(admin_client, db, enrolled, payload):
+    response = admin_client.post('/admin/enrollments/bulk', json=payload)
+    assert response.status_code == 400
+    assert len(_ids(db, Enrollment)) == 3
+
+
+def test_revoke_by_ids(admin_client, db, enrolled):
+    _, enrollments = enrolled
+    response = admin_client.post('/admin/enrollments/bulk', json={'enrollment_ids': [enrollments[1].id]})
+    assert response.get_json() == {'success': True, 'enrollments': 1, 'matched': 1, 'remaining': 0}
+    assert _ids(db, Enrollment) == [enrollments[0].id, enrollments[2].id]
+    # The purchase stays on record
+    assert len(_ids(db, Transaction)) == 3
+
+
+def test_revoke_by_course_and_date(admin_client, db, enrolled):
+    _, enrollments = enrolled
+    response = admin_client.post('/admin/enrollments/bulk', json={'course': 'Hiragana', 'enrolled_before': '2026-02-01'})
+    assert response.get_json()['enrollments'] == 2
+    assert _ids(db, Enrollment) == [enrollments[2].id]
+
+
+def test_revoke_form_with_bad_id_redirects(admin_client, db, enrolled):
+    response = admin_client.post('/admin/enrollments/bulk', data={'enrollment_ids': ['1x']})
+    assert response.status_code == 302
+    assert len(_ids(db, Enrollment)) == 3
+
+
+@pytest.mark.parametrize('payload', [
+    {'action': 'delete', 'user_ids': '23'},
+    {'action': 'delete', 'user_ids': 5},
+    {'action': 'delete', 'user_ids': [2, False]},
+    {'action': 'delete', 'created_after': 5},
+    {'action': 'delete', 'created_after': 'yesterday'},
+    {'action': 'set_role', 'role_code': ['ADMIN'], 'user_ids': [2]},
+    {'action': ['delete'], 'user_ids': [2]},
+])
+def test_bulk_users_rejects_malformed_requests(admin_client, db, enrolled, payload):
+    before = [(user.id, user.role_code) for user in db.query(User).order_by(User.id)]
+    response = admin_client.post('/admin/users/bulk', json=payload)
+    assert response.status_code == 400
+    db.expire_all()
+    assert [(user.id, user.role_code) for user in db.query(User).order_by(User.id)] == before
+
+
+def test_bulk_delete_users_by_ids_keeps_the_acting_admin(admin_client, db, enrolled):
+    users, _ = enrolled
+    admin = db.query(User).filter_by(username='admin').one()
+    response = admin_client.post('/admin/users/bulk', json={'action': 'delete', 'user_ids': [admin.id, users[0].id]})
+    report = response.get_json()
+    assert report['users'] == 1 and report['transactions'] == 1 and report['enrollments'] == 1
+    assert _ids(db, User) == sorted([admin.id, users[1].id, users[2].id])
+    assert len(_ids(db, Enrollment)) == 2
+
+
+def test_bulk_set_role_by_filter(admin_client, db, enrolled):
+    users, _ = enrolled
+    response = admin_client.post('/admin/users/bulk', json={
+        'action': 'set_role', 'role_code': 'ADMIN', 'filter_role': 'CUSTOMER', 'created_before': '2026-01-03'})
+    assert response.get_json()['users'] == 2
+    db.expire_all()
+    assert [db.get(User, user.id).role_code for user in users] == ['ADMIN', 'ADMIN', 'CUSTOMER']
+
+
+def test_bulk_users_form_with_bad_date_redirects(admin_client, db, enrolled):
+    response = admin_client.post('/admin/users/bulk', data={'action': 'delete', 'created_after': '2026-13-01'})
+    assert response.status_code == 302
+    assert len(_ids(db, User)) == 4
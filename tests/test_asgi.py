@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app import asgi, metrics
+from app.audio import sprite_path
+from app.executors import ExecutorBusy
+
+
+def _get(app, path, headers=()):
+    """
+    (status, headers, body) of a GET through the ASGI app
+    """
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+             'headers': [(name.lower().encode(), value.encode()) for name, value in headers]}
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    return (start['status'], {name.decode(): value.decode() for name, value in start['headers']},
+            b''.join(message.get('body', b'') for message in messages[1:]))
+
+
+@pytest.fixture
+def asgi_app(app):
+    return asgi.create_asgi_app(app)
+
+
+@pytest.fixture
+def sprite():
+    path = sprite_path('hiragana', 'abc123')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'ID3 sprite')
+    yield path
+    path.unlink()
+
+
+def test_audio_sprite_is_served_with_its_version_as_etag(asgi_app, sprite):
+    status, headers, body = _get(asgi_app, '/course/hiragana/audio/abc123.mp3', [('X-Request-ID', 'req-1')])
+    assert (status, body) == (200, b'ID3 sprite')
+    assert headers['etag'] == '"abc123"'
+    assert 'immutable' in headers['cache-control']
+    assert headers['x-request-id'] == 'req-1'
+
+
+def test_audio_sprite_answers_if_none_match(asgi_app, sprite):
+    status, headers, body = _get(asgi_app, '/course/hiragana/audio/abc123.mp3', [('If-None-Match', '"abc123"')])
+    assert (status, body) == (304, b'')
+
+
+def test_audio_sprite_missing(asgi_app):
+    status, _, _ = _get(asgi_app, '/course/hiragana/audio/missing1.mp3', [('If-None-Match', '"missing1"')])
+    assert status == 404
+
+
+def test_audio_sprite_busy_pool(asgi_app, sprite, monkeypatch):
+    async def busy(*args):
+        raise ExecutorBusy()
+
+    monkeypatch.setattr(asgi.io_executor, 'run_async', busy)
+    status, headers, _ = _get(asgi_app, '/course/hiragana/audio/abc123.mp3')
+    assert status == 503 and headers['retry-after'] == '1'
+
+
+def test_native_routes_are_counted(asgi_app, sprite):
+    key = ('http_requests_total', (('blueprint', 'course'), ('endpoint', 'course.audio_sprite'),
+                                   ('method', 'GET'), ('status', '200')))
+    before = metrics.registry.local_totals()[0].get(key, 0)
+    _get(asgi_app, '/course/hiragana/audio/abc123.mp3')
+    assert metrics.registry.local_totals()[0][key] == before + 1
@@ -0,0 +1,43 @@
+import pytest
+
+from app import assets
+
+
+@pytest.fixture
+def built(tmp_path, monkeypatch):
+    monkeypatch.setattr(assets.Config, 'ASSET_BUILD_DIR', str(tmp_path))
+    return tmp_path
+
+
+def _variants(directory, suffix):
+    return sorted(path.name for path in directory.rglob(f'*{suffix}'))
+
+
+def test_build_adds_brotli_variants_once_brotli_is_available(built, monkeypatch):
+    if assets.brotli is None:
+        pytest.skip('brotli is not installed')
+    brotli = assets.brotli
+    monkeypatch.setattr(assets, 'brotli', None)
+    assets.build_assets()
+    assert _variants(built, '.gz') and not _variants(built, '.br')
+
+    monkeypatch.setattr(assets, 'brotli', brotli)
+    assets.build_assets()
+    assert [name[:-3] for name in _variants(built, '.br')] == [name[:-3] for name in _variants(built, '.gz')]
+
+
+def test_build_replaces_a_damaged_copy(built):
+    files = assets.build_assets()
+    copy = built / next(iter(files.values()))
+    original = copy.read_bytes()
+    copy.write_bytes(b'truncated')
+    assets.build_assets()
+    assert copy.read_bytes() == original
+
+
+def test_assets_are_served_with_the_accepted_encoding(app, built):
+    files = assets.build_assets()
+    compressible = next(hashed for name, hashed in files.items() if name.endswith(('.css', '.js')))
+    response = app.test_client().get(f'/assets/{compressible}', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200 and response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
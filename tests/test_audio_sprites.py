@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from app import audio
+from app.database.models import Course
+from app.database.seed import seed_courses_and_characters
+
+# One silent MPEG-1 Layer III frame: 128 kbit/s at 44.1 kHz is 417 bytes
+_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+
+
+@pytest.fixture
+def audio_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio.Config, 'AUDIO_DIR', str(tmp_path))
+    monkeypatch.setattr(audio, '_manifest_cache', {})
+    return tmp_path
+
+
+def test_seed_retries_a_sprite_whose_build_failed(db, audio_files, monkeypatch):
+    def unreachable(text):
+        raise OSError('TTS service unreachable')
+
+    monkeypatch.setattr(audio, 'synthesize', unreachable)
+    seed_courses_and_characters(db)
+    assert audio.load_manifest('Hiragana') is None
+
+    # Nothing new to seed, but the missing sprite is built now that TTS works
+    monkeypatch.setattr(audio, 'synthesize', lambda text: _FRAME * 2)
+    seed_courses_and_characters(db)
+    manifest = audio.load_manifest('Hiragana')
+    assert manifest and manifest['segments']
+    assert audio.sprite_path('Hiragana', manifest['version']).exists()
+
+
+def test_up_to_date_sprite_is_reused_and_a_damaged_manifest_rebuilt(db, audio_files, monkeypatch):
+    monkeypatch.setattr(audio, 'synthesize', lambda text: _FRAME)
+    seed_courses_and_characters(db)
+    course = db.query(Course).filter_by(name='Hiragana').one()
+
+    manifest, rebuilt = audio.build_course_sprite(db, course)
+    assert not rebuilt
+
+    audio.manifest_path('Hiragana').write_text('{"course": ')
+    rebuilt_manifest, rebuilt = audio.build_course_sprite(db, course)
+    assert rebuilt and rebuilt_manifest['version'] == manifest['version']
+    assert json.loads(audio.manifest_path('Hiragana').read_text())['version'] == manifest['version']
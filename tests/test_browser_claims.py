@@ -0,0 +1,61 @@
+import pytest
+
+from app.database.models import Character, ClaimRejection, Progress
+from app.routes import hiragana
+
+
+class StubRecognizer:
+    # Server model that never sees the claimed character in the drawing
+    version = 'v1'
+    char_to_romaji = {'あ': 'a'}
+
+    def get_message(self, is_correct, confidence):
+        return 'ok' if is_correct else 'try again'
+
+    def predict(self, image, target_char=None):
+        return {'success': True, 'recognized_text': 'い', 'is_correct': False, 'top_predictions': []}
+
+
+@pytest.fixture
+def practice(app, db, make_user, make_course, monkeypatch):
+    course = make_course('Hiragana')
+    character = Character(kana='あ', romaji='a', course_id=course.id)
+    db.add(character)
+    db.commit()
+    learner = make_user('learner')
+
+    monkeypatch.setattr(hiragana.recognizers, 'get', lambda course_name: StubRecognizer())
+    monkeypatch.setattr(hiragana, 'load_web_bundle', lambda course_name: {'model_version': 'v1', 'version': 'b1'})
+    monkeypatch.setattr(hiragana.Config, 'CLIENT_VERIFY_SAMPLE_RATE', 0.5)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(learner.id)
+        session['current_character_id'] = character.id
+        session['current_course_id'] = course.id
+
+    def claim(draw):
+        monkeypatch.setattr(hiragana.random, 'random', lambda: draw)
+        return client.post('/hiragana/predict', json={
+            'image': 'data:image/png;base64,', 'client_result': {'recognized_text': 'あ', 'bundle_version': 'b1'}
+        }).get_json()
+
+    return learner, claim
+
+
+def test_unsampled_claim_is_trusted(db, practice):
+    learner, claim = practice
+    assert claim(0.9)['stage'] == 'browser'
+    assert db.query(Progress).filter_by(user_id=learner.id, learned=True).count() == 1
+
+
+def test_rejected_claim_makes_every_later_claim_checked(db, practice):
+    learner, claim = practice
+    first = claim(0.1)
+    assert first['verified'] and not first['is_correct']
+    assert db.get(ClaimRejection, learner.id) is not None
+
+    # Would have gone unchecked before the rejection
+    second = claim(0.9)
+    assert second['verified'] and not second['is_correct']
+    assert db.query(Progress).filter_by(user_id=learner.id).count() == 0
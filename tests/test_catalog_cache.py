@@ -0,0 +1,78 @@
+import time
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import cache, get_engine
+from app.cache import bump_catalog_version
+from app.config import Config
+from app.database.models import Pricing
+
+
+@pytest.fixture
+def catalog(make_course, monkeypatch):
+    monkeypatch.setattr(Config, 'CATALOG_CACHE_TTL', 0.05)
+    # Every test starts by reading the version from its fresh database
+    monkeypatch.setitem(cache._catalog, 'expires_at', 0.0)
+    return make_course('Hiragana', price=1000)
+
+
+def _client_for(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    return client
+
+
+def test_index_answers_if_none_match(app, db, catalog):
+    client = app.test_client()
+    first = client.get('/')
+    assert first.status_code == 200 and first.headers['ETag']
+    again = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_price_change_by_another_worker_is_picked_up(app, db, catalog):
+    client = app.test_client()
+    first = client.get('/')
+    assert b'Price: 1000$' in first.data
+
+    # As another worker would commit it: no invalidate_catalog() in this process
+    with Session(get_engine()) as other:
+        other.query(Pricing).update({Pricing.price: 1500})
+        bump_catalog_version(other)
+        other.commit()
+    time.sleep(0.1)
+
+    second = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert b'Price: 1500$' in second.data and second.headers['ETag'] != first.headers['ETag']
+
+
+def test_admin_price_edit_shows_at_once(app, db, catalog, admin_client, monkeypatch):
+    monkeypatch.setattr(Config, 'CATALOG_CACHE_TTL', 3600)
+    assert b'Price: 1000$' in admin_client.get('/').data
+    admin_client.post(f'/admin/pricing/{catalog.id}/edit', data={'price': '1200'})
+    assert b'Price: 1200$' in admin_client.get('/').data
+
+
+def test_course_list_keeps_enrollments_in_the_session(app, db, catalog, make_user, make_enrollment, admin_client):
+    learner = make_user('learner')
+    enrollment = make_enrollment(learner, catalog)
+    client = _client_for(app, learner)
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(get_engine(), 'before_cursor_execute', listener)
+    try:
+        assert b'btn-danger">Learn' in client.get('/dashboard/courses').data
+        statements.clear()
+        client.get('/dashboard/courses')
+        assert not [s for s in statements if 'FROM enrollments' in s]
+    finally:
+        event.remove(get_engine(), 'before_cursor_execute', listener)
+
+    # A revocation bumps the catalog version, which reloads the learner's enrollments
+    admin_client.post('/admin/enrollments/bulk', json={'enrollment_ids': [enrollment.id]})
+    assert b'btn-danger">Learn' not in client.get('/dashboard/courses').data
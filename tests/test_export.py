@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from app.config import Config
+from app.database.models import Character, Progress
+
+
+def _csv(response):
+    return list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+
+def _enroll(make_user, make_course, make_enrollment):
+    hiragana, katakana = make_course('Hiragana'), make_course('Katakana')
+    alice, bob = make_user('alice'), make_user('bob')
+    make_enrollment(alice, hiragana, created_at=datetime(2026, 3, 1, 9))
+    make_enrollment(bob, hiragana, created_at=datetime(2026, 3, 2, 23, 59))
+    make_enrollment(bob, katakana, created_at=datetime(2026, 3, 3, 0, 1))
+    return hiragana, katakana
+
+
+def test_transactions_filter_by_course_and_inclusive_dates(admin_client, make_user, make_course, make_enrollment):
+    _enroll(make_user, make_course, make_enrollment)
+
+    rows = _csv(admin_client.get('/admin/export/transactions.csv?course=Hiragana&start=2026-03-02&end=2026-03-02'))
+    assert [(row['username'], row['course']) for row in rows] == [('bob', 'Hiragana')]
+    assert rows[0]['card_number'] == '****4242'
+
+    rows = _csv(admin_client.get('/admin/export/transactions.csv?start=2026-03-02'))
+    assert [row['course'] for row in rows] == ['Hiragana', 'Katakana']
+
+
+def test_enrollments_stream_every_batch_as_ndjson(admin_client, make_user, make_course, make_enrollment, monkeypatch):
+    monkeypatch.setattr(Config, 'EXPORT_BATCH_SIZE', 2)
+    _enroll(make_user, make_course, make_enrollment)
+
+    response = admin_client.get('/admin/export/enrollments.ndjson?end=2026-03-03')
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert response.mimetype == 'application/x-ndjson'
+    assert [(record['username'], record['course']) for record in records] == [
+        ('alice', 'Hiragana'), ('bob', 'Hiragana'), ('bob', 'Katakana')]
+    assert records[0]['enrolled_at'] == '2026-03-01T09:00:00'
+
+
+def test_progress_filters_on_last_update(db, admin_client, make_user, make_course):
+    course = make_course('Hiragana')
+    user = make_user('alice')
+    characters = [Character(kana=kana, romaji=romaji, course_id=course.id) for kana, romaji in [('あ', 'a'), ('い', 'i')]]
+    db.add_all(characters)
+    db.flush()
+    for character, updated_at in zip(characters, [datetime(2026, 3, 1), datetime(2026, 4, 1)]):
+        db.add(Progress(user_id=user.id, course_id=course.id, character_id=character.id, learned=True,
+                        created_at=datetime(2026, 3, 1), updated_at=updated_at))
+    db.commit()
+
+    rows = _csv(admin_client.get('/admin/export/progress.csv?start=2026-03-15&course=Hiragana'))
+    assert [row['kana'] for row in rows] == ['い']
+
+
+def test_empty_export_is_header_only(admin_client):
+    response = admin_client.get('/admin/export/transactions.csv?course=Kanji')
+    assert response.get_data(as_text=True).splitlines() == [
+        'transaction_id,user_id,username,course,price,card_number,created_at']
+
+
+def test_rejects_unknown_exports_and_bad_dates(admin_client):
+    assert admin_client.get('/admin/export/users.csv').status_code == 404
+    assert admin_client.get('/admin/export/transactions.xml').status_code == 404
+    assert admin_client.get('/admin/export/transactions.csv?start=03/01/2026').status_code == 400
@@ -0,0 +1,33 @@
+import pytest
+
+from app.database.models import Character, Progress
+
+
+@pytest.fixture
+def drawing_page(app, db, make_user, make_course, make_enrollment):
+    course = make_course('Hiragana')
+    character = Character(kana='あ', romaji='a', course_id=course.id)
+    db.add(character)
+    db.flush()
+    learner = make_user('learner')
+    db.add(Progress(user_id=learner.id, course_id=course.id, character_id=character.id, learned=True))
+    db.commit()
+    make_enrollment(learner, course)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(learner.id)
+    return lambda: client.get('/course/Hiragana/draw').get_data(as_text=True)
+
+
+def test_no_stream_token_without_the_asgi_routes(app, drawing_page, monkeypatch):
+    monkeypatch.setitem(app.config, 'LIVE_RECOGNITION_SERVED', False)
+    assert 'const liveToken = null;' in drawing_page()
+
+
+def test_stream_token_under_the_asgi_app(app, drawing_page, monkeypatch):
+    from app.asgi import create_asgi_app
+
+    monkeypatch.setitem(app.config, 'LIVE_RECOGNITION_SERVED', False)
+    create_asgi_app(app)
+    assert 'const liveToken = null;' not in drawing_page()
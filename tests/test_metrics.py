@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import threading
+
+from app.metrics import MetricsRegistry, SharedDirectory, _dump
+
+
+def _registry():
+    registry = MetricsRegistry()
+    registry.counter('jobs_total', 'Jobs.')
+    registry.histogram('job_seconds', 'Job latency.', (0.1, 1.0))
+    return registry
+
+
+def _exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_finished_threads_are_folded_into_the_totals():
+    registry = _registry()
+    threads = [threading.Thread(target=registry.inc, args=('jobs_total', (('kind', 'a'),))) for _ in range(50)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    registry.observe('job_seconds', 0.5)
+
+    counters, histograms = registry.local_totals()
+    assert counters[('jobs_total', (('kind', 'a'),))] == 50
+    assert histograms[('job_seconds', ())] == [[0, 1, 0], 0.5, 1]
+    # Only this thread's shard is still live
+    assert len(registry._shards) == 1
+    assert 'jobs_total{kind="a"} 50' in registry.render()
+
+
+def test_shared_directory_sums_processes_and_keeps_exited_ones(tmp_path):
+    registry = _registry()
+    registry.shared = SharedDirectory(str(tmp_path), interval=3600)
+    registry.inc('jobs_total', (('kind', 'a'),), 2)
+    # Another live worker (this process under another token) and one that has exited
+    _dump(str(tmp_path / f'{os.getpid()}-other.json'), {('jobs_total', (('kind', 'a'),)): 3}, {})
+    dead = tmp_path / f'{_exited_pid()}-gone.json'
+    _dump(str(dead), {('jobs_total', (('kind', 'a'),)): 5}, {('job_seconds', ()): [[1, 0, 0], 0.05, 1]})
+
+    first = registry.render()
+    assert 'jobs_total{kind="a"} 10' in first
+    assert 'job_seconds_count 1' in first
+    assert not dead.exists() and (tmp_path / 'retired.json').exists()
+    # Folding changed nothing in the totals
+    assert registry.render() == first
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Creates the app the way a server master would, forks, and predicts in the child. Run in a fresh
+# interpreter, since a model loaded by another test would itself make the fork unsafe.
+FORK_THEN_PREDICT = textwrap.dedent('''
+    import faulthandler, os, sys
+    from app import create_app
+    from app.model.registry import recognizers
+    from app.model.synthetic import synthetic_drawing
+
+    create_app()
+    if recognizers.resident_bytes():
+        sys.exit('a recognizer was loaded before the fork')
+    pid = os.fork()
+    if pid == 0:
+        faulthandler.dump_traceback_later(60, exit=True)
+        result = recognizers.get('Hiragana').predict(synthetic_drawing(0))
+        os._exit(0 if result['top_predictions'] else 1)
+    _, status = os.waitpid(pid, 0)
+    sys.exit(os.waitstatus_to_exitcode(status))
+''')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_predicts_after_fork():
+    completed = subprocess.run([sys.executable, '-c', FORK_THEN_PREDICT], cwd=ROOT, env=os.environ.copy(),
+                               capture_output=True, text=True, timeout=180)
+    assert completed.returncode == 0, completed.stderr[-2000:]
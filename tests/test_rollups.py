@@ -0,0 +1,81 @@
+from datetime import date, datetime
+
+import pytest
+
+from app.database.models import CourseDailyRollup, UserDailyRollup
+from app.database.rollups import backfill_rollups
+
+
+def _rollups(db):
+    db.expire_all()
+    courses = {(row.day, row.course_id): (row.revenue, row.enrollments) for row in db.query(CourseDailyRollup)}
+    users = {row.day: row.new_users for row in db.query(UserDailyRollup)}
+    # Rows counted down to zero say the same as missing rows
+    return ({key: value for key, value in courses.items() if value != (0, 0)},
+            {key: value for key, value in users.items() if value})
+
+
+@pytest.fixture
+def sales(db, make_user, make_course, make_enrollment):
+    from app.database.rollups import record_signups
+
+    hiragana, kanji = make_course('Hiragana', 1000), make_course('Kanji', 2000)
+    users = []
+    for n, signup in enumerate([datetime(2026, 1, 1), datetime(2026, 1, 1), datetime(2026, 1, 2)]):
+        users.append(make_user(f'user{n}', created_at=signup))
+        record_signups(db, day=signup.date())
+    db.commit()
+    enrollments = [
+        make_enrollment(users[0], hiragana, 1000, datetime(2026, 1, 5)),
+        make_enrollment(users[0], kanji, 2000, datetime(2026, 1, 6)),
+        make_enrollment(users[1], hiragana, 1000, datetime(2026, 1, 5)),
+        make_enrollment(users[2], kanji, 2000, datetime(2026, 1, 6)),
+    ]
+    return users, (hiragana, kanji), enrollments
+
+
+def test_purchases_add_up_per_day_and_course(db, sales):
+    _, (hiragana, kanji), _ = sales
+    courses, users = _rollups(db)
+    assert courses == {(date(2026, 1, 5), hiragana.id): (2000, 2), (date(2026, 1, 6), kanji.id): (4000, 2)}
+    assert users == {date(2026, 1, 1): 2, date(2026, 1, 2): 1}
+
+
+def test_revocation_keeps_the_purchase(db, admin_client, sales):
+    _, _, enrollments = sales
+    before = _rollups(db)
+    admin_client.post('/admin/enrollments/bulk', json={'enrollment_ids': [enrollments[0].id]})
+    assert _rollups(db) == before
+
+
+def test_deleting_users_subtracts_them_where_they_were_counted(db, admin_client, sales):
+    users, (hiragana, kanji), _ = sales
+    admin_client.post('/admin/users/bulk', json={'action': 'delete', 'user_ids': [users[0].id]})
+    admin_client.post(f'/admin/users/{users[2].id}/delete')
+
+    courses, signups = _rollups(db)
+    assert courses == {(date(2026, 1, 5), hiragana.id): (1000, 1)}
+    # The acting admin signed up today
+    signups.pop(datetime.utcnow().date(), None)
+    assert signups == {date(2026, 1, 1): 1}
+
+
+def test_incremental_rollups_match_a_backfill(db, admin_client, sales):
+    users, _, enrollments = sales
+    admin_client.post('/admin/enrollments/bulk', json={'enrollment_ids': [enrollments[3].id]})
+    admin_client.post('/admin/users/bulk', json={'action': 'delete', 'user_ids': [users[1].id]})
+    # The admin fixture bypassed record_signups; count it like the sign-up route would
+    from app.database.rollups import record_signups
+    record_signups(db)
+    db.commit()
+
+    incremental = _rollups(db)
+    backfill_rollups(db)
+    assert _rollups(db) == incremental
+
+
+def test_dashboard_labels_purchases(db, admin_client, sales):
+    page = admin_client.get('/admin/').get_data(as_text=True)
+    assert 'Purchases</h5>' in page and '<h2>4</h2>' in page
+    revenue = admin_client.get('/admin/revenue?days=366').get_data(as_text=True)
+    assert '<th>Purchases</th>' in revenue
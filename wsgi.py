@@ -0,0 +1,9 @@
+from app.model.runtime import configure_runtime
+
+# TensorFlow and OpenCV thread pools must be sized before the first recognizer is loaded
+configure_runtime()
+
+from app import create_app
+
+# WSGI entry point: gunicorn -c gunicorn.conf.py
+app = create_app()